@@ -15,7 +15,8 @@ from time import sleep
 
 from common.logs import LOG
 from common.common import CPARAMS, URLS
-from common.CIMI import CIMIcalls as CIMI, AgentResource
+from common.CIMI import CIMIcalls as CIMI, AgentResource, CIMI_READINESS
+from agentstart.taskgraph import TaskGraph
 
 __status__ = 'Production'
 __maintainer__ = 'Alejandro Jurnet'
@@ -27,7 +28,7 @@ class AgentStart:
     TAG = '\033[36m' + '[FCJP]: ' + '\033[0m'
     ETAG = '\033[31m' + '[FCJP] ERROR: ' + '\033[0m'
     MAX_MISSING_SCANS = 10      # TODO: ENV Policies Param
-    WAIT_TIME_CIMI = 2.
+    WAIT_TIME_CIMI = .5     # Max time to detect the stop while CIMI is not ready
     ALE_ENABLED = False
 
     def __init__(self, addr_dis=None, addr_id=None, addr_cat=None, addr_pol=None, addr_CAUcl=None, addr_dcly=None):
@@ -62,6 +63,9 @@ class AgentStart:
         self.cauclient_failed = None
         self.policies_failed = None
 
+        self._switchToLeader = False
+        self.startupReport = None   # TaskGraph report of the last startup
+
         self.URL_DISCOVERY = URLS.build_url_address(URLS.URL_DISCOVERY, portaddr=addr_dis)
         if CPARAMS.WIFI_DEV_FLAG != '':
             self.URL_DISCOVERY += '{}'.format(CPARAMS.WIFI_DEV_FLAG)
@@ -123,118 +127,41 @@ class AgentStart:
         while self._connected:
             # 0. Init
             self.detectedLeaderID, self.MACaddr = None, None
-
-            # 0.1 Check CIMI is UP
-            CIMIon = False
-            while self._connected and not CIMIon:
-                CIMIon = CIMI.checkCIMIstarted()
-                if not CIMIon:
-                    LOG.debug(self.TAG + 'CIMI is not ready... Retry in {}s'.format(self.WAIT_TIME_CIMI))
-                    sleep(self.WAIT_TIME_CIMI)
-            LOG.info(self.TAG + 'CIMI is ready!')
-
-            # 1. Identification
-            if self._connected:
-                self.identification_failed = True   # Reset variable to avoid false positives
-                LOG.debug(self.TAG + 'Sending trigger to Identification...')
-                try:
-                    self.__trigger_requestID()
-                    self.identification_failed = False
-                except Exception:
-                    LOG.exception(self.TAG + 'Identification trigger failed!')
-                    self.identification_failed = True
-                LOG.info(self.TAG + 'Identification Trigger Done.')
-            else:
-                return
-            if not CPARAMS.DEBUG_FLAG and self.identification_failed:
-                LOG.critical(self.TAG + 'Identification failed, interrupting agent start.')
-                return
-
-            # 2. Check if im a Leader - PLE
-            if self.imLeader:
-                # switch to leader
-                self.__leader_switch_flow()  # TODO: imCapable?
-                return
-
-            # remain as agent
-            # 3. Scan for Leaders
-            count = 0
-            self.discovery_failed = True
-            while self._connected and count < self.MAX_MISSING_SCANS and self.detectedLeaderID is None and self.MACaddr is None:    # TODO: new protocol required
-                LOG.debug(self.TAG + 'Sending scan trigger to Discovery...')
-                try:
-                    self.__trigger_startScan()
-                    self.discovery_failed = False
-                except Exception:
-                    LOG.debug(self.TAG + 'Discovery failed on attepmt {}.'.format(count))
-                    self.discovery_failed = True
-
-                if self.detectedLeaderID is not None and self.MACaddr is not None:
-                    LOG.info(self.TAG + 'Discovery Scan Trigger Done.')
-                count += 1
-            LOG.info(self.TAG + 'Discovery trigger finished in #{} attempts and ok={}'.format(count,
-                                                                                          self.detectedLeaderID is not None and self.MACaddr is not None))
+            self._switchToLeader = False
+
+            # 0.1 Check CIMI is UP, 1. Identification (2. Leader: only if both are done)
+            # 3. Scan for Leaders, 5. CAU client, 5. Categorization, 6. Area Resilience
+            # Nothing starts before CIMI is ready and Area Resilience only starts if the CAU client and the
+            # categorization succeed (as in the sequential start)
+            graph = TaskGraph('fcjp')
+            graph.add('cimi', self.__task_cimi)
+            graph.add('identification', self.__task_identification, depends=('cimi',))
+            if not self.imLeader:
+                graph.add('discovery', self.__task_discovery, depends=('cimi',))
+                graph.add('cau_client', self.__task_cauclient, depends=('identification', 'discovery'))
+                graph.add('categorization', self.__task_categorization, depends=('cimi', 'identification', 'discovery'))
+                graph.add('policies', self.__task_policies, depends=('cau_client', 'categorization'))
+            ok = graph.run(connected=lambda: self._connected)
+            self.startupReport = graph.report()
+            LOG.info(self.TAG + 'Startup tasks finished (ok={}) in {}s. Critical path: {}'.format(
+                ok, self.startupReport['timeToReady'], ' -> '.join(self.startupReport['criticalPath'])))
             if not self._connected:
                 return
-            if not CPARAMS.DEBUG_FLAG and self.discovery_failed:
-                LOG.critical(self.TAG + 'Discovery failed, interrupting agent start.')
+            if any(graph.status(name) != TaskGraph.DONE for name in ('cimi', 'identification')):
+                # CIMI not ready or critical failure of the identification (interrupting agent start)
                 return
-
-            # 4. If no leader detected, switch to leader IF policy and capable - ALE
-            if not self.discovery_failed and self.detectedLeaderID is None and self.MACaddr is None and self.ALE_ENABLED:
+            if self._switchToLeader:
+                # 4. No leader detected, switch to leader (policy) - ALE
                 self.__leader_switch_flow()     # TODO: imCapable?
                 return
-
-            # 5. CAU client
-            if self._connected:
-                self.cauclient_failed = True
-                LOG.debug(self.TAG + 'Sending trigger to CAU client...')
-                try:
-                    self.__trigger_triggerCAUclient()
-                    self.cauclient_failed = False
-                except Exception:
-                    LOG.exception(self.TAG + 'CAUclient failed.')
-                    self.cauclient_failed = True
-                LOG.info(self.TAG + 'CAU client Trigger Done.')
-            else:
-                return
-            if not CPARAMS.DEBUG_FLAG and self.cauclient_failed:
-                LOG.critical(self.TAG + 'CAU-Client failed, interrupting agent start.')
-                return
-
-            # 5. Categorization
-            if self._connected and not self.categorization_started:
-                self.categorization_failed = True
-                LOG.debug(self.TAG + 'Sending start trigger to Categorization...')
-                try:
-                    self.__trigger_startCategorization()
-                    self.categorization_failed = False
-                    self.categorization_started = True
-                except Exception:
-                    LOG.exception(self.TAG + 'Categorization failed')
-                    self.categorization_failed = True
-                LOG.info(self.TAG + 'Categorization Start Trigger Done.')
-            elif not self._connected:
-                return
-            if not CPARAMS.DEBUG_FLAG and self.categorization_failed:
-                LOG.critical(self.TAG + 'Categorization failed, interrupting agent start.')
+            if not ok:
+                # Critical failure (interrupting agent start)
                 return
 
-            # 6. Area Resilience
-            if self._connected and not self.arearesilience_started:
-                self.policies_failed = True
-                LOG.debug(self.TAG + 'Sending start trigger to Policies...')
-                try:
-                    success = self.__trigger_startLeaderProtectionPolicies()
-                    self.policies_failed = not success
-                    self.arearesilience_started = success
-                except Exception:
-                    LOG.exception(self.TAG + 'Policies Area Resilience failed!')
-                LOG.info(self.TAG + 'Policies Area Resilience Start Trigger Done.')
-            elif not self._connected:
-                return
-            if not CPARAMS.DEBUG_FLAG and self.policies_failed:
-                LOG.critical(self.TAG + 'Policies Area Resilience failed, interrupting agent start.')
+            # 2. Check if im a Leader - PLE
+            if self.imLeader:
+                # switch to leader
+                self.__leader_switch_flow()  # TODO: imCapable?
                 return
 
             # Print summary
@@ -285,6 +212,108 @@ class AgentStart:
                 LOG.debug(self.TAG + 'No rescan available. Stoping activity')
                 return
 
+    # Startup tasks: return False to interrupt the agent start (failure without DEBUG_FLAG)
+    def __task_cimi(self):
+        CIMIon = False
+        while self._connected and not CIMIon:
+            CIMIon = CIMI_READINESS.wait(self.WAIT_TIME_CIMI)
+            if not CIMIon:
+                LOG.debug(self.TAG + 'CIMI is not ready... Waiting')
+        if CIMIon:
+            LOG.info(self.TAG + 'CIMI is ready!')
+        return CIMIon
+
+    def __task_identification(self):
+        self.identification_failed = True   # Reset variable to avoid false positives
+        LOG.debug(self.TAG + 'Sending trigger to Identification...')
+        try:
+            self.__trigger_requestID()
+            self.identification_failed = False
+        except Exception:
+            LOG.exception(self.TAG + 'Identification trigger failed!')
+            self.identification_failed = True
+        LOG.info(self.TAG + 'Identification Trigger Done.')
+        if not CPARAMS.DEBUG_FLAG and self.identification_failed:
+            LOG.critical(self.TAG + 'Identification failed, interrupting agent start.')
+            return False
+        return True
+
+    def __task_discovery(self):
+        count = 0
+        self.discovery_failed = True
+        while self._connected and count < self.MAX_MISSING_SCANS and self.detectedLeaderID is None and self.MACaddr is None:    # TODO: new protocol required
+            LOG.debug(self.TAG + 'Sending scan trigger to Discovery...')
+            try:
+                self.__trigger_startScan()
+                self.discovery_failed = False
+            except Exception:
+                LOG.debug(self.TAG + 'Discovery failed on attepmt {}.'.format(count))
+                self.discovery_failed = True
+
+            if self.detectedLeaderID is not None and self.MACaddr is not None:
+                LOG.info(self.TAG + 'Discovery Scan Trigger Done.')
+            count += 1
+        LOG.info(self.TAG + 'Discovery trigger finished in #{} attempts and ok={}'.format(count,
+                                                                                      self.detectedLeaderID is not None and self.MACaddr is not None))
+        if not self._connected:
+            return False
+        if not CPARAMS.DEBUG_FLAG and self.discovery_failed:
+            LOG.critical(self.TAG + 'Discovery failed, interrupting agent start.')
+            return False
+        if not self.discovery_failed and self.detectedLeaderID is None and self.MACaddr is None and self.ALE_ENABLED:
+            # No leader detected: the agent start is interrupted to switch to leader
+            self._switchToLeader = True
+            return False
+        return True
+
+    def __task_cauclient(self):
+        self.cauclient_failed = True
+        LOG.debug(self.TAG + 'Sending trigger to CAU client...')
+        try:
+            self.__trigger_triggerCAUclient()
+            self.cauclient_failed = False
+        except Exception:
+            LOG.exception(self.TAG + 'CAUclient failed.')
+            self.cauclient_failed = True
+        LOG.info(self.TAG + 'CAU client Trigger Done.')
+        if not CPARAMS.DEBUG_FLAG and self.cauclient_failed:
+            LOG.critical(self.TAG + 'CAU-Client failed, interrupting agent start.')
+            return False
+        return True
+
+    def __task_categorization(self):
+        if not self.categorization_started:
+            self.categorization_failed = True
+            LOG.debug(self.TAG + 'Sending start trigger to Categorization...')
+            try:
+                self.__trigger_startCategorization()
+                self.categorization_failed = False
+                self.categorization_started = True
+            except Exception:
+                LOG.exception(self.TAG + 'Categorization failed')
+                self.categorization_failed = True
+            LOG.info(self.TAG + 'Categorization Start Trigger Done.')
+        if not CPARAMS.DEBUG_FLAG and self.categorization_failed:
+            LOG.critical(self.TAG + 'Categorization failed, interrupting agent start.')
+            return False
+        return True
+
+    def __task_policies(self):
+        if not self.arearesilience_started:
+            self.policies_failed = True
+            LOG.debug(self.TAG + 'Sending start trigger to Policies...')
+            try:
+                success = self.__trigger_startLeaderProtectionPolicies()
+                self.policies_failed = not success
+                self.arearesilience_started = success
+            except Exception:
+                LOG.exception(self.TAG + 'Policies Area Resilience failed!')
+            LOG.info(self.TAG + 'Policies Area Resilience Start Trigger Done.')
+        if not CPARAMS.DEBUG_FLAG and self.policies_failed:
+            LOG.critical(self.TAG + 'Policies Area Resilience failed, interrupting agent start.')
+            return False
+        return True
+
     def __leader_switch_flow(self):
         """
         Agent become leader
@@ -394,7 +423,8 @@ class AgentStart:
             'discovery_switched': self.discovery_switched,
             # 'dataclay_started': self.dataclay_started,
             'isLeader': self.imLeader,
-            'leaderIP': self.leaderIP
+            'leaderIP': self.leaderIP,
+            'timeToReady': self.startupReport.get('timeToReady') if self.startupReport is not None else None
         }
         return data
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Agent Start - Task graph
+
+    Each task is started (in its own thread) as soon as all its dependencies succeed.
+    A task fails if it returns False or raises: the tasks that were not started yet are cancelled.
+"""
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TaskGraph:
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    CANCELLED = 'CANCELLED'
+
+    def __init__(self, name='graph'):
+        self.name = name
+        self._tasks = OrderedDict()     # name -> (target, dependencies)
+        self._status = {}
+        self._start = {}
+        self._end = {}
+        self._cond = threading.Condition()
+        self._t0 = None
+
+    def add(self, name, target, depends=()):
+        """
+        :param name: Task name
+        :param target: Callable without arguments, returns False if the task failed
+        :param depends: Names of the tasks that must succeed before this one
+        """
+        for dependency in depends:
+            if dependency not in self._tasks:
+                raise ValueError('Unknown dependency {} of task {}'.format(dependency, name))
+        self._tasks[name] = (target, tuple(depends))
+        self._status[name] = self.PENDING
+
+    def __run_task(self, name):
+        target, _ = self._tasks[name]
+        try:
+            ok = target() is not False
+        except Exception:
+            LOG.exception('Task {} of {} failed'.format(name, self.name))
+            ok = False
+        with self._cond:
+            self._end[name] = monotonic()
+            self._status[name] = self.DONE if ok else self.FAILED
+            self._cond.notify_all()
+
+    def run(self, connected=lambda: True):
+        """
+        Run the graph until all the tasks finish or one of them fails
+        :param connected: Callable, no more tasks are started if it returns False
+        :return: True if all the tasks succeeded, False otherwise
+        """
+        self._t0 = monotonic()
+        threads = []
+        with self._cond:
+            while True:
+                aborted = not connected() or self.FAILED in self._status.values()
+                if not aborted:
+                    for name, (target, depends) in self._tasks.items():
+                        if self._status[name] == self.PENDING and all(self._status[dep] == self.DONE for dep in depends):
+                            self._status[name] = self.RUNNING
+                            self._start[name] = monotonic()
+                            thread = threading.Thread(name='{}_{}'.format(self.name, name), target=self.__run_task,
+                                                      args=(name,), daemon=True)
+                            threads.append(thread)
+                            thread.start()
+                running = self.RUNNING in self._status.values()
+                if not running:
+                    break
+                self._cond.wait()
+            for name, status in self._status.items():
+                if status == self.PENDING:
+                    self._status[name] = self.CANCELLED
+        for thread in threads:
+            thread.join()
+        return all(status == self.DONE for status in self._status.values())
+
+    def status(self, name):
+        return self._status.get(name)
+
+    def report(self):
+        """
+        :return: dicc {'timeToReady', 'criticalPath', 'tasks'}, times in seconds since the start of the graph.
+                 The critical path is the chain of dependencies that finished last.
+        """
+        with self._cond:
+            tasks = OrderedDict((name, {
+                'status': self._status[name],
+                'start': self._start[name] - self._t0 if name in self._start else None,
+                'end': self._end[name] - self._t0 if name in self._end else None
+            }) for name in self._tasks)
+        finished = [name for name in tasks if tasks[name]['end'] is not None]
+        path = []
+        name = max(finished, key=lambda task: tasks[task]['end'], default=None)
+        while name is not None:
+            path.append(name)
+            name = max([dep for dep in self._tasks[name][1] if tasks[dep]['end'] is not None],
+                       key=lambda task: tasks[task]['end'], default=None)
+        path.reverse()
+        return {
+            'timeToReady': tasks[path[-1]]['end'] if path else None,
+            'criticalPath': path,
+            'tasks': tasks
+        }
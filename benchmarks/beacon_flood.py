@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Beacon flood: thousands of scanning agents simulated from one machine against a running Leader
+
+    The beacons of the Leader are received on LDISCOVERY_PORT and each one is answered by all the simulated agents
+    with a /ld/beaconReply (fake agent IP in X-Real-IP), spread over the jitter (or the reply window advertised
+    in the beacon). Accepted replies/s, reply latency (p50/p99) and the time until all the agents are in the
+    topology of the Leader are written in JSON.
+
+    Usage: python3 -m benchmarks.beacon_flood [--agents 1000] [--concurrency 64] [--jitter 0.5] [--beacons 3]
+                                              [--leader 192.168.1.10] [--output flood.json]
+"""
+
+import argparse
+import logging
+import random
+import socket
+import threading
+import requests
+from json import dumps, loads, JSONDecodeError
+from requests.adapters import HTTPAdapter
+from time import monotonic
+
+from common.common import CPARAMS, URLS
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def agents(n_agents, prefix, seed=None):
+    """
+    :return: List of (payload, fake agent IP)
+    """
+    rnd = random.Random(seed)
+    return [({'deviceID': '{}/{}'.format(prefix, i), 'deviceIP': '', 'cpu_cores': rnd.randint(1, 16),
+              'mem_avail': rnd.uniform(.5, 32.), 'stg_avail': rnd.uniform(1., 500.)},
+             '172.{}.{}.{}'.format(16 + i // 65536 % 16, i // 256 % 256, i % 256)) for i in range(n_agents)]
+
+
+def wait_beacon(sock, timeout):
+    """
+    :return: (leaderIP, beacon dicc) or (None, None) on timeout
+    """
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        sock.settimeout(max(.01, deadline - monotonic()))
+        try:
+            data, addr = sock.recvfrom(4096)
+        except socket.timeout:
+            break
+        try:
+            return addr[0], loads(data.decode())
+        except (JSONDecodeError, UnicodeDecodeError):
+            LOG.warning('Beacon payload malformed')
+    return None, None
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100. * (len(values) - 1))))]
+
+
+def flood(leaderIP, port, replies, concurrency, spread, timeout):
+    """
+    Send one beacon reply per agent, each one at a random instant of the spread
+    :param replies: List of (payload, fake agent IP)
+    :param spread: Seconds over which the replies are spread (0: all at once)
+    :return: (list of (status code or None, latency), seconds between the first and the last reply)
+    """
+    url = URLS.build_url_address(URLS.URL_BEACONREPLY, portaddr=(leaderIP, port))
+    start = monotonic()
+    # Latest first (pop() gets the next reply due)
+    schedule = sorted(((start + random.uniform(.0, spread), payload, agentIP) for payload, agentIP in replies),
+                      key=lambda item: item[0], reverse=True)
+    lock = threading.Lock()
+    results = []
+    stop = threading.Event()
+
+    def sender():
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+        while True:
+            with lock:
+                if not schedule:
+                    break
+                due, payload, agentIP = schedule.pop()
+            if stop.wait(max(.0, due - monotonic())):
+                break
+            sent = monotonic()
+            try:
+                status = session.post(url, json=payload, headers={'X-Real-IP': agentIP}, timeout=timeout).status_code
+            except requests.RequestException:
+                status = None
+            with lock:
+                results.append((status, monotonic() - sent))
+        session.close()
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, monotonic() - start
+
+
+def convergence(leaderIP, port, deviceIDs, start, timeout, poll=.1):
+    """
+    Wait until all the agents are in the topology of the Leader (delta queries on /ld/topology)
+    :param start: time.monotonic() reference
+    :return: Seconds since start or None on timeout
+    """
+    url = URLS.build_url_address(URLS.URL_LDISCOVERY_TOPOLOGY, portaddr=(leaderIP, port))
+    missing = set(deviceIDs)
+    known = set()
+    since = 0   # Delta query from the first request (without since the legacy whole topology is returned)
+    cursor = None
+    while monotonic() - start < timeout:
+        try:
+            params = {'since': since} if cursor is None else {'since': since, 'cursor': cursor}
+            delta = requests.get(url, params=params, timeout=2).json()
+            if not all(key in delta for key in ('version', 'reset', 'devices', 'removed')):
+                LOG.error('Topology of the Leader without delta queries: {}'.format(sorted(delta)))
+                return None
+            if delta['reset'] and cursor is None:
+                known.clear()
+            known.update(device['deviceID'] for device in delta['devices'])
+            known.difference_update(delta['removed'])
+            cursor = delta.get('cursor')
+            if cursor is not None:
+                continue    # Next page of the same changes
+            since = delta['version']
+            if missing.issubset(known):
+                return monotonic() - start
+        except (requests.RequestException, ValueError, AttributeError, TypeError):
+            LOG.debug('Topology of the Leader not available')
+            cursor = None
+        threading.Event().wait(poll)
+    return None
+
+
+def run_wave(leaderIP, beacon, replies, args, join=False):
+    """
+    :param join: The agents are not in the topology yet (convergence time measured while the replies are sent)
+    """
+    spread = args.jitter if args.jitter is not None else float(beacon.get('replyWindow', .0))
+    start = monotonic()
+    converged = [None]
+    th_convergence = threading.Thread(daemon=True, target=lambda: converged.__setitem__(0, convergence(
+        leaderIP, args.port, [payload['deviceID'] for payload, _ in replies], start, args.convergence_timeout)))
+    if join:
+        th_convergence.start()
+    results, duration = flood(leaderIP, args.port, replies, args.concurrency, spread, args.timeout)
+    if join:
+        th_convergence.join()
+    accepted = [latency for status, latency in results if status == 200]
+    return {
+        'agents': len(replies),
+        'concurrency': args.concurrency,
+        'spread': spread,
+        'sent': len(results),
+        'accepted': len(accepted),
+        'errors': len(results) - len(accepted),
+        'duration': duration,
+        'acceptedPerSecond': len(accepted) / duration if duration > 0 else None,
+        'latencyP50': percentile(accepted, 50),
+        'latencyP99': percentile(accepted, 99),
+        'convergenceSeconds': converged[0]     # First wave only
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Beacon flood load generator')
+    parser.add_argument('--agents', type=int, default=1000, help='Simulated scanning agents')
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent HTTP connections')
+    parser.add_argument('--jitter', type=float, default=None,
+                        help='Seconds over which the replies are spread (default: replyWindow of the beacon)')
+    parser.add_argument('--beacons', type=int, default=3, help='Beacons answered')
+    parser.add_argument('--leader', default=None, help='Leader IP: do not wait for its beacons (one wave per --period)')
+    parser.add_argument('--period', type=float, default=5., help='Seconds between waves if --leader is set')
+    parser.add_argument('--port', type=int, default=CPARAMS.POLICIES_PORT, help='Policies port of the Leader')
+    parser.add_argument('--listen', type=int, default=CPARAMS.LDISCOVERY_PORT, help='Beacon port')
+    parser.add_argument('--prefix', default='flood', help='deviceID prefix of the simulated agents')
+    parser.add_argument('--timeout', type=float, default=2., help='Beacon reply timeout')
+    parser.add_argument('--convergence-timeout', type=float, default=30., help='Max seconds until all the agents are in the topology')
+    parser.add_argument('--beacon-timeout', type=float, default=30.)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='JSON file (stdout by default)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    replies = agents(args.agents, args.prefix, args.seed)
+    sock = None
+    if args.leader is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', args.listen))
+
+    waves = []
+    leaderID = None
+    for _ in range(args.beacons):
+        if sock is not None:
+            leaderIP, beacon = wait_beacon(sock, args.beacon_timeout)
+            if leaderIP is None:
+                LOG.error('No beacon received in {}s'.format(args.beacon_timeout))
+                break
+        else:
+            if waves:
+                threading.Event().wait(args.period)
+            leaderIP, beacon = args.leader, {}
+        leaderID = beacon.get('leaderID', leaderID)
+        wave = run_wave(leaderIP, beacon, replies, args, join=not waves)
+        wave['leaderIP'] = leaderIP
+        waves.append(wave)
+        LOG.info('Wave {}: {}'.format(len(waves), wave))
+    if sock is not None:
+        sock.close()
+
+    report = {
+        'leaderID': leaderID,
+        'agents': args.agents,
+        'concurrency': args.concurrency,
+        'waves': waves,
+        'maxAcceptedPerSecond': max([wave['acceptedPerSecond'] or .0 for wave in waves], default=None),
+        'maxLatencyP99': max([wave['latencyP99'] for wave in waves if wave['latencyP99'] is not None], default=None)
+    }
+    if args.output is None:
+        print(dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            f.write(dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Beacon reply ingestion on the Leader: per-device (recv_reply) vs. batched (recv_replies)
+
+    Usage: python3 -m benchmarks.bench_ingestion [--devices 1000 10000] [--batch 1 10 100 1000] [--threads 1 4]
+"""
+
+import argparse
+import logging
+import threading
+from json import dumps
+from time import perf_counter
+
+from common.logs import LOG
+from lightdiscovery.lightdiscovery import LightDiscovery
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def beacon_replies(n_devices):
+    return [({'deviceID': 'agent/{}'.format(i), 'deviceIP': '', 'cpu_cores': 1 + i % 8,
+              'mem_avail': 1. + i % 16, 'stg_avail': 10. + i % 100}, '10.{}.{}.{}'.format(i // 65536 % 256, i // 256 % 256, i % 256))
+            for i in range(n_devices)]
+
+
+def run(replies, batch, n_threads):
+    """
+    Apply all the beacon replies to a new topology
+    :param replies: List of (payload, deviceIP)
+    :param batch: Records per call (1: recv_reply, >1: recv_replies)
+    :param n_threads: Concurrent senders (replies are split between them)
+    :return: Records per second
+    """
+    ld = LightDiscovery('', 'leader')
+
+    def sender(part):
+        if batch == 1:
+            for payload, deviceIP in part:
+                ld.recv_reply(payload, deviceIP)
+        else:
+            for i in range(0, len(part), batch):
+                chunk = part[i:i + batch]
+                ld.recv_replies([dict(payload, deviceIP=deviceIP) for payload, deviceIP in chunk], '')
+
+    threads = [threading.Thread(target=sender, args=(replies[i::n_threads],)) for i in range(n_threads)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+    assert len(ld.get_topology()) == len(replies)
+    return len(replies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Beacon reply ingestion benchmark')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 10, 100, 1000], help='Records per call (1 = /ld/beaconReply)')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4], help='Concurrent senders')
+    parser.add_argument('--json', action='store_true', help='JSON output')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.WARNING)
+    results = []
+    for n_devices in args.devices:
+        replies = beacon_replies(n_devices)
+        for n_threads in args.threads:
+            for batch in args.batch:
+                results.append({'devices': n_devices, 'threads': n_threads, 'batch': batch,
+                                'recordsPerSecond': run(replies, batch, n_threads)})
+
+    if args.json:
+        print(dumps(results, indent=2))
+    else:
+        print('{:>10} {:>8} {:>8} {:>14}'.format('devices', 'threads', 'batch', 'records/s'))
+        for result in results:
+            print('{:>10} {:>8} {:>8} {:>14.0f}'.format(result['devices'], result['threads'], result['batch'], result['recordsPerSecond']))
+
+
+if __name__ == '__main__':
+    main()
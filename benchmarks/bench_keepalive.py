@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Keepalive handling cost on the Leader vs. number of registered backups
+
+    The full response path of the keepalive endpoint is measured: request parsing, receive_keepalive(), backup list
+    and control information of the reply (getKeepaliveReply()) and reply serialization. The requests are sent to a
+    Flask app with the same keepalive handler as main.py through its test client (no sockets).
+    Two backups are measured: one with the current replica of the control state (steady state) and one without
+    replica (full copy of the area state in the reply).
+
+    Usage: python3 -m benchmarks.bench_keepalive [--sizes 1 10 100 1000 10000] [--calls 2000] [--devices 100]
+"""
+
+import argparse
+import logging
+from json import loads
+from time import perf_counter
+
+from flask import Flask, request, jsonify
+
+from common.common import URLS
+from common.logs import LOG
+from leaderprotection.arearesilience import AreaResilience, BackupEntry
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def keepalive_app(ar, deviceID='leader/0'):
+    """
+    :return: Flask app with the keepalive endpoint of main.py
+    """
+    app = Flask('bench_keepalive')
+
+    @app.route(URLS.URL_POLICIES_KEEPALIVE, methods=['POST'])
+    def keepalive():
+        payload = request.get_json()
+        if not ar.imLeader():
+            return jsonify({'deviceID': deviceID, 'backupPriority': ar.PRIORITY_ON_FAILURE}), 405
+        correct, priority = ar.receive_keepalive(payload['deviceID'])
+        if not correct:
+            return jsonify({'deviceID': deviceID, 'backupPriority': priority}), 403
+        reply = ar.getKeepaliveReply(payload.get('controlVersion'))
+        reply.update({'deviceID': deviceID, 'backupPriority': priority})
+        return jsonify(reply), 200
+
+    return app
+
+
+def bench_keepalive(n_backups, calls, n_devices=100):
+    """
+    Register n_backups in a Leader and measure the time of the keepalive endpoint
+    :param n_backups: Number of registered backups
+    :param calls: Number of keepalives processed
+    :param n_devices: Devices in the topology of the Leader (replicated in the control state)
+    :return: dicc {'current', 'full'}: mean time per keepalive in microseconds with the current replica / no replica
+    """
+    topology = [{'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.1.{}.{}'.format(i // 256, i % 256),
+                 'cpu_cores': 4, 'mem_avail': 8., 'stg_avail': 100.} for i in range(n_devices)]
+    ar = AreaResilience(lambda key, default=None: topology if key == 'topology_info' else default)
+    ar._imLeader = True
+    for i in range(n_backups):
+        ar.backupDatabase.add(BackupEntry('backup/{}'.format(i), '10.0.{}.{}'.format(i // 256, i % 256), i + 1))
+    client = keepalive_app(ar).test_client()
+    url = URLS.URL_POLICIES_KEEPALIVE
+    deviceID = 'backup/{}'.format(n_backups - 1)
+    r = client.post(url, json={'deviceID': deviceID})
+    assert r.status_code == 200
+    controlVersion = loads(r.get_json()['controlInformation'])['version']
+    ret = {}
+    for name, payload in (('current', {'deviceID': deviceID, 'controlVersion': controlVersion}),
+                          ('full', {'deviceID': deviceID})):
+        start = perf_counter()
+        for _ in range(calls):
+            r = client.post(url, json=payload)
+        elapsed = perf_counter() - start
+        assert r.status_code == 200
+        ret[name] = elapsed / calls * 1e6
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keepalive handling micro-benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--devices', type=int, default=100, help='Devices in the topology of the Leader')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.WARNING)
+    print('{:>10} {:>20} {:>20}'.format('backups', 'us/keepalive current', 'us/keepalive full'))
+    for size in args.sizes:
+        result = bench_keepalive(size, args.calls, args.devices)
+        print('{:>10} {:>20.1f} {:>20.1f}'.format(size, result['current'], result['full']))
+
+
+if __name__ == '__main__':
+    main()
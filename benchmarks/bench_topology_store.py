@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Topology store of the Leader: dict of DeviceInformation vs. columnar store (NumPy)
+
+    Memory of each store filled with decoded beacon replies (as the Leader does), memory of the whole topology of a
+    Leader (store, change log and backup candidates) after two rounds of beacon replies, and time of the query
+    "devices with mem_avail >= RAM_MIN ordered by stg_avail" (top k).
+
+    Usage: python3 -m benchmarks.bench_topology_store [--devices 1000 10000 50000] [--top 10] [--json]
+"""
+
+import argparse
+import gc
+import logging
+import random
+import tracemalloc
+from collections import OrderedDict
+from heapq import nlargest
+from json import dumps, loads
+from time import perf_counter
+
+from common.logs import LOG
+from lightdiscovery.columnarstore import ColumnarTopology
+from lightdiscovery.lightdiscovery import DeviceInformation, LightDiscovery
+from policies.agentcapability import LeaderMandatoryRequirements
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def devices(n_devices, seed=None):
+    """
+    :return: List of beacon replies (JSON)
+    """
+    rnd = random.Random(seed)
+    return [dumps({'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.{}.{}.{}'.format(i // 65536 % 256, i // 256 % 256, i % 256),
+                   'cpu_cores': rnd.randint(1, 16), 'mem_avail': rnd.uniform(.5, 32.), 'stg_avail': rnd.uniform(1., 500.)})
+            for i in range(n_devices)]
+
+
+def build_dict(rows):
+    db = OrderedDict()
+    for row in rows:
+        dev_obj = DeviceInformation(dict=loads(row))
+        db[dev_obj.deviceID] = dev_obj
+    return db
+
+
+def build_columnar(rows):
+    store = ColumnarTopology(factory=DeviceInformation.fromColumns)
+    for row in rows:
+        dev_obj = DeviceInformation(dict=loads(row))
+        store[dev_obj.deviceID] = dev_obj
+    return store
+
+
+def leader(columnar):
+    """
+    :return: Function that builds the topology of a Leader from the beacon replies (two rounds)
+    """
+    def build(rows):
+        ldp = LightDiscoveryPolicies(COLUMNAR_TOPOLOGY=columnar, MAX_DEVICES=len(rows))
+        ld = LightDiscovery('', 'leader/bench', ldp=ldp)
+        ld.startBeaconning()
+        ld.stopBeaconning()     # The topology is kept
+        for _ in range(2):
+            for row in rows:
+                payload = loads(row)
+                ld.recv_reply(payload, payload['deviceIP'])
+        return ld
+    return build
+
+
+def query_dict(db, ram_min, k):
+    return [dev_obj.getDict() for dev_obj in
+            nlargest(k, (dev_obj for dev_obj in db.values() if dev_obj.mem_avail >= ram_min), key=lambda dev_obj: dev_obj.stg_avail)]
+
+
+def query_columnar(store, ram_min, k):
+    return store.query({'mem_avail': ram_min}, order_by='stg_avail', k=k)
+
+
+def memory(build, rows):
+    """
+    :return: (store, bytes allocated by the store)
+    """
+    gc.collect()
+    tracemalloc.start()
+    store = build(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return store, size
+
+
+def timeit(query, store, ram_min, k, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        query(store, ram_min, k)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Topology store benchmark')
+    parser.add_argument('--devices', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--top', type=int, default=10, help='Devices returned by the query')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='JSON output')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.WARNING)
+    ram_min = float(LeaderMandatoryRequirements().get(LeaderMandatoryRequirements.RAM_MIN)) / 1024     # MB -> GB
+    results = []
+    for n_devices in args.devices:
+        rows = devices(n_devices, args.seed)
+        db, dict_bytes = memory(build_dict, rows)
+        store, columnar_bytes = memory(build_columnar, rows)
+        _, dict_leader_bytes = memory(leader(False), rows)
+        _, columnar_leader_bytes = memory(leader(True), rows)
+        assert [device['deviceID'] for device in query_dict(db, ram_min, args.top)] == \
+            [device['deviceID'] for device in query_columnar(store, ram_min, args.top)]
+        results.append({
+            'devices': n_devices,
+            'dictBytes': dict_bytes,
+            'columnarBytes': columnar_bytes,
+            'dictLeaderBytes': dict_leader_bytes,
+            'columnarLeaderBytes': columnar_leader_bytes,
+            'dictQuerySeconds': timeit(query_dict, db, ram_min, args.top, args.repeat),
+            'columnarQuerySeconds': timeit(query_columnar, store, ram_min, args.top, args.repeat)
+        })
+
+    if args.json:
+        print(dumps(results, indent=2))
+    else:
+        print('{:>8} {:>12} {:>14} {:>16} {:>18} {:>12} {:>14}'.format(
+            'devices', 'dict MB', 'columnar MB', 'dict leader MB', 'columnar leader MB', 'dict ms', 'columnar ms'))
+        for result in results:
+            print('{:>8} {:>12.2f} {:>14.2f} {:>16.2f} {:>18.2f} {:>12.3f} {:>14.3f}'.format(
+                result['devices'], result['dictBytes'] / 2 ** 20, result['columnarBytes'] / 2 ** 20,
+                result['dictLeaderBytes'] / 2 ** 20, result['columnarLeaderBytes'] / 2 ** 20,
+                result['dictQuerySeconds'] * 1000, result['columnarQuerySeconds'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Area Resilience failover
+
+    N agents (AreaResilience + LightDiscovery) are started in one process, each one with its own Policies API on a
+    loopback address (127.0.0.1, 127.0.0.2, ...) and a local stand-in of the cimi() requester. The Leader is killed
+    (crash: connection refused, hang: connections accepted by the kernel but never answered) and the following times
+    (seconds from the kill) are measured:
+        - detection: first backup that detects the Leader failure
+        - takeover: a backup is the new Leader
+        - restore: the new Leader has BACKUP_MINIMUM backups again
+    The keepalive throughput received by the Leader is measured before the kill. The beacon replies of the live agents
+    are delivered to the current Leader every beacon period (as LightDiscovery does).
+
+    Usage: python3 -m benchmarks.failover [--agents 5] [--backups 1 2] [--keepalive 1 .5] [--output results.json]
+"""
+
+import argparse
+import logging
+import threading
+from itertools import product
+from json import dumps
+from time import monotonic, sleep
+
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+from common.logs import LOG
+from common.common import CPARAMS, URLS
+from leaderprotection.arearesilience import AreaResilience
+from lightdiscovery.lightdiscovery import LightDiscovery
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class Area:
+    """Shared state of the simulated area (Leader address used by the role change stand-in)"""
+    def __init__(self):
+        self.leaderIP = ''
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+
+    def beaconReplies(self, agents, period):
+        """
+        Deliver the beacon replies of the live agents to the current Leader every period
+        :param agents: List of Agent
+        :param period: Beacon period (seconds)
+        """
+        while not self.stopEvent.wait(period):
+            live = [agent for agent in agents if agent.alive]
+            for leader in live:
+                if leader.ar.imLeader():
+                    for agent in live:
+                        if agent is not leader:
+                            leader.ld.recv_reply(agent.device(), agent.deviceIP)
+
+
+class Agent:
+    """One agent of the area: AreaResilience + LightDiscovery + Policies API (subset used by Area Resilience)"""
+    def __init__(self, index, area, lpp, leader=False):
+        self.deviceID = 'agent/{}'.format(index)
+        self.deviceIP = '127.0.0.{}'.format(index + 1)
+        self.leader = leader
+        self.area = area
+        self.lpp = lpp
+        self.keepalives = 0
+        self.alive = True
+        self.hung = False
+        self.ld = LightDiscovery('', self.deviceID)
+        self.ar = self.__newAreaResilience()
+        self.server = make_server(self.deviceIP, CPARAMS.POLICIES_PORT, self.__app(), threaded=True)
+        self.th_server = threading.Thread(name='srv_{}'.format(index), target=self.server.serve_forever, daemon=True)
+
+    def __newAreaResilience(self):
+        return AreaResilience(self.cimi, self.lpp, selfAddress=(self.deviceIP, CPARAMS.POLICIES_PORT))
+
+    def device(self):
+        """
+        :return: Beacon reply of this agent (DeviceInformation dicc), capable to be Leader
+        """
+        return {'deviceID': self.deviceID, 'deviceIP': self.deviceIP, 'cpu_cores': 4, 'mem_avail': 4., 'stg_avail': 16.}
+
+    def cimi(self, key, default=None):
+        """Stand-in of main.cimi()"""
+        if key == 'leader':
+            return self.leader
+        elif key == 'backup_candidate':
+            value = self.ld.pop_candidate()
+            return default if value is None else value
+        elif key == 'restore_candidate':
+            return self.ld.restore_candidate
+        elif key == 'capable':
+            return True
+        elif key == 'topology_info':
+            return self.ld.get_topology_info()
+        elif key == 'policies':
+            return default
+        elif key == 'disc_leaderIP':
+            with self.area.lock:
+                return self.area.leaderIP if self.area.leaderIP != self.deviceIP else default
+        return default
+
+    def __app(self):
+        app = Flask(self.deviceID)
+
+        @app.before_request
+        def hang():
+            if self.hung:
+                # Block the request until the end of the run
+                self.area.stopEvent.wait()
+                return jsonify({}), 503
+
+        @app.route(URLS.URL_POLICIES_ROLECHANGE + '<string:role>')
+        def roleChange(role):
+            imLeader = self.ar.imLeader()
+            imBackup = self.ar.imBackup()
+            if role == 'leader' and imBackup and not imLeader:
+                # Start with the topology replicated from the failed Leader
+                for device in self.ar.getReplicatedTopology():
+                    self.ld.recv_reply(device, device.get('deviceIP'))
+                with self.area.lock:
+                    self.area.leaderIP = self.deviceIP
+                return jsonify({'imLeader': True, 'imBackup': False}), 200
+            elif role == 'backup' and not imLeader and not imBackup:
+                with self.area.lock:
+                    leaderIP = self.area.leaderIP
+                if self.ar.promotedToBackup(leaderIP=leaderIP):
+                    return jsonify({'imLeader': False, 'imBackup': True}), 200
+            elif role == 'agent' and (imLeader or imBackup):
+                self.ar.stop()
+                self.leader = False
+                self.ar = self.__newAreaResilience()
+                self.ar.start(self.deviceID)
+                return jsonify({'imLeader': False, 'imBackup': False}), 200
+            return jsonify({'imLeader': imLeader, 'imBackup': imBackup}), 403
+
+        @app.route(URLS.URL_POLICIES_KEEPALIVE, methods=['POST'])
+        def keepalive():
+            payload = request.get_json()
+            if not self.ar.imLeader():
+                return jsonify({'deviceID': self.deviceID, 'backupPriority': self.ar.PRIORITY_ON_FAILURE}), 405
+            correct, priority = self.ar.receive_keepalive(payload['deviceID'])
+            with self.area.lock:
+                self.keepalives += 1
+            if not correct:
+                return jsonify({'deviceID': self.deviceID, 'backupPriority': priority}), 403
+            reply = self.ar.getKeepaliveReply(payload.get('controlVersion'))
+            reply.update({'deviceID': self.deviceID, 'backupPriority': priority})
+            return jsonify(reply), 200
+
+        @app.route(URLS.URL_POLICIES_TAKEOVER, methods=['POST'])
+        def takeover():
+            payload = request.get_json()
+            return jsonify(self.ar.receive_takeover_claim(payload['deviceID'], payload['backupPriority'])), 200
+
+        @app.route(URLS.URL_POLICIES_LEADERINFO)
+        def leaderinfo():
+            return jsonify({'imLeader': self.ar.imLeader(), 'imBackup': self.ar.imBackup()}), 200
+
+        return app
+
+    def start(self):
+        self.th_server.start()
+        self.ar.start(self.deviceID)
+
+    def kill(self, failure='crash'):
+        """
+        The agent fails without sending any message
+        :param failure: crash (connections refused) or hang (connections accepted by the kernel, never answered)
+        """
+        self.alive = False
+        if failure == 'crash':
+            self.server.shutdown()
+        else:
+            self.hung = True
+        self.ar.stop()
+
+    def stop(self):
+        self.alive = False
+        self.ar.stop()
+
+    def close(self):
+        if self.th_server.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_until(condition, timeout, since=None, interval=.005):
+    """
+    :param condition: Function that returns True when the stage is done
+    :param timeout: Max seconds to wait
+    :param since: time.monotonic() reference of the returned time (now by default)
+    :return: Seconds from since until condition() is True or None on timeout
+    """
+    start = monotonic()
+    since = start if since is None else since
+    while monotonic() - start < timeout:
+        if condition():
+            return monotonic() - since
+        sleep(interval)
+    return None
+
+
+def run_failover(n_agents, policies, window, timeout, beacon=5., failure='crash'):
+    """
+    Start an area, measure the keepalive throughput, kill the Leader and measure the failover
+    :param n_agents: Number of agents of the area (Leader included)
+    :param policies: Leader Protection policies of the run (dicc)
+    :param window: Seconds to measure the keepalive throughput
+    :param timeout: Max seconds for every stage
+    :param beacon: Beacon period (seconds)
+    :param failure: Leader failure mode (crash or hang)
+    :return: dicc with the results of the run
+    """
+    lpp = LeaderProtectionPolicies(**policies)
+    backup_minimum = lpp.get(lpp.BACKUP_MINIMUM)
+    area = Area()
+    agents = [Agent(i, area, lpp, leader=(i == 0)) for i in range(n_agents)]
+    leader = agents[0]
+    area.leaderIP = leader.deviceIP
+    for agent in agents[1:]:
+        leader.ld.recv_reply(agent.device(), agent.deviceIP)
+    result = {'agents': n_agents, 'failure': failure, 'beacon': beacon, 'policies': dict(policies)}
+    th_beacon = threading.Thread(name='beacon', target=area.beaconReplies, args=(agents, beacon), daemon=True)
+    try:
+        for agent in agents:
+            agent.start()
+        th_beacon.start()
+        result['initialProtection'] = wait_until(lambda: leader.ar.getMetrics()['backups'] >= backup_minimum, timeout)
+        # Wait until the backups have the replicated area state
+        wait_until(lambda: all(len(agent.ar.getReplicatedTopology()) > 0 for agent in agents if agent.ar.imBackup()), timeout)
+
+        start_count = leader.keepalives
+        sleep(window)
+        result['keepalivesPerSecond'] = (leader.keepalives - start_count) / window
+        rtt = [agent.ar.getMetrics()['keepaliveRTTMean'] for agent in agents if agent.ar.imBackup()]
+        rtt = [value for value in rtt if value is not None]
+        result['keepaliveRTTMean'] = sum(rtt) / len(rtt) if rtt else None
+
+        backups = [agent for agent in agents if agent.ar.imBackup()]
+        leader.kill(failure)
+        killed = monotonic()
+        result['detection'] = wait_until(lambda: any(agent.ar.getMetrics()['lastFailureDetectionTime'] is not None for agent in backups), timeout, killed)
+        result['takeover'] = wait_until(lambda: any(agent.ar.imLeader() for agent in agents[1:]), timeout, killed)
+        result['restore'] = None
+        new_leader = next((agent for agent in agents[1:] if agent.ar.imLeader()), None)
+        if new_leader is not None:
+            # The failed Leader is not replaced as a candidate
+            result['restore'] = wait_until(lambda: new_leader.ar.getMetrics()['backups'] >= min(backup_minimum, n_agents - 2), timeout, killed)
+            result['newLeader'] = new_leader.deviceID
+            result['leaderlessWindow'] = new_leader.ar.getMetrics()['lastLeaderlessWindow']
+    finally:
+        area.stopEvent.set()
+        for agent in agents:
+            agent.stop()
+        for agent in agents:
+            agent.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Area Resilience failover benchmark')
+    parser.add_argument('--agents', type=int, default=5, help='Agents of the area (Leader included)')
+    parser.add_argument('--backups', type=int, nargs='+', default=[1, 2], help='BACKUP_MINIMUM values')
+    parser.add_argument('--keepalive', type=float, nargs='+', default=[1.], help='TIME_KEEPALIVE values')
+    parser.add_argument('--retries', type=int, nargs='+', default=[5], help='MAX_RETRY_ATTEMPTS values')
+    parser.add_argument('--detector', nargs='+', default=['FIXED'], choices=['FIXED', 'PHI'], help='FAILURE_DETECTOR values')
+    parser.add_argument('--failure', nargs='+', default=['crash'], choices=['crash', 'hang'], help='Leader failure modes')
+    parser.add_argument('--beacon', type=float, default=5., help='Beacon period (seconds)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--window', type=float, default=3., help='Seconds to measure the keepalive throughput')
+    parser.add_argument('--timeout', type=float, default=60.)
+    parser.add_argument('--port', type=int, default=CPARAMS.POLICIES_PORT, help='Policies API port of the agents')
+    parser.add_argument('--output', default=None, help='JSON file (stdout by default)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    CPARAMS.POLICIES_PORT = args.port
+    defaults = dict(LeaderProtectionPolicies.POLICIES)
+
+    results = []
+    for failure, backups, keepalive, retries, detector in product(args.failure, args.backups, args.keepalive, args.retries, args.detector):
+        policies = {
+            'BACKUP_MINIMUM': backups,
+            'TIME_KEEPALIVE': keepalive,
+            'MAX_RETRY_ATTEMPTS': retries,
+            'FAILURE_DETECTOR': detector,
+            'TIME_TO_WAIT_BACKUP_SELECTION': keepalive
+        }
+        for _ in range(args.repeat):
+            LeaderProtectionPolicies.POLICIES.update(defaults)     # Policies are shared by all the instances
+            results.append(run_failover(args.agents, policies, args.window, args.timeout, args.beacon, failure))
+            LOG.info('Failover run: {}'.format(results[-1]))
+
+    output = dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
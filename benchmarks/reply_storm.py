@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Benchmark - Peak beacon reply rate on the Leader, with and without the reply window (REPLY_WINDOW policy)
+
+    A Leader (LightDiscovery in beacon mode + beacon reply endpoint) and N scanning agents (LightDiscovery in scan
+    mode) run in one process. The beacons are broadcast on the loopback (127.255.255.255), so every agent receives
+    them and answers through its scanning pipeline (categorization and reply at a random instant of the advertised
+    window). The arrival time of each beacon reply is recorded by the endpoint of the Leader, and the peak request
+    rate is the max number of arrivals in any interval of --bucket seconds. The agents and the Leader share the CPU of
+    this machine: the replies lost (timeout of the agent) show when the Leader cannot absorb the storm.
+
+    Usage: python3 -m benchmarks.reply_storm [--agents 100 500] [--window 0 0.5 2] [--beacons 3] [--bucket 0.1]
+"""
+
+import argparse
+import logging
+import threading
+from json import dumps
+from time import monotonic
+
+from flask import Flask, request
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from common.common import CPARAMS, URLS
+from common.logs import LOG
+from lightdiscovery.lightdiscovery import LightDiscovery
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class LeaderEndpoint:
+    """
+    Beacon reply endpoint of the Leader (as main.py) that records the arrival time of each reply
+    """
+    def __init__(self, host, port):
+        self.ld = None
+        self._lock = threading.Lock()
+        self._arrivals = []
+        app = Flask('reply_storm')
+
+        @app.route(URLS.URL_BEACONREPLY, methods=['POST'])
+        def beaconReply():
+            arrival = monotonic()
+            with self._lock:
+                self._arrivals.append(arrival)
+            ld = self.ld
+            if ld is None or not ld.recv_reply(request.get_json(), request.remote_addr):
+                return '', 400
+            return '', 200
+
+        WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+        WSGIRequestHandler.timeout = LeaderProtectionPolicies().getIdleConnectionTimeout()
+        self._server = make_server(host, port, app, threaded=True)
+        self._thread = threading.Thread(name='storm_srv', target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+    def reset(self, ld):
+        self.ld = ld
+        with self._lock:
+            self._arrivals = []
+
+    def arrivals(self):
+        with self._lock:
+            return sorted(self._arrivals)
+
+
+def peak_rate(times, bucket):
+    """
+    :param times: Sorted arrival times
+    :param bucket: Sliding window (seconds)
+    :return: Max requests per second in any interval of bucket seconds
+    """
+    peak = 0
+    first = 0
+    for last in range(len(times)):
+        while times[last] - times[first] > bucket:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak / bucket
+
+
+def parallel(function, items):
+    threads = [threading.Thread(target=function, args=(item,), daemon=True) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(endpoint, n_agents, window, beacons, period, bucket):
+    """
+    :return: dicc with the replies received by the Leader and the peak request rate
+    """
+    ldp = LightDiscoveryPolicies(BEACON_PERIOD=period, REPLY_WINDOW=window, UDP_BEACON_REPLY=False,
+                                 REPLY_REFRESH_BEACONS=1)
+    leader = LightDiscovery(CPARAMS.BROADCAST_ADDR_FLAG, 'storm/leader', ldp=ldp)
+    agents = [LightDiscovery(CPARAMS.BROADCAST_ADDR_FLAG, 'storm/{}'.format(i), ldp=ldp) for i in range(n_agents)]
+    parallel(lambda agent: agent.startScanning(), agents)
+    endpoint.reset(leader)
+    leader.startBeaconning()
+    # The first beacon is sent at once: beacons - 1 periods + the last reply window
+    threading.Event().wait((beacons - 1) * period + window + 1.)
+    leader.stopBeaconning()
+    parallel(lambda agent: agent.stopScanning(), agents)
+    arrivals = endpoint.arrivals()
+    return {
+        'agents': n_agents,
+        'window': window,
+        'beacons': beacons,
+        'bucket': bucket,
+        'expectedReplies': n_agents * beacons,
+        'replies': len(arrivals),
+        'devices': leader.get_stats()['devices'],
+        'peakRequestsPerSecond': peak_rate(arrivals, bucket) if arrivals else .0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Beacon reply storm on a local Leader')
+    parser.add_argument('--agents', type=int, nargs='+', default=[100, 500], help='Scanning agents (3 threads each)')
+    parser.add_argument('--window', type=float, nargs='+', default=[0., .5, 2.], help='REPLY_WINDOW (0 = before)')
+    parser.add_argument('--beacons', type=int, default=3, help='Beacons per configuration')
+    parser.add_argument('--period', type=float, default=3., help='BEACON_PERIOD (longer than the windows)')
+    parser.add_argument('--bucket', type=float, default=.1, help='Interval used to measure the request rate (seconds)')
+    parser.add_argument('--port', type=int, default=CPARAMS.POLICIES_PORT, help='Policies port of the Leader')
+    parser.add_argument('--listen', type=int, default=CPARAMS.LDISCOVERY_PORT, help='Beacon port')
+    parser.add_argument('--broadcast', default='127.255.255.255', help='Beacon broadcast address (loopback)')
+    parser.add_argument('--json', action='store_true', help='JSON output')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    LOG.setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)     # Lost replies are counted
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    CPARAMS.BROADCAST_ADDR_FLAG = args.broadcast
+    CPARAMS.POLICIES_PORT = args.port
+    CPARAMS.LDISCOVERY_PORT = args.listen
+    endpoint = LeaderEndpoint('127.0.0.1', args.port)
+    endpoint.start()
+    results = [run(endpoint, n_agents, window, args.beacons, max(args.period, window + 1.), args.bucket)
+               for n_agents in args.agents for window in args.window]
+    endpoint.stop()
+
+    if args.json:
+        print(dumps(results, indent=2))
+    else:
+        print('{:>8} {:>8} {:>10} {:>10} {:>16}'.format('agents', 'window', 'expected', 'replies', 'peak req/s'))
+        for result in results:
+            print('{:>8} {:>8.2f} {:>10} {:>10} {:>16.0f}'.format(result['agents'], result['window'],
+                                                                   result['expectedReplies'], result['replies'],
+                                                                   result['peakRequestsPerSecond']))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,9 @@ from common.common import CPARAMS
 from common.logs import LOG
 
 import requests
+import threading
 import urllib3
+from time import monotonic
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)     # https://stackoverflow.com/a/28002687
 
 
@@ -26,6 +28,10 @@ class CIMIcalls:
     CIMI_API_ENTRY = '/cloud-entry-point'
     CIMI_AGENT_RESOURCE = '/agent'
 
+    CONNECT_TIMEOUT = 1.    # Seconds
+    READ_TIMEOUT = 5.
+    TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
     @staticmethod
     def checkCIMIstarted():
         """
@@ -34,7 +40,7 @@ class CIMIcalls:
         """
         URL = CIMIcalls.CIMI_URL + CIMIcalls.CIMI_API_ENTRY
         try:
-            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False)
+            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, timeout=CIMIcalls.TIMEOUT)
             LOG.debug('CIMI [{}] status_code {}, content {}'.format(URL, r.status_code,r.text))
             return True
         except Exception as ex:
@@ -50,7 +56,7 @@ class CIMIcalls:
         """
         URL = CIMIcalls.CIMI_URL + CIMIcalls.CIMI_AGENT_RESOURCE
         try:
-            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False)
+            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, timeout=CIMIcalls.TIMEOUT)
             rjson = r.json()
             LOG.debug('CIMI agent [{}] status_code {} count {}'.format(URL, r.status_code, rjson.get('count')))
             if len(rjson.get('agents')) > 0:
@@ -73,7 +79,7 @@ class CIMIcalls:
         URL = CIMIcalls.CIMI_URL + CIMIcalls.CIMI_AGENT_RESOURCE
         payload = agentResource
         try:
-            r = requests.post(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, json=payload)
+            r = requests.post(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, json=payload, timeout=CIMIcalls.TIMEOUT)
             rjson = r.json()
             LOG.debug('CIMI create agent [{}] status_code {} resource-id {}'.format(URL, r.status_code, rjson.get('resource-id')))
             if r.status_code == 409:
@@ -94,7 +100,7 @@ class CIMIcalls:
         """
         URL = CIMIcalls.CIMI_URL + '/' + resource_id
         try:
-            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False)
+            r = requests.get(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, timeout=CIMIcalls.TIMEOUT)
             rjson = r.json()
             LOG.debug('CIMI GET resource [{}] status_code {}'.format(URL, r.status_code))
             return r.status_code, rjson
@@ -112,7 +118,7 @@ class CIMIcalls:
         """
         URL = CIMIcalls.CIMI_URL + '/' + resource_id
         try:
-            r = requests.put(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, json=payload)
+            r = requests.put(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, json=payload, timeout=CIMIcalls.TIMEOUT)
             # rjson = r.json()
             LOG.debug('CIMI EDIT resource [{}] status_code {} content {}'.format(URL, r.status_code, r.content))
             return r.status_code
@@ -129,7 +135,7 @@ class CIMIcalls:
         """
         URL = CIMIcalls.CIMI_URL + '/' + resource_id
         try:
-            r = requests.delete(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False)
+            r = requests.delete(URL, headers=CIMIcalls.CIMI_HEADERS, verify=False, timeout=CIMIcalls.TIMEOUT)
             # rjson = r.json()
             LOG.debug('CIMI DELETE resource [{}] status_code {}'.format(URL, r.status_code))
             return r.status_code
@@ -138,6 +144,113 @@ class CIMIcalls:
             return None
 
 
+class CIMIReadiness:
+    """
+    CIMI readiness monitor. CIMI is checked in background, with exponential backoff while it is not ready
+    (from BACKOFF_MIN to BACKOFF_MAX) and every CHECK_PERIOD once it is ready.
+    The CIMI consumers wait for the ready event instead of polling CIMI.
+    """
+    BACKOFF_MIN = .1    # Seconds
+    BACKOFF_MAX = 2.
+    BACKOFF_FACTOR = 1.5
+    CHECK_PERIOD = 10.
+    LATENCY_WEIGHT = .2     # Weight of the new latency sample (exponential moving average)
+
+    def __init__(self, check=None):
+        """
+        :param check: Callable that returns True if CIMI is up (CIMIcalls.checkCIMIstarted by default)
+        """
+        self._check = check if check is not None else CIMIcalls.checkCIMIstarted
+        self.ready = threading.Event()  # Set while CIMI is up
+        self._stopEvent = threading.Event()
+        self._lock = threading.Lock()
+        self._th_proc = None
+        self._checks = 0
+        self._failures = 0
+        self._latency = None
+        self._lastLatency = None
+        self._lastReadyTime = None
+        self._readySince = None
+        self._startTime = None
+
+    def start(self):
+        with self._lock:
+            if self._th_proc is not None and self._th_proc.is_alive():
+                return
+            self._stopEvent.clear()
+            self._startTime = monotonic()
+            self._th_proc = threading.Thread(name='cimi_ready', target=self.__monitor_flow, daemon=True)
+            self._th_proc.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._th_proc is not None and self._th_proc.is_alive():
+            self._th_proc.join()
+
+    def wait(self, timeout=None):
+        """
+        Wait until CIMI is ready (the monitor is started if needed)
+        :param timeout: Max seconds to wait (None: forever)
+        :return: True if CIMI is ready, False on timeout
+        """
+        self.start()
+        return self.ready.wait(timeout)
+
+    def isReady(self):
+        return self.ready.is_set()
+
+    def __monitor_flow(self):
+        backoff = self.BACKOFF_MIN
+        while not self._stopEvent.is_set():
+            start = monotonic()
+            up = self._check()
+            latency = monotonic() - start
+            with self._lock:
+                self._checks += 1
+                self._lastLatency = latency
+                if up:
+                    self._latency = latency if self._latency is None else \
+                        (1 - self.LATENCY_WEIGHT) * self._latency + self.LATENCY_WEIGHT * latency
+                else:
+                    self._failures += 1
+            if up:
+                if not self.ready.is_set():
+                    self._readySince = monotonic()
+                    if self._lastReadyTime is None:
+                        self._lastReadyTime = self._readySince - self._startTime
+                    LOG.info('CIMI is ready ({:.3f}s)'.format(latency))
+                    self.ready.set()
+                backoff = self.BACKOFF_MIN
+                wait = self.CHECK_PERIOD
+            else:
+                if self.ready.is_set():
+                    LOG.warning('CIMI is not ready anymore')
+                    self.ready.clear()
+                    self._readySince = None
+                wait = backoff
+                backoff = min(self.BACKOFF_MAX, backoff * self.BACKOFF_FACTOR)
+            self._stopEvent.wait(wait)
+
+    def getStats(self):
+        """
+        :return: dicc with the CIMI availability and latency stats
+        """
+        with self._lock:
+            return {
+                'ready': self.ready.is_set(),
+                'checks': self._checks,
+                'failures': self._failures,
+                'availability': (self._checks - self._failures) / self._checks if self._checks > 0 else None,
+                'latency': self._latency,           # Smoothed latency of the successful checks (seconds)
+                'lastLatency': self._lastLatency,
+                'timeToReady': self._lastReadyTime,     # Seconds from the monitor start to the first successful check
+                'readyFor': monotonic() - self._readySince if self._readySince is not None else None
+            }
+
+
+CIMI_READINESS = CIMIReadiness()
+
+
 class AgentResource:
 
     def __init__(self, deviceID, deviceIP, auth, conn, isLeader, leaderID=None, leaderIP=None, backupIP=None):
@@ -18,6 +18,8 @@ from os import environ
 class common_params:
     POLICIES_PORT = 46050
     LDISCOVERY_PORT = 46051
+    HEARTBEAT_PORT = 46052
+    BEACONREPLY_PORT = 46053
 
     CIMI_URL = 'http://cimi:8201/api'
     CIMI_HEADER = {'slipstream-authn-info': 'super ADMIN'}
@@ -26,6 +28,7 @@ class common_params:
 
     TIME_WAIT_INIT = 2.
     TIME_WAIT_ALIVE = 5.
+    TIME_IDLE_MARGIN = 2.   # Idle keep-alive connections of the Policies API are closed after TIME_KEEPALIVE + margin
 
     def __init__(self):
         self.LEADER_FLAG = bool(environ.get('isLeader', default='False') == 'True')
@@ -36,6 +39,7 @@ class common_params:
         self.WIFI_DEV_FLAG = str(environ.get('WIFI_DEV', default=''))
         self.DEVICEID_FLAG = str(environ.get('DEVICEID', default='agent/1234'))
         self.BROADCAST_ADDR_FLAG = str(environ.get('BROADCASTADDR', default=''))
+        self.MOUNTPOINTS_FLAG = [mountpoint for mountpoint in str(environ.get('MOUNTPOINTS', default='')).split(',') if mountpoint != '']
 
         self.__dicc = {
             'LEADER_FLAG'       : self.LEADER_FLAG,
@@ -51,7 +55,8 @@ class common_params:
             'TIME_WAIT_ALIVE'   : self.TIME_WAIT_ALIVE,
             'POLICIES_PORT'     : self.POLICIES_PORT,
             'DEVICEID_FLAG'     : self.DEVICEID_FLAG,
-            'BROADCAST_ADDR_FLAG':self.BROADCAST_ADDR_FLAG
+            'BROADCAST_ADDR_FLAG':self.BROADCAST_ADDR_FLAG,
+            'MOUNTPOINTS_FLAG'  : self.MOUNTPOINTS_FLAG
         }
 
     def get_all(self):
@@ -86,6 +91,10 @@ class ModuleURLs:
     URL_START_FLOW = '{}{}/'.format(__POLICIES_BASE_URL, END_START_FLOW)
     END_POLICIES_KEEPALIVE = '/keepalive'
     URL_POLICIES_KEEPALIVE = '{}{}/'.format(__POLICIES_BASE_URL, END_POLICIES_KEEPALIVE)
+    END_POLICIES_TAKEOVER = '/takeover'
+    URL_POLICIES_TAKEOVER = '{}{}/'.format(__POLICIES_BASE_URL, END_POLICIES_TAKEOVER)
+    END_POLICIES_METRICS = '/metrics'
+    URL_POLICIES_METRICS = '{}{}/'.format(__POLICIES_BASE_URL, END_POLICIES_METRICS)
 
     END_POLICIESDISTR_RECV = '/receiveNewPolicies'
     URL_POLICIESDISTR_RECV = '{}{}/'.format(__POLICIES_BASE_URL, END_POLICIESDISTR_RECV)
@@ -97,10 +106,16 @@ class ModuleURLs:
     LDISCOVERY_BASE_URL = '/ld'
     END_BEACONREPLY = '/beaconReply'
     URL_BEACONREPLY = '{}{}/'.format(LDISCOVERY_BASE_URL, END_BEACONREPLY)
+    END_BEACONREPLIES = '/beaconReplies'
+    URL_BEACONREPLIES = '{}{}/'.format(LDISCOVERY_BASE_URL, END_BEACONREPLIES)
     END_LDISCOVERY_CONTROL = '/control'
     URL_LDISCOVERY_CONTROL = '{}{}/'.format(LDISCOVERY_BASE_URL, END_LDISCOVERY_CONTROL)
     END_LDISCOVERY_TOPOLOGY = '/topology'
     URL_LDISCOVERY_TOPOLOGY = '{}{}/'.format(LDISCOVERY_BASE_URL, END_LDISCOVERY_TOPOLOGY)
+    END_LDISCOVERY_METRICS = '/metrics'
+    URL_LDISCOVERY_METRICS = '{}{}/'.format(LDISCOVERY_BASE_URL, END_LDISCOVERY_METRICS)
+    END_LDISCOVERY_LEADERS = '/leaders'
+    URL_LDISCOVERY_LEADERS = '{}{}/'.format(LDISCOVERY_BASE_URL, END_LDISCOVERY_LEADERS)
 
     URL_POLICIES_RMSTATUS = '/rm/components/'
 
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Device metrics sampler
+
+    CPU, memory and storage of the device refreshed in background, each one with its own interval.
+    Readers get the last snapshot without calling psutil.
+"""
+
+import threading
+import psutil
+from time import monotonic
+
+from common.logs import LOG
+from common.common import CPARAMS
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class DeviceMetrics:
+    CPU = 'cpu_cores'
+    MEMORY = 'mem_avail'
+    STORAGE = 'stg_avail'
+
+    INTERVALS = {
+        'cpu_cores': 60.,   # Seconds between refreshes
+        'mem_avail': 2.,
+        'stg_avail': 30.
+    }
+
+    def __init__(self, intervals=None, mountpoints=None):
+        """
+        :param intervals: dicc {metric: seconds} to override the default refresh intervals
+        :param mountpoints: List of mountpoints included in the storage (all the partitions if None or empty)
+        """
+        self._intervals = dict(self.INTERVALS)
+        self._intervals.update(intervals if intervals is not None else {})
+        self._mountpoints = set(mountpoints) if mountpoints else None
+        self._snapshot = (0, .0, .0)    # (cpu_cores, mem_avail [GB], stg_avail [GB]), replaced on every refresh
+        self._lock = threading.Lock()   # Writers only
+        self._startLock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._th_proc = None
+        self._ready = False
+
+    def __sample(self, metric):
+        if metric == self.CPU:
+            cpu_count = psutil.cpu_count()
+            return int(cpu_count) if cpu_count is not None else -1
+        elif metric == self.MEMORY:
+            return float(psutil.virtual_memory().available / (2 ** 30))
+        else:
+            partitions = [disk.mountpoint for disk in psutil.disk_partitions()
+                          if self._mountpoints is None or disk.mountpoint in self._mountpoints]
+            return float(sum([psutil.disk_usage(mountpoint).free for mountpoint in partitions]) / 2 ** 30)
+
+    def refresh(self, metrics=None):
+        """
+        Sample the metrics now
+        :param metrics: List of metrics to refresh (all by default)
+        """
+        metrics = (self.CPU, self.MEMORY, self.STORAGE) if metrics is None else metrics
+        with self._lock:
+            values = dict(zip((self.CPU, self.MEMORY, self.STORAGE), self._snapshot))
+            for metric in metrics:
+                try:
+                    values[metric] = self.__sample(metric)
+                except:
+                    LOG.exception('Device metric {} not sampled'.format(metric))
+            self._snapshot = (values[self.CPU], values[self.MEMORY], values[self.STORAGE])
+            self._ready = True
+
+    def snapshot(self):
+        """
+        Last sampled metrics (the sampler is started on the first call)
+        :return: tuple (cpu_cores, mem_avail, stg_avail)
+        """
+        if not self._ready:
+            self.start()
+        return self._snapshot
+
+    def start(self):
+        """
+        Sample the metrics (if not sampled yet) and start the sampler thread, once even if called concurrently
+        """
+        with self._startLock:
+            if self._th_proc is not None and self._th_proc.is_alive():
+                return
+            self._stopEvent.clear()
+            if not self._ready:
+                self.refresh()
+            self._th_proc = threading.Thread(name='dev_metrics', target=self.__sampler_flow, daemon=True)
+            self._th_proc.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._th_proc is not None and self._th_proc.is_alive():
+            self._th_proc.join()
+
+    def __sampler_flow(self):
+        now = monotonic()
+        due = {metric: now + interval for metric, interval in self._intervals.items()}
+        while not self._stopEvent.wait(max(.0, min(due.values()) - monotonic())):
+            now = monotonic()
+            expired = [metric for metric, deadline in due.items() if deadline <= now]
+            self.refresh(expired)
+            for metric in expired:
+                due[metric] = now + self._intervals[metric]
+
+
+DEVICE_METRICS = DeviceMetrics(mountpoints=CPARAMS.MOUNTPOINTS_FLAG)
@@ -9,13 +9,24 @@
 import threading
 import requests
 import socket
-from time import sleep
+import select
+from time import monotonic
 from random import randrange
+from json import dumps, loads
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from common.logs import LOG
 from common.common import CPARAMS, URLS
 from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+from leaderprotection import heartbeat
+from leaderprotection.failuredetector import PhiAccrualFailureDetector
+from leaderprotection.replication import ControlState
 
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectTimeout as timeout
 
 __maintainer__ = 'Alejandro Jurnet'
@@ -24,11 +35,148 @@ __author__ = 'Universitat Politècnica de Catalunya'
 
 
 class BackupEntry:
+    __slots__ = ('deviceID', 'deviceIP', 'priority', 'deadline', 'detector')
+
+    CREATION_TTL = 5.   # Seconds until the first keepalive is required
+
     def __init__(self, deviceID, deviceIP, priority):
         self.deviceID = deviceID
         self.deviceIP = deviceIP
         self.priority = priority
-        self.TTL = 5 / .1     # Only because is creation
+        self.deadline = monotonic() + self.CREATION_TTL     # Only because is creation
+        self.detector = None    # Failure detector (None: fixed MAX_TTL)
+
+    def __repr__(self):
+        return 'BackupEntry({}, {}, {})'.format(self.deviceID, self.deviceIP, self.priority)
+
+
+class BackupRegistry:
+    """
+    Backup database indexed by deviceID.
+    Lookup, insertion, removal and keepalive refresh are O(1). The priority order is only built when a
+    snapshot of the database is requested (entries()) and kept until the database changes (version).
+    Expiration is driven by a min-heap of monotonic deadlines. A keepalive only moves the deadline of the entry
+    forward; the heap is corrected lazily when the old deadline is popped, so the heap holds at most one item
+    per backup and a refresh never touches it.
+    Not thread-safe: the owner must hold its own lock (AreaResilience.backupDatabaseLock).
+    """
+    __slots__ = ('_entries', '_heap', '_counter', '_version', '_sorted')
+
+    def __init__(self):
+        self._entries = {}
+        self._heap = []
+        self._counter = count()
+        self._version = 0   # Incremented on every change of the backups or their priorities (not on refresh)
+        self._sorted = None     # Cached entries() of the current version
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, deviceID):
+        return deviceID in self._entries
+
+    def __iter__(self):
+        return iter(self.entries())
+
+    @property
+    def version(self):
+        return self._version
+
+    def __changed(self):
+        self._version += 1
+        self._sorted = None
+
+    def get(self, deviceID, default=None):
+        return self._entries.get(deviceID, default)
+
+    def add(self, entry):
+        """
+        Add (or replace) a backup entry
+        :param entry: BackupEntry
+        :return: True if the backup is new, False if it was replaced
+        """
+        new = entry.deviceID not in self._entries
+        self._entries[entry.deviceID] = entry
+        heappush(self._heap, (entry.deadline, next(self._counter), entry))
+        self.__changed()
+        return new
+
+    def setPriority(self, deviceID, priority):
+        """
+        :param deviceID: ID of the backup
+        :param priority: New priority
+        :return: BackupEntry or None if not found
+        """
+        entry = self._entries.get(deviceID)
+        if entry is not None and entry.priority != priority:
+            entry.priority = priority
+            self.__changed()
+        return entry
+
+    def refresh(self, deviceID, deadline):
+        """
+        Move forward the expiration deadline of a backup
+        :param deviceID: ID of the backup
+        :param deadline: New deadline (time.monotonic() reference)
+        :return: Refreshed BackupEntry or None if not found
+        """
+        entry = self._entries.get(deviceID)
+        if entry is not None and deadline > entry.deadline:
+            entry.deadline = deadline
+        return entry
+
+    def remove(self, deviceID):
+        """
+        Remove a backup from the registry
+        :param deviceID: ID of the backup
+        :return: Removed BackupEntry or None if not found
+        """
+        entry = self._entries.pop(deviceID, None)
+        if entry is not None:
+            self.__changed()
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self._heap.clear()
+        self.__changed()
+
+    def entries(self):
+        """
+        :return: List of the backups ordered by priority (shared until the next change, must not be modified)
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self._entries.values(), key=lambda backup: backup.priority)
+        return self._sorted
+
+    def nextDeadline(self):
+        """
+        :return: Earliest deadline in the heap (may be earlier than the real one) or None if empty
+        """
+        while self._heap and self._entries.get(self._heap[0][2].deviceID) is not self._heap[0][2]:
+            heappop(self._heap)     # Removed or replaced entry
+        return self._heap[0][0] if self._heap else None
+
+    def popExpired(self, now):
+        """
+        Remove from the registry all the backups with deadline <= now
+        :param now: Current time (time.monotonic() reference)
+        :return: List of expired BackupEntry
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry = heappop(self._heap)
+            if self._entries.get(entry.deviceID) is not entry:
+                continue    # Removed or replaced entry
+            if entry.deadline > now:
+                # Refreshed after being pushed, reschedule with its current deadline
+                heappush(self._heap, (entry.deadline, next(self._counter), entry))
+            else:
+                del self._entries[entry.deviceID]
+                expired.append(entry)
+        if expired:
+            self.__changed()
+        return expired
 
 
 class AreaResilience:
@@ -47,9 +195,17 @@ class AreaResilience:
     PRIORITY_ON_REELECTION = 0
     PRIORITY_ON_FAILURE = -3
 
+    KEEPALIVE_RTT_SAMPLES = 100
+    MAX_CACHED_DELTAS = 64      # Serialized control deltas kept per control version
+
     TAG = '\033[34m' + '[AR]: ' + '\033[0m'
 
-    def __init__(self, CIMIRequesterFunction=None, leaderprotectionpolicies_obj=LeaderProtectionPolicies()):
+    def __init__(self, CIMIRequesterFunction=None, leaderprotectionpolicies_obj=LeaderProtectionPolicies(), selfAddress=None):
+        """
+        :param CIMIRequesterFunction: Function (key, default) to get the agent data
+        :param leaderprotectionpolicies_obj: LeaderProtectionPolicies
+        :param selfAddress: (addr, port) of the Policies API of this agent (role change triggers)
+        """
         self._connected = False
         self._imBackup = False
         self._imLeader = False
@@ -61,15 +217,37 @@ class AreaResilience:
         self._leaderIP = ''
         self._backupPriority = -1
         self._nextPriority = 1
+        self.lastProtectionRestoreTime = None
+        self._keepaliveRTT = deque(maxlen=self.KEEPALIVE_RTT_SAMPLES)
+        self._keepaliveReconnections = 0
+        self._heartbeatsLost = 0
+        self._peers = []
+        self._peersLock = threading.Lock()
+        self._takeoverWinnerIP = ''
+        self._lastLeaderContact = None
+        self.lastFailureDetectionTime = None
+        self.lastLeaderlessWindow = None
+        self._controlState = ControlState()     # Leader: master copy, Backup: replica
+        self._controlStateLock = threading.Lock()
+        self._controlStateRefreshed = None
+        self._controlBackupsVersion = None      # Version of the backup database replicated in the control state
+        self._controlInformation = (None, {})   # (control version, {since: JSON delta}) of the keepalive replies
+        self._backupList = (None, [])           # (backup database version, getBackupList())
+        self._stopEvent = threading.Event()     # Set on stop(), interrupts every wait of the module threads
+        self._wakeup = None     # socketpair, interrupts the heartbeat sockets waits on stop() (open while started)
+        self.lastStopTime = None
 
         self._lpp = leaderprotectionpolicies_obj
 
-        self.backupDatabase = []
+        self.backupDatabase = BackupRegistry()
         self.backupDatabaseLock = threading.Lock()
+        self._keeperCondition = threading.Condition(self.backupDatabaseLock)
 
         self._CIMIRequesterFunction = CIMIRequesterFunction
+        self._selfAddr = selfAddress if selfAddress is not None else ('127.0.0.1', CPARAMS.POLICIES_PORT)
         self.th_proc = None
         self.th_keep = None
+        self.th_hb = None
         self.isStarted = False
 
     def __imLeader(self):
@@ -85,8 +263,11 @@ class AreaResilience:
 
         :return:
         """
-        # TODO: Capable by evaluation, not hardcoded
-        return True  # By default, all agents will be capable to be leader.
+        # Evaluation of the Leader Mandatory Requirements (by default, all agents are capable to be leader)
+        if not self._lpp.get(self._lpp.CHECK_CAPABILITY, default=False):
+            return True
+        capable = self.__getCIMIData('capable', None)
+        return True if capable is None else capable     # Capability not decided (metrics not available)
 
     def __getCIMIData(self, key, default=None):
         """
@@ -105,28 +286,206 @@ class AreaResilience:
     def imLeader(self):
         return self._imLeader
 
+    def getMetrics(self):
+        """
+        Area Resilience metrics
+        :return: dicc with the current metrics of the module
+        """
+        with self.backupDatabaseLock:
+            backups = len(self.backupDatabase)
+        rtt = list(self._keepaliveRTT)
+        return {
+            'imLeader': self._imLeader,
+            'imBackup': self._imBackup,
+            'backups': backups,
+            'lastProtectionRestoreTime': self.lastProtectionRestoreTime,
+            'keepaliveRTTLast': rtt[-1] if rtt else None,
+            'keepaliveRTTMean': sum(rtt) / len(rtt) if rtt else None,
+            'keepaliveRTTMax': max(rtt) if rtt else None,
+            'keepaliveReconnections': self._keepaliveReconnections,
+            'heartbeatsLost': self._heartbeatsLost,
+            'lastFailureDetectionTime': self.lastFailureDetectionTime,
+            'lastLeaderlessWindow': self.lastLeaderlessWindow,
+            'controlVersion': self._controlState.version,
+            'lastStopTime': self.lastStopTime
+        }
+
+    def getBackupList(self):
+        """
+        :return: List of the backups (deviceID, deviceIP, priority) ordered by priority.
+                 Built again only when the backup database changes (shared, must not be modified).
+        """
+        with self.backupDatabaseLock:
+            version, backups = self._backupList
+            if version != self.backupDatabase.version:
+                backups = [{'deviceID': backup.deviceID, 'deviceIP': backup.deviceIP, 'priority': backup.priority}
+                           for backup in self.backupDatabase.entries()]
+                self._backupList = (self.backupDatabase.version, backups)
+            return backups
+
+    def setBackupPriority(self, deviceID, priority):
+        """
+        :return: True if the backup is in the database
+        """
+        with self.backupDatabaseLock:
+            return self.backupDatabase.setPriority(deviceID, priority) is not None
+
+    def getKeepaliveReply(self, controlVersion=None):
+        """
+        Area state sent in the reply to a keepalive of a backup
+        :param controlVersion: Version of the replica of the backup
+        :return: dicc {'backups', 'controlInformation'}, backups is None if the replica of the backup is current
+                 (the backups are replicated in the control state)
+        """
+        controlInformation = self.getControlInformation(controlVersion)
+        current = controlVersion is not None and controlVersion == self._controlState.version
+        return {'backups': None if current else self.getBackupList(), 'controlInformation': controlInformation}
+
+    def getControlInformation(self, since=None):
+        """
+        Changes of the area state (topology, backups and policies) since a version known by a backup.
+        The state is refreshed at most once per TIME_KEEPALIVE (the backups as soon as they change) and the
+        changes are serialized once per control version and known version.
+        :param since: Version of the replica of the backup
+        :return: JSON with the changes
+        """
+        with self._controlStateLock:
+            now = monotonic()
+            if self._controlStateRefreshed is None or now - self._controlStateRefreshed >= float(self._lpp.get(self._lpp.TIME_KEEPALIVE)):
+                self.__refreshControlState()
+                self._controlStateRefreshed = now
+            else:
+                self.__refreshControlBackups()
+            version = self._controlState.version
+            cachedVersion, deltas = self._controlInformation
+            if cachedVersion != version or len(deltas) >= self.MAX_CACHED_DELTAS:
+                deltas = {}
+                self._controlInformation = (version, deltas)
+            controlInformation = deltas.get(since)
+            if controlInformation is None:
+                controlInformation = dumps(self._controlState.delta(since))
+                deltas[since] = controlInformation
+            return controlInformation
+
+    def __refreshControlBackups(self):
+        with self.backupDatabaseLock:
+            version = self.backupDatabase.version
+        if version != self._controlBackupsVersion:
+            self._controlState.update(ControlState.SECTION_BACKUPS,
+                                      {backup.get('deviceID'): backup for backup in self.getBackupList()})
+            self._controlBackupsVersion = version
+
+    def __refreshControlState(self):
+        # Devices whose memory/storage changed less than METRICS_DELTA keep the replicated value (and version)
+        ldp = LightDiscoveryPolicies()
+        delta = float(ldp.get(ldp.METRICS_DELTA, default=.0))
+        replicated = self._controlState.section(ControlState.SECTION_TOPOLOGY)
+        topology = {}
+        for device in self.__getCIMIData('topology_info', default=[]):
+            old = replicated.get(device.get('deviceID'))
+            topology[device.get('deviceID')] = old if old is not None and not self.__deviceChanged(old, device, delta) else device
+        self._controlState.update(ControlState.SECTION_TOPOLOGY, topology)
+        self._controlBackupsVersion = None
+        self.__refreshControlBackups()
+        self._controlState.update(ControlState.SECTION_POLICIES, self.__getCIMIData('policies', default={}))
+
+    @staticmethod
+    def __deviceChanged(old, new, delta):
+        """
+        :param old: Replicated device (DeviceInformation dicc)
+        :param new: Current device (DeviceInformation dicc)
+        :param delta: Relative change of mem_avail and stg_avail ignored
+        :return: True if the replicated device must be updated
+        """
+        if old.get('deviceIP') != new.get('deviceIP') or old.get('cpu_cores') != new.get('cpu_cores'):
+            return True
+        return any(abs(new.get(name, .0) - old.get(name, .0)) > delta * abs(old.get(name, .0))
+                   for name in ('mem_avail', 'stg_avail'))
+
+    def __applyControlInformation(self, controlInformation):
+        """
+        Update the replica of the area state with the changes received from the Leader
+        :param controlInformation: JSON with the changes
+        """
+        if controlInformation is None or controlInformation == '':
+            return
+        try:
+            version = self._controlState.apply(loads(controlInformation))
+            LOG.debug(self.TAG + 'Control state replica updated to version {}'.format(version))
+        except (ValueError, TypeError, AttributeError):
+            LOG.exception(self.TAG + 'Control information received from Leader is not valid')
+
+    def getReplicatedTopology(self):
+        """
+        :return: List of the devices (DeviceInformation dicc) of the replicated topology
+        """
+        return list(self._controlState.section(ControlState.SECTION_TOPOLOGY).values())
+
+    def getReplicatedPolicies(self):
+        """
+        :return: Replicated policies (same format than PoliciesDistribution.getPolicies())
+        """
+        return self._controlState.section(ControlState.SECTION_POLICIES)
+
+    def __setPeers(self, peers):
+        with self._peersLock:
+            self._peers = peers
+
     def getBackupDatabase(self):
         with self.backupDatabaseLock:
-            ret = self.backupDatabase.copy()
+            ret = list(self.backupDatabase.entries())
         return ret
 
     def addBackup(self, deviceID, deviceIP, priority):
-        found = False
         with self.backupDatabaseLock:
-            for backup in self.backupDatabase:
-                if backup.deviceID == deviceID:
-                    LOG.debug(self.TAG + 'Backup {} found!'.format(deviceID))
-                    found = True
-                    break
-        if not found:
+            found = deviceID in self.backupDatabase
+        if found:
+            LOG.debug(self.TAG + 'Backup {} found!'.format(deviceID))
+        else:
             correct = self.__send_election_message(deviceIP)
             if correct:
                 new_backup = BackupEntry(deviceID, deviceIP, priority)
-                with self.backupDatabaseLock:
-                    self.backupDatabase.append(new_backup)
+                self.__registerBackup(new_backup)
                 LOG.info('Backup {}[{}] added with priority {}'.format(deviceID, deviceIP, priority))
             return correct
 
+    def __registerBackup(self, backup):
+        """
+        Add a backup to the database and wake up the keeper to schedule its expiration
+        :param backup: BackupEntry
+        :return:
+        """
+        backup.detector = self.__newFailureDetector()
+        with self._keeperCondition:
+            self.backupDatabase.add(backup)
+            self._keeperCondition.notify()
+
+    def __newFailureDetector(self):
+        """
+        :return: Failure detector defined by the FAILURE_DETECTOR policy or None if the fixed timeouts are used
+        """
+        if self._lpp.get(self._lpp.FAILURE_DETECTOR) != self._lpp.FAILURE_DETECTOR_PHI:
+            return None
+        return PhiAccrualFailureDetector(self._lpp.get(self._lpp.PHI_THRESHOLD),
+                                         self._lpp.get(self._lpp.TIME_KEEPALIVE),
+                                         minStdDeviation=self._lpp.get(self._lpp.PHI_MIN_STD_DEVIATION))
+
+    def __leaderSuspected(self, attempt, detector):
+        """
+        :param attempt: Consecutive broken keepalive connections
+        :param detector: Failure detector or None
+        :return: True if the Leader is assumed down
+        """
+        if detector is None:
+            return attempt >= self._lpp.get(self._lpp.MAX_RETRY_ATTEMPTS)
+        return attempt > 0 and not detector.isAvailable()
+
+    def __backupTTL(self):
+        """
+        :return: Time to live of a backup in seconds (MAX_TTL is given in TIME_KEEPER ticks)
+        """
+        return float(self._lpp.get(self._lpp.MAX_TTL)) * float(self._lpp.get(self._lpp.TIME_KEEPER))
+
     def deleteBackup(self, deviceID):
         """
 
@@ -134,18 +493,12 @@ class AreaResilience:
         :return:
         """
         # 1- Get and delete backup from database
-        found = False
         correct = False
         with self.backupDatabaseLock:
-            for backup in self.backupDatabase:
-                if backup.deviceID == deviceID:
-                    LOG.debug(self.TAG + 'Backup {} found!'.format(deviceID))
-                    found = True
-                    break
-        if found:
-            # Backup is in the database, delete him!
-            with self.backupDatabaseLock:
-                self.backupDatabase.remove(backup)
+            backup = self.backupDatabase.remove(deviceID)
+        if backup is not None:
+            # Backup was in the database and now is deleted
+            LOG.debug(self.TAG + 'Backup {} found!'.format(deviceID))
             # And now... Let him know...
             correct = self.__send_demotion_message(backup.deviceIP)
         return correct
@@ -160,6 +513,7 @@ class AreaResilience:
             LOG.warning(self.TAG + 'Procedure is already started...')
             return False
         else:
+            self._wakeup = socket.socketpair()
             self.th_proc = threading.Thread(name='area_res', target=self.__common_flow, daemon=True)
             self.th_proc.start()
             self.isStarted = True
@@ -172,17 +526,24 @@ class AreaResilience:
         :return:
         """
         if self.isStarted:
+            start = monotonic()
             self._connected = False
-            if self.th_proc is not None:
-                while self.th_proc.is_alive():
-                    LOG.debug(self.TAG + 'Waiting {} to resume activity...'.format(self.th_proc.name))
-                    sleep(0.5)
-
-            if self.th_keep is not None:
-                while self.th_keep.is_alive():
-                    LOG.debug(self.TAG + 'Waiting {} to resume activity...'.format(self.th_keep.name))
-                    sleep(0.1)
-            LOG.info(self.TAG + 'All threads stoped. AreaResilience module is stopped.')
+            self._stopEvent.set()
+            with self._keeperCondition:
+                self._keeperCondition.notify_all()
+            try:
+                self._wakeup[1].send(b'\0')
+            except OSError:
+                pass
+            for thread in (self.th_proc, self.th_keep, self.th_hb):
+                if thread is not None and thread is not threading.current_thread() and thread.is_alive():
+                    # Only an in-flight request (bounded by its timeout) can delay the thread
+                    LOG.debug(self.TAG + 'Waiting {} to resume activity...'.format(thread.name))
+                    thread.join()
+            for sock in self._wakeup:
+                sock.close()
+            self.lastStopTime = monotonic() - start
+            LOG.info(self.TAG + 'All threads stoped in {:.3f}s. AreaResilience module is stopped.'.format(self.lastStopTime))
         else:
             LOG.info(self.TAG + 'Module is not started')
         return
@@ -206,8 +567,7 @@ class AreaResilience:
                 return False
             else:
                 LOG.warning('Area Resilience still starting. Cannot promote on this state. Waiting...')
-                while self.th_proc.is_alive():
-                    sleep(0.1)
+                self.th_proc.join()
                 LOG.debug('Successful waiting.')
             LOG.debug('Module is ready for promotion.')
             self.th_proc = threading.Thread(name='area_res', target=self.__backupLeader_flow, daemon=True)
@@ -256,27 +616,19 @@ class AreaResilience:
             return
 
         # Multiple backups support
-        if self._backupPriority > 0:
-            sleep_time = 1. + 10 * (self._backupPriority - 1)
-            LOG.info('Waiting {}s before leader takeover...'.format(sleep_time))
-            sleep(sleep_time)
-            if not self._connected:
-                return
-            LOG.debug('Checking if new Leader is up...')
-            new_leader = self.__getCIMIData('disc_leaderIP', default='')
-            LOG.debug('Stored Leader = [{}], Detected Leader = [{}]'.format(self._leaderIP, new_leader))
-            if new_leader == '' or new_leader == self._leaderIP:
-                LOG.warning('Leader not detected by Discovery')
-            elif self._leaderIP != new_leader:
+        if self._leaderFailed and not self._imLeader and not self.__takeoverClaim():
+            # A backup with more preference is alive, wait until it is the new Leader
+            if self.__waitNewLeader():
                 LOG.info('Correct Leader takeover by a backup with more preference.')
                 try:    # TODO: Clean solution
                     r = requests.get('{}agent'.format(
-                        URLS.build_url_address(URLS.URL_POLICIES_ROLECHANGE, addr='127.0.0.1', port=CPARAMS.POLICIES_PORT)),
+                        URLS.build_url_address(URLS.URL_POLICIES_ROLECHANGE, portaddr=self._selfAddr)),
                         timeout=.5)
                 except:
                     pass
                 finally:
                     return
+            LOG.warning('Leader takeover by a backup with more preference not detected')
 
         if not self._connected:
             return
@@ -285,9 +637,76 @@ class AreaResilience:
             # I'm a leader
             LOG.info(self.TAG + 'Leader seting up')
             self.__becomeLeader()
+            if self._leaderFailed and self._lastLeaderContact is not None:
+                self.lastLeaderlessWindow = monotonic() - self._lastLeaderContact
+                LOG.info(self.TAG + 'Leader takeover done. Leaderless window: {:.3f}s'.format(self.lastLeaderlessWindow))
             self.__backupSelection()
         return
 
+    def __takeoverClaim(self):
+        """
+        Send a takeover claim to the backups with more preference (lower priority) received from the Leader.
+        The claim is won if none of them is alive, so the best-ranked live backup wins in one round-trip.
+        :return: True if this backup must take over, False if a backup with more preference is alive
+        """
+        with self._peersLock:
+            peers = [peer for peer in self._peers if peer.get('deviceID') != self._deviceID and
+                     0 <= peer.get('priority', -1) < self._backupPriority]
+        if len(peers) == 0:
+            LOG.info(self.TAG + 'Takeover claim: No backups with more preference. Taking over...')
+            return True
+        payload = {
+            'deviceID': self._deviceID,
+            'backupPriority': self._backupPriority
+        }
+        with ThreadPoolExecutor(max_workers=len(peers), thread_name_prefix='ar_claim') as executor:
+            futures = [executor.submit(self.__send_takeover_claim, peer.get('deviceIP'), payload) for peer in peers]
+            for future, peer in zip(futures, peers):
+                reply = future.result()
+                if reply is not None and (reply.get('imLeader') or
+                                          (reply.get('imBackup') and 0 <= reply.get('backupPriority', -1) < self._backupPriority)):
+                    LOG.info(self.TAG + 'Takeover claim: Backup {}[{}] with priority {} is alive'.format(
+                        peer.get('deviceID'), peer.get('deviceIP'), reply.get('backupPriority')))
+                    self._takeoverWinnerIP = peer.get('deviceIP')
+                    return False
+        LOG.info(self.TAG + 'Takeover claim: Backups with more preference are down. Taking over...')
+        return True
+
+    def __waitNewLeader(self):
+        """
+        Wait (up to TAKEOVER_TIMEOUT) until the backup that won the takeover is the new Leader
+        :return: True if the new Leader is detected, False otherwise
+        """
+        deadline = monotonic() + float(self._lpp.get(self._lpp.TAKEOVER_TIMEOUT))
+        while self._connected and monotonic() < deadline:
+            new_leader = self.__getCIMIData('disc_leaderIP', default='')
+            LOG.debug('Stored Leader = [{}], Detected Leader = [{}]'.format(self._leaderIP, new_leader))
+            if new_leader != '' and new_leader != self._leaderIP:
+                return True
+            try:
+                r = requests.get(URLS.build_url_address(URLS.URL_POLICIES_LEADERINFO, addr=self._takeoverWinnerIP, port=CPARAMS.POLICIES_PORT), timeout=.5)
+                if r.status_code == 200 and r.json().get('imLeader'):
+                    return True
+            except:
+                LOG.debug('Backup with more preference [{}] not reachable'.format(self._takeoverWinnerIP))
+            self._stopEvent.wait(min(float(self._lpp.get(self._lpp.TIME_KEEPALIVE)), max(.0, deadline - monotonic())))
+        return False
+
+    def receive_takeover_claim(self, deviceID, priority):
+        """
+        Takeover claim received from a backup that detected the Leader failure
+        :param deviceID: ID of the backup
+        :param priority: Priority of the backup
+        :return: dicc with the role and priority of this agent
+        """
+        LOG.debug(self.TAG + 'Takeover claim received from {} with priority {}'.format(deviceID, priority))
+        return {
+            'deviceID': self._deviceID,
+            'backupPriority': self._backupPriority,
+            'imLeader': self._imLeader,
+            'imBackup': self._imBackup
+        }
+
     def __becomeLeader(self):  # TODO
         """
 
@@ -297,7 +716,7 @@ class AreaResilience:
         if self._leaderFailed:
             # Only if leader fails, triggers are needed, otherwise no action is required
             try:
-                r = requests.get(URLS.build_url_address('{}leader'.format(URLS.URL_POLICIES_ROLECHANGE), portaddr=('127.0.0.1', '46050'))) #TODO Addr+Prt by CPARAMS; Parametrize
+                r = requests.get(URLS.build_url_address('{}leader'.format(URLS.URL_POLICIES_ROLECHANGE), portaddr=self._selfAddr))
                 LOG.info(self.TAG + 'Trigger to AgentStart Switch done. {}'.format(r.json()))
                 self._imLeader = True
                 self._imBackup = False
@@ -305,13 +724,9 @@ class AreaResilience:
                 LOG.exception(self.TAG + '_becomeLeader trigger to AgentStart failed')
         self.th_keep = threading.Thread(name='ar_keeper', target=self.__keeper, daemon=True)
         self.th_keep.start()
-
-    def __getTopology(self):  # TODO: Get actual CIMI data or Topology from environment
-        """
-
-        :return:
-        """
-        return self.__getCIMIData('topology', default=[]).copy()
+        if self._lpp.get(self._lpp.HEARTBEAT_MODE) == self._lpp.HEARTBEAT_MODE_UDP:
+            self.th_hb = threading.Thread(name='ar_heartbeat', target=self.__heartbeatLeader, daemon=True)
+            self.th_hb.start()
 
     def __backupSelection(self):
         """
@@ -329,55 +744,125 @@ class AreaResilience:
         # Success: Correct_backups++
         # Go to 2
 
+        deficit_since = None
         while self._connected:
-            correct_backups = 0
             with self.backupDatabaseLock:
-                # Check backups
-                for backup in self.backupDatabase:
-                    if backup.TTL >= 0:
-                        correct_backups += 1
+                # Check backups (the keeper removes the expired ones)
+                correct_backups = len(self.backupDatabase)
+            backup_minimum = self._lpp.get(self._lpp.BACKUP_MINIMUM, default=1)
             # Enough?
-            if correct_backups >= self._lpp.get(self._lpp.BACKUP_MINIMUM, default=1):
+            if correct_backups >= backup_minimum:
                 # Enough backups
                 LOG.debug('{} correct backup detected in Leader. Everything is OK.'.format(correct_backups))
             else:
                 # Not enough
                 if not self._connected:
                     break
+                if deficit_since is None:
+                    deficit_since = monotonic()
                 LOG.warning('{} backup dettected are not enough. Electing new ones...'.format(correct_backups))
-                topology = self.__getTopology()
-                new_backups = []
-                while self._connected and correct_backups < self._lpp.get(self._lpp.BACKUP_MINIMUM, default=1) and len(topology) > 0:
-                    device = topology[0]
-                    topology.remove(device)
-                    found = False
-                    with self.backupDatabaseLock:
-                        for backup in self.backupDatabase:
-                            if backup.deviceID == device.get('deviceID'):
-                                found = True
-                                break
-                    if not found:
-                        # Todo: Evaluate if selected device is capable
-                        correct = self.__send_election_message(device.get('deviceIP'))
-                        if correct:
-                            new_backup = BackupEntry(device.get('deviceID'), device.get('deviceIP'), self._nextPriority)
-                            with self.backupDatabaseLock:
-                                self.backupDatabase.append(new_backup)
-                            LOG.info('Backup {}[{}] added with priority {}'.format(device.get('deviceID'), device.get('deviceIP'), self._nextPriority))
-                            correct_backups += 1
-                            self._nextPriority += 1
-                            new_backups.append(new_backups)
-
-                if correct_backups >= self._lpp.get(self._lpp.BACKUP_MINIMUM, default=1):
+                rejected = []
+                new_backups = self.__electBackups(self.__backupCandidates(rejected), backup_minimum - correct_backups, rejected)
+                # Ranked again after the election (not offered twice in the same one)
+                for device in rejected:
+                    self.__restoreCandidate(device)
+                correct_backups += len(new_backups)
+
+                if correct_backups >= backup_minimum:
                     # Now we have enough
                     LOG.info('{} correct backups dettected in Leader. {} new backups added.'.format(correct_backups, len(new_backups)))
                 else:
                     LOG.warning('{} backups dettected are not enough. Waiting for new election.'.format(correct_backups))
-            # Sleep
-            if self._connected:
-                sleep(self._lpp.get(self._lpp.TIME_TO_WAIT_BACKUP_SELECTION))
+            if deficit_since is not None and correct_backups >= backup_minimum:
+                self.lastProtectionRestoreTime = monotonic() - deficit_since
+                deficit_since = None
+                LOG.info(self.TAG + 'Area protection restored in {:.3f}s'.format(self.lastProtectionRestoreTime))
+            # Sleep (interrupted on stop)
+            self._stopEvent.wait(self._lpp.get(self._lpp.TIME_TO_WAIT_BACKUP_SELECTION))
         LOG.info('Leader stopped...')
 
+    def __backupCandidates(self, skipped):
+        """
+        Capable devices that are not backups, best ranked first (capability candidate index of the topology)
+        :param skipped: List where the candidates that are already backups are added
+        :return: generator of devices ({'deviceID', 'deviceIP'})
+        """
+        while self._connected:
+            device = self.__getCIMIData('backup_candidate', default=None)
+            if device is None:
+                return
+            with self.backupDatabaseLock:
+                found = device.get('deviceID') in self.backupDatabase
+            if not found:
+                yield device
+            else:
+                skipped.append(device)
+
+    def __restoreCandidate(self, device):
+        """
+        Return a device that did not become Backup to the candidate index
+        :param device: dicc {'deviceID', 'deviceIP'}
+        """
+        restore = self.__getCIMIData('restore_candidate', default=None)
+        if restore is not None:
+            restore(device.get('deviceID'))
+
+    def __electBackups(self, candidates, needed, rejected):
+        """
+        Send election messages to several candidates at once (at most MAX_PARALLEL_ELECTIONS in flight) until
+        the required number of backups accepts. Acceptances received after that are demoted.
+        :param candidates: Iterable of devices ({'deviceID', 'deviceIP'}) ordered by preference
+        :param needed: Number of new backups required
+        :param rejected: List where the candidates that failed the election are added
+        :return: List of the new BackupEntry
+        """
+        new_backups = []
+        if needed <= 0:
+            return new_backups
+        workers = max(1, int(self._lpp.get(self._lpp.MAX_PARALLEL_ELECTIONS, default=1)))
+        candidates = iter(candidates)
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ar_elect')
+
+        def submit_next():
+            device = next(candidates, None)
+            if device is not None:
+                pending[executor.submit(self.__send_election_message, device.get('deviceIP'))] = device
+
+        def demote_extra(future, device):
+            if not future.cancelled() and future.result():
+                # Enough backups already elected, cancel this one
+                LOG.debug('Extra backup {}[{}] accepted the election. Demoting...'.format(device.get('deviceID'), device.get('deviceIP')))
+                self.__send_demotion_message(device.get('deviceIP'))
+            self.__restoreCandidate(device)
+
+        for _ in range(workers):
+            submit_next()
+        while pending and self._connected and len(new_backups) < needed:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                device = pending.pop(future)
+                if not future.result():
+                    rejected.append(device)
+                elif self._connected and len(new_backups) < needed:
+                    new_backup = BackupEntry(device.get('deviceID'), device.get('deviceIP'), self._nextPriority)
+                    self.__registerBackup(new_backup)
+                    LOG.info('Backup {}[{}] added with priority {}'.format(new_backup.deviceID, new_backup.deviceIP, new_backup.priority))
+                    self._nextPriority += 1
+                    new_backups.append(new_backup)
+                else:
+                    demote_extra(future, device)
+                if self._connected and len(new_backups) < needed:
+                    submit_next()
+        # Do not wait for the slow candidates: demote them if they accept later
+        for future, device in pending.items():
+            if future.cancel():
+                rejected.append(device)
+            else:
+                future.add_done_callback(lambda f, d=device: demote_extra(f, d))
+        executor.shutdown(wait=False)
+        return new_backups
+
     def __preSelectionSetup(self):
         """
 
@@ -408,13 +893,27 @@ class AreaResilience:
         payload = {
             'deviceID': self._deviceID
         }
+        url = URLS.build_url_address(URLS.URL_POLICIES_KEEPALIVE, portaddr=(self._leaderIP, CPARAMS.POLICIES_PORT))
         self._imBackup = True
-        while self._connected and attempt < self._lpp.get(self._lpp.MAX_RETRY_ATTEMPTS):
+        if self._lpp.get(self._lpp.HEARTBEAT_MODE) == self._lpp.HEARTBEAT_MODE_UDP:
+            # Heartbeats pushed by the Leader. The REST keepalive is used as fallback or to confirm the Leader failure
+            if self.__heartbeatBackup():
+                LOG.warning(self.TAG + 'Heartbeats from Leader lost. Checking Leader with REST keepalive...')
+            elif self._connected:
+                LOG.warning(self.TAG + 'No heartbeats received from Leader. Using REST keepalive.')
+        session = self.__keepaliveSession()
+        detector = self.__newFailureDetector()
+        if detector is not None:
+            detector.heartbeat()    # The Leader has just contacted this backup
+        while self._connected and not self.__leaderSuspected(attempt, detector):
             stopLoop = False
             while self._connected and not stopLoop:
                 try:
-                    # 1. Requests to Leader Keepalive endpoint
-                    r = requests.post(URLS.build_url_address(URLS.URL_POLICIES_KEEPALIVE, portaddr=(self._leaderIP, CPARAMS.POLICIES_PORT)), json=payload, timeout=0.5)
+                    # 1. Requests to Leader Keepalive endpoint (persistent connection)
+                    payload['controlVersion'] = self._controlState.version
+                    start = monotonic()
+                    r = session.post(url, json=payload, timeout=0.5)
+                    self._keepaliveRTT.append(monotonic() - start)
                     LOG.debug(self.TAG + 'Keepalive sent [#{}]'.format(counter))
                     # 2. Process Reply
                     jreply = r.json()
@@ -425,6 +924,12 @@ class AreaResilience:
                         self._backupPriority = priority
                         LOG.debug(self.TAG + 'Reply received, Leader still alive: LeaderID: {}'.format(leaderID))
                         attempt = 0
+                        self._lastLeaderContact = monotonic()
+                        if 'backups' in jreply and jreply['backups'] is not None:
+                            self.__setPeers(jreply['backups'])
+                        self.__applyControlInformation(jreply.get('controlInformation'))
+                        if detector is not None:
+                            detector.heartbeat()
                     else:
                         # Error?
                         LOG.error('KeepAlive status_code = {}'.format(r.status_code))
@@ -438,47 +943,212 @@ class AreaResilience:
 
                     if not stopLoop:
                         # 4. Sleep
-                        sleep(self._lpp.get(self._lpp.TIME_KEEPALIVE))
+                        self._stopEvent.wait(self._lpp.get(self._lpp.TIME_KEEPALIVE))
                     counter += 1
                 except:
                     # Connection broke, backup assumes that Leader is down.
                     LOG.debug('Keepalive connection refused')
                     stopLoop = True
-            LOG.warning('Keepalive connection is broken... Retry Attempts: {}'.format(self._lpp.get(self._lpp.MAX_RETRY_ATTEMPTS)-(attempt+1)))
+                    # Next attempt starts with a new connection
+                    session.close()
+                    session = self.__keepaliveSession()
+                    self._keepaliveReconnections += 1
+            if detector is None:
+                LOG.warning('Keepalive connection is broken... Retry Attempts: {}'.format(self._lpp.get(self._lpp.MAX_RETRY_ATTEMPTS)-(attempt+1)))
+            else:
+                LOG.warning('Keepalive connection is broken... Leader suspicion level (phi): {:.2f}'.format(detector.phi()))
             attempt += 1
+            if detector is not None and self._connected:
+                # Retry until the suspicion level reaches the threshold
+                self._stopEvent.wait(min(float(self._lpp.get(self._lpp.TIME_KEEPALIVE)), max(.0, detector.expiryTime() - monotonic())))
+        session.close()
 
         if not self._connected:
             LOG.info('Backup stopped.')
         else:
             LOG.warning(self.TAG + '## LEADER IS DOWN! ##')
+            if self._lastLeaderContact is not None:
+                self.lastFailureDetectionTime = monotonic() - self._lastLeaderContact
+                LOG.info(self.TAG + 'Leader failure detected {:.3f}s after the last contact'.format(self.lastFailureDetectionTime))
         self._leaderFailed = True
         return
 
+    def __heartbeatGroup(self):
+        """
+        :return: Multicast group or broadcast address for the heartbeats
+        """
+        group = self._lpp.get(self._lpp.HEARTBEAT_GROUP)
+        if group is None or group == '':
+            group = CPARAMS.BROADCAST_ADDR_FLAG if CPARAMS.BROADCAST_ADDR_FLAG != '' else '<broadcast>'
+        return group
+
+    def __heartbeatLeader(self):
+        """
+        Leader thread that sends a sequence-numbered heartbeat with the backup priorities every TIME_KEEPALIVE
+        and receives the acknowledgements of the backups (equivalent to a REST keepalive).
+        :return:
+        """
+        group = self.__heartbeatGroup()
+        try:
+            sock = heartbeat.create_socket(CPARAMS.HEARTBEAT_PORT, group)
+        except:
+            LOG.exception(self.TAG + 'Heartbeat socket cannot be created. Only REST keepalive is available.')
+            return
+        LOG.debug(self.TAG + 'Sending heartbeats to [{}:{}]'.format(group, CPARAMS.HEARTBEAT_PORT))
+        seq = 0
+        next_beat = monotonic()
+        while self._connected:
+            interval = float(self._lpp.get(self._lpp.TIME_KEEPALIVE))
+            now = monotonic()
+            if now >= next_beat:
+                with self.backupDatabaseLock:
+                    backups = [(backup.deviceID, backup.deviceIP, backup.priority) for backup in self.backupDatabase.entries()]
+                try:
+                    sock.sendto(heartbeat.pack_heartbeat(seq, self._deviceID, backups, self._controlState.version), (group, CPARAMS.HEARTBEAT_PORT))
+                except OSError:
+                    LOG.exception(self.TAG + 'Error sending heartbeat #{}'.format(seq))
+                seq += 1
+                next_beat = max(next_beat + interval, now)
+            if not self.__waitReadable(sock, max(.001, next_beat - monotonic())):
+                continue
+            try:
+                data, addr = sock.recvfrom(heartbeat.MAX_DATAGRAM)
+            except OSError:
+                LOG.exception(self.TAG + 'Error receiving heartbeat acknowledgement')
+                continue
+            msg = heartbeat.unpack(data)
+            if isinstance(msg, heartbeat.HeartbeatAck):
+                self.receive_keepalive(msg.deviceID)
+        sock.close()
+        LOG.info(self.TAG + 'Heartbeat thread stopped')
+
+    def __heartbeatBackup(self):
+        """
+        Receive the heartbeats of the Leader and acknowledge them. The Leader is assumed down after
+        MAX_RETRY_ATTEMPTS consecutive missing heartbeats (or when the failure detector suspects it).
+        :return: True if heartbeats were received from the Leader, False otherwise
+        """
+        try:
+            sock = heartbeat.create_socket(CPARAMS.HEARTBEAT_PORT, self.__heartbeatGroup())
+        except:
+            LOG.exception(self.TAG + 'Heartbeat socket cannot be created.')
+            return False
+        received = False
+        last_seq = None
+        last_rx = monotonic()
+        detector = self.__newFailureDetector()
+        if detector is not None:
+            detector.heartbeat(last_rx)
+        while self._connected:
+            interval = float(self._lpp.get(self._lpp.TIME_KEEPALIVE))
+            if detector is None:
+                if monotonic() - last_rx >= interval * self._lpp.get(self._lpp.MAX_RETRY_ATTEMPTS):
+                    break
+                wait_time = interval
+            else:
+                if not detector.isAvailable():
+                    break
+                wait_time = min(interval, max(.001, detector.expiryTime() - monotonic()))
+            if not self.__waitReadable(sock, wait_time):
+                continue
+            try:
+                data, addr = sock.recvfrom(heartbeat.MAX_DATAGRAM)
+            except OSError:
+                LOG.exception(self.TAG + 'Error receiving heartbeat')
+                continue
+            msg = heartbeat.unpack(data)
+            if not isinstance(msg, heartbeat.Heartbeat) or addr[0] != self._leaderIP:
+                continue
+            if last_seq is not None and msg.seq != (last_seq + 1) & 0xFFFFFFFF:
+                lost = (msg.seq - last_seq - 1) & 0xFFFFFFFF
+                self._heartbeatsLost += lost
+                LOG.debug(self.TAG + '{} heartbeats lost before #{}'.format(lost, msg.seq))
+            last_seq = msg.seq
+            last_rx = monotonic()
+            received = True
+            self._lastLeaderContact = last_rx
+            self.__setPeers([{'deviceID': deviceID, 'deviceIP': deviceIP, 'priority': priority}
+                             for deviceID, (deviceIP, priority) in msg.backups.items()])
+            if detector is not None:
+                detector.heartbeat(last_rx)
+            backup = msg.backups.get(self._deviceID)
+            if backup is not None:
+                self._backupPriority = backup[1]
+                LOG.debug(self.TAG + 'Heartbeat #{} received, Leader still alive: LeaderID: {}'.format(msg.seq, msg.leaderID))
+            else:
+                LOG.debug(self.TAG + 'Heartbeat #{} received but Backup is not registered in the Leader'.format(msg.seq))
+            try:
+                sock.sendto(heartbeat.pack_ack(msg.seq, self._deviceID), (addr[0], CPARAMS.HEARTBEAT_PORT))
+            except OSError:
+                LOG.exception(self.TAG + 'Error sending heartbeat acknowledgement')
+            if msg.controlVersion != self._controlState.version:
+                self.__syncControlState()
+        sock.close()
+        return received
+
+    def __waitReadable(self, sock, timeout):
+        """
+        Wait until a datagram is received or the module is stopped
+        :param sock: UDP socket
+        :param timeout: Max seconds to wait
+        :return: True if sock can be read, False on timeout or stop
+        """
+        try:
+            readable, _, _ = select.select([sock, self._wakeup[0]], [], [], timeout)
+        except (OSError, ValueError):
+            return False
+        return self._connected and sock in readable
+
+    def __syncControlState(self):
+        """
+        Get the changes of the area state with a REST keepalive (used when the UDP heartbeat announces a new version)
+        """
+        payload = {
+            'deviceID': self._deviceID,
+            'controlVersion': self._controlState.version
+        }
+        try:
+            r = requests.post(URLS.build_url_address(URLS.URL_POLICIES_KEEPALIVE, portaddr=(self._leaderIP, CPARAMS.POLICIES_PORT)), json=payload, timeout=0.5)
+            if r.status_code == 200:
+                self.__applyControlInformation(r.json().get('controlInformation'))
+        except:
+            LOG.debug(self.TAG + 'Control state synchronization with Leader failed')
+
+    @staticmethod
+    def __keepaliveSession():
+        """
+        HTTP session for the keepalive messages. Only one persistent (keep-alive) connection to the Leader is kept,
+        a dropped connection is detected and reopened by the pool before sending.
+        :return: requests.Session
+        """
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+        return session
+
     def __keeper(self):
         """
-        Thread that reduces the TTL of a backup and demotes if TTL <= 0
+        Thread that demotes the backups when their keepalive deadline expires.
+        The thread sleeps until the earliest deadline (or until a new backup is added) and the demotion messages
+        are sent without holding the database lock.
         :return:
         """
         LOG.debug('Keeper is running')
         with self.backupDatabaseLock:
-            self.backupDatabase = []    # Restart database
+            self.backupDatabase.clear()    # Restart database
         while self._connected:
-            with self.backupDatabaseLock:
-                for backup in self.backupDatabase:
-                    # Reduce TTL
-                    backup.TTL -= 1
-                    if backup.TTL < 0:
-                        # Backup is down
-                        LOG.warning('Backup {}[{}] is DOWN with TTL: {}'.format(backup.deviceID, backup.deviceIP, backup.TTL))
-                        self.__send_demotion_message(backup.deviceIP)
-                        # Remove from list
-                        self.backupDatabase.remove(backup)  # TODO: Inform CIMI?
-                        LOG.debug('Backup removed from database.')
-                    else:
-                        # Backup is ok
-                        LOG.debug('Backup {}[{}] is OK with TTL: {}'.format(backup.deviceID, backup.deviceIP, backup.TTL))
-            if self._connected:
-                sleep(self._lpp.get(self._lpp.TIME_KEEPER))
+            with self._keeperCondition:
+                expired = self.backupDatabase.popExpired(monotonic())
+                if not expired:
+                    next_deadline = self.backupDatabase.nextDeadline()
+                    timeout = None if next_deadline is None else max(.0, next_deadline - monotonic())
+                    if self._connected:
+                        self._keeperCondition.wait(timeout)
+                    continue
+            for backup in expired:
+                # Backup is down
+                LOG.warning('Backup {}[{}] is DOWN. Keepalive deadline expired.'.format(backup.deviceID, backup.deviceIP))
+                self.__send_demotion_message(backup.deviceIP)   # TODO: Inform CIMI?
+                LOG.debug('Backup removed from database.')
         LOG.warning('Keeper thread stopped')
 
     def __send_election_message(self, address):
@@ -502,6 +1172,21 @@ class AreaResilience:
             LOG.exception('Selected device [{}] cannot become Backup due error in election message'.format(address))
             return False
 
+    def __send_takeover_claim(self, address, payload):
+        """
+        :param address: IP address of the backup
+        :param payload: Takeover claim
+        :return: Reply of the backup (dicc) or None if not reachable
+        """
+        try:
+            r = requests.post(URLS.build_url_address(URLS.URL_POLICIES_TAKEOVER, addr=address, port=CPARAMS.POLICIES_PORT), json=payload, timeout=.5)
+            if r.status_code == 200:
+                return r.json()
+            LOG.debug('Takeover claim to [{}] received status code {}'.format(address, r.status_code))
+        except:
+            LOG.debug('Takeover claim to [{}] not delivered'.format(address))
+        return None
+
     def __send_demotion_message(self, address):
         """
         Demote a backup to normal agent
@@ -526,14 +1211,20 @@ class AreaResilience:
             return False
 
     def receive_keepalive(self, deviceID):
+        now = monotonic()
         with self.backupDatabaseLock:
-            for backup in self.backupDatabase:
-                if backup.deviceID == deviceID:
-                    # It's a match
-                    backup.TTL = int(self._lpp.get(self._lpp.MAX_TTL))
-                    LOG.debug(
-                        'backupID: {}; backupIP: {}; priority: {}; Keepalive received correctly'.format(backup.deviceID,
-                                                                                                        backup.deviceIP,
-                                                                                                        backup.priority))
-                    return True, backup.priority
-        return False, self.PRIORITY_ON_DEMOTION
+            backup = self.backupDatabase.get(deviceID)
+            if backup is None:
+                return False, self.PRIORITY_ON_DEMOTION
+            # It's a match
+            if backup.detector is not None:
+                backup.detector.heartbeat(now)
+                deadline = backup.detector.expiryTime()
+            else:
+                deadline = now + self.__backupTTL()
+            self.backupDatabase.refresh(deviceID, deadline)
+            priority = backup.priority
+        LOG.debug('backupID: {}; backupIP: {}; priority: {}; Keepalive received correctly'.format(backup.deviceID,
+                                                                                                 backup.deviceIP,
+                                                                                                 priority))
+        return True, priority
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Area Resilience - Failure Detectors
+
+    Phi Accrual Failure Detector (Hayashibara et al.), the suspicion level (phi) is computed from the
+    statistics of the heartbeat inter-arrival times. A process is suspected when phi >= threshold.
+"""
+
+from collections import deque
+from math import exp, log, log10
+from time import monotonic
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def _phi(y):
+    """
+    Logistic approximation of -log10(1 - CDF(y)) of the normal distribution
+    :param y: (elapsed - mean) / std_deviation
+    :return: phi
+    """
+    a = y * (1.5976 + 0.070566 * y * y)
+    if y > 0:
+        # -log10(e / (1 + e)) with e = exp(-a), without the underflow of e after a long silence
+        return a / log(10.) + log10(1. + exp(-a))
+    e = exp(min(-a, 700.))  # Not overflowed, phi is 0 anyway
+    return -log10(1. - 1. / (1. + e))
+
+
+def _inverse_phi(threshold):
+    """
+    Inverse of _phi() (bisection, _phi is monotonic)
+    :param threshold: phi
+    :return: y such that _phi(y) = threshold
+    """
+    low, high = -10., 40.
+    for _ in range(60):
+        mid = (low + high) / 2.
+        if _phi(mid) < threshold:
+            low = mid
+        else:
+            high = mid
+    return high
+
+
+class PhiAccrualFailureDetector:
+    __slots__ = ('threshold', 'minStdDeviation', 'acceptablePause', '_intervals', '_sum', '_squares', '_last', '_y')
+
+    WINDOW_SIZE = 100
+
+    def __init__(self, threshold, expectedInterval, minStdDeviation=.1, acceptablePause=.0):
+        """
+        :param threshold: Suspicion level (phi) to consider the monitored process down
+        :param expectedInterval: Expected time between heartbeats (used until real samples are received)
+        :param minStdDeviation: Minimum standard deviation of the inter-arrival times (seconds)
+        :param acceptablePause: Extra time added to the mean inter-arrival time (seconds)
+        """
+        self.threshold = float(threshold)
+        self.minStdDeviation = float(minStdDeviation)
+        self.acceptablePause = float(acceptablePause)
+        self._intervals = deque(maxlen=self.WINDOW_SIZE)
+        self._sum = .0
+        self._squares = .0
+        self._last = None
+        self._y = _inverse_phi(self.threshold)
+        # Bootstrap the statistics with the expected interval
+        self.__add(float(expectedInterval) - float(expectedInterval) / 4.)
+        self.__add(float(expectedInterval) + float(expectedInterval) / 4.)
+
+    def __add(self, interval):
+        if len(self._intervals) == self._intervals.maxlen:
+            old = self._intervals.popleft()
+            self._sum -= old
+            self._squares -= old * old
+        self._intervals.append(interval)
+        self._sum += interval
+        self._squares += interval * interval
+
+    def __stats(self):
+        n = len(self._intervals)
+        mean = self._sum / n
+        variance = max(.0, self._squares / n - mean * mean)
+        return mean + self.acceptablePause, max(self.minStdDeviation, variance ** .5)
+
+    def heartbeat(self, now=None):
+        """
+        Register the arrival of a heartbeat
+        :param now: Arrival time (time.monotonic() reference)
+        """
+        now = monotonic() if now is None else now
+        if self._last is not None:
+            self.__add(now - self._last)
+        self._last = now
+
+    def phi(self, now=None):
+        """
+        :param now: time.monotonic() reference
+        :return: Current suspicion level
+        """
+        if self._last is None:
+            return .0
+        now = monotonic() if now is None else now
+        mean, std = self.__stats()
+        return _phi((now - self._last - mean) / std)
+
+    def isAvailable(self, now=None):
+        return self.phi(now) < self.threshold
+
+    def expiryTime(self):
+        """
+        :return: time.monotonic() reference when phi reaches the threshold if no more heartbeats are received
+        """
+        last = monotonic() if self._last is None else self._last
+        mean, std = self.__stats()
+        return last + mean + self._y * std
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Area Resilience - UDP Heartbeat messages
+
+    Leader -> Backups (multicast/broadcast):
+        | magic (4s) | version (B) | type (B) | seq (I) | leaderID len (B) | leaderID | control version (I) | n (H) | n * [len (B) | deviceID | deviceIP (4s) | priority (i)] |
+    Backup -> Leader (unicast):
+        | magic (4s) | version (B) | type (B) | seq (I) | deviceID len (B) | deviceID |
+"""
+
+import socket
+import struct
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+MAGIC = b'CRMH'
+VERSION = 2     # 2: 32-bit priorities (never reset by the Leader)
+TYPE_HEARTBEAT = 1
+TYPE_ACK = 2
+
+MAX_DATAGRAM = 1400     # Avoid IP fragmentation
+
+_HEADER = struct.Struct('!4sBBI')
+_COUNT = struct.Struct('!H')
+_CONTROL_VERSION = struct.Struct('!I')
+_PRIORITY = struct.Struct('!i')
+_PRIORITY_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+class Heartbeat:
+    __slots__ = ('seq', 'leaderID', 'backups', 'controlVersion')
+
+    def __init__(self, seq, leaderID, backups, controlVersion=0):
+        self.seq = seq
+        self.leaderID = leaderID
+        self.backups = backups  # {deviceID: (deviceIP, priority)}
+        self.controlVersion = controlVersion
+
+
+class HeartbeatAck:
+    __slots__ = ('seq', 'deviceID')
+
+    def __init__(self, seq, deviceID):
+        self.seq = seq
+        self.deviceID = deviceID
+
+
+def _pack_str(value):
+    bvalue = str(value).encode()[:255]
+    return bytes((len(bvalue),)) + bvalue
+
+
+def _unpack_str(data, offset):
+    length = data[offset]
+    offset += 1
+    return data[offset:offset + length].decode(), offset + length
+
+
+def pack_heartbeat(seq, leaderID, backups, controlVersion=0):
+    """
+    Build a heartbeat datagram
+    :param seq: Sequence number
+    :param leaderID: ID of the Leader
+    :param backups: List of (deviceID, deviceIP, priority)
+    :param controlVersion: Version of the control state of the Leader
+    :return: bytes
+    """
+    data = _HEADER.pack(MAGIC, VERSION, TYPE_HEARTBEAT, seq & 0xFFFFFFFF) + _pack_str(leaderID) + \
+        _CONTROL_VERSION.pack(controlVersion & 0xFFFFFFFF)
+    body = b''
+    n = 0
+    for deviceID, deviceIP, priority in backups:
+        try:
+            bIP = socket.inet_aton(deviceIP)
+        except (OSError, TypeError):
+            bIP = bytes(4)
+        item = _pack_str(deviceID) + bIP + _PRIORITY.pack(max(_PRIORITY_RANGE[0], min(_PRIORITY_RANGE[1], int(priority))))
+        if len(data) + _COUNT.size + len(body) + len(item) > MAX_DATAGRAM:
+            break
+        body += item
+        n += 1
+    return data + _COUNT.pack(n) + body
+
+
+def pack_ack(seq, deviceID):
+    """
+    Build an acknowledgement datagram
+    :param seq: Sequence number of the acknowledged heartbeat
+    :param deviceID: ID of the Backup
+    :return: bytes
+    """
+    return _HEADER.pack(MAGIC, VERSION, TYPE_ACK, seq & 0xFFFFFFFF) + _pack_str(deviceID)
+
+
+def unpack(data):
+    """
+    Decode a heartbeat or an acknowledgement datagram
+    :param data: bytes received
+    :return: Heartbeat, HeartbeatAck or None if the datagram is not valid
+    """
+    try:
+        magic, version, mtype, seq = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        ID, offset = _unpack_str(data, _HEADER.size)
+        if mtype == TYPE_ACK:
+            return HeartbeatAck(seq, ID)
+        elif mtype == TYPE_HEARTBEAT:
+            controlVersion, = _CONTROL_VERSION.unpack_from(data, offset)
+            offset += _CONTROL_VERSION.size
+            n, = _COUNT.unpack_from(data, offset)
+            offset += _COUNT.size
+            backups = {}
+            for _ in range(n):
+                deviceID, offset = _unpack_str(data, offset)
+                deviceIP = socket.inet_ntoa(data[offset:offset + 4])
+                offset += 4
+                priority, = _PRIORITY.unpack_from(data, offset)
+                offset += _PRIORITY.size
+                backups[deviceID] = (deviceIP, priority)
+            return Heartbeat(seq, ID, backups, controlVersion)
+        return None
+    except (struct.error, IndexError, UnicodeDecodeError, OSError):
+        return None
+
+
+def is_multicast(address):
+    try:
+        return 224 <= int(str(address).split('.')[0]) <= 239
+    except ValueError:
+        return False
+
+
+def create_socket(port, group=None):
+    """
+    UDP socket bound to the heartbeat port (multicast group joined if needed)
+    :param port: Heartbeat port
+    :param group: Multicast group or broadcast address
+    :return: socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(('0.0.0.0', port))
+    if group is not None and is_multicast(group):
+        mreq = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
@@ -42,7 +42,7 @@ class LeaderReelection:
         else:
             LOG.info('Device {} is an active backup.'.format(deviceID))
             # 2. Change preference to 0
-            backup.priority = arearesilience.PRIORITY_ON_REELECTION
+            arearesilience.setBackupPriority(deviceID, arearesilience.PRIORITY_ON_REELECTION)
 
         # 0.3 Change Policy of MINIMUM_BACKUPS
         payload = {'LPP':dumps({'BACKUP_MINIMUM':1})}
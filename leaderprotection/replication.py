@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Area Resilience - Control State Replication
+
+    Versioned copy of the area state (topology, backups and policies). The Leader keeps the master copy and sends
+    the changes since the version known by each backup in the keepalive replies. Each backup keeps a warm replica
+    ready to be used if it takes over.
+"""
+
+from collections import OrderedDict, deque
+from threading import Lock
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class ControlState:
+    SECTION_TOPOLOGY = 'topology'
+    SECTION_BACKUPS = 'backups'
+    SECTION_POLICIES = 'policies'
+
+    MAX_TOMBSTONES = 1024
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = 0
+        self._minVersion = 0    # Deltas since an older version require a full copy (tombstones pruned)
+        self._sections = {}     # section -> {key: value}
+        self._changes = OrderedDict()   # (section, key) -> version, ordered by version (tombstones included)
+        self._tombstones = deque()      # (version, section, key)
+
+    @property
+    def version(self):
+        return self._version
+
+    def __set(self, section, key, value):
+        self._sections.setdefault(section, {})[key] = value
+        self._changes.pop((section, key), None)
+        self._changes[(section, key)] = self._version
+
+    def __remove(self, section, key):
+        del self._sections[section][key]
+        self._changes.pop((section, key), None)
+        self._changes[(section, key)] = self._version
+        self._tombstones.append((self._version, section, key))
+        while len(self._tombstones) > self.MAX_TOMBSTONES:
+            version, tsection, tkey = self._tombstones.popleft()
+            if self._changes.get((tsection, tkey)) == version and tkey not in self._sections.get(tsection, {}):
+                del self._changes[(tsection, tkey)]
+            self._minVersion = max(self._minVersion, version)
+
+    def update(self, section, values):
+        """
+        Replace the content of a section, only the modified keys get a new version
+        :param section: Name of the section
+        :param values: dicc with the new content of the section (values must be JSON serializable)
+        :return: Current version
+        """
+        with self._lock:
+            current = self._sections.get(section, {})
+            changed = [key for key, value in values.items() if current.get(key, None) != value or key not in current]
+            removed = [key for key in current if key not in values]
+            if changed or removed:
+                self._version += 1
+                for key in changed:
+                    self.__set(section, key, values[key])
+                for key in removed:
+                    self.__remove(section, key)
+            return self._version
+
+    def delta(self, since=None):
+        """
+        Changes since a given version
+        :param since: Version known by the receiver (None for a full copy)
+        :return: dicc {'version', 'full', 'set': {section: {key: value}}, 'removed': {section: [keys]}}
+        """
+        with self._lock:
+            ret = {'version': self._version, 'full': False, 'set': {}, 'removed': {}}
+            if since is None or since < self._minVersion or since > self._version:
+                ret['full'] = True
+                ret['set'] = {section: dict(values) for section, values in self._sections.items()}
+                return ret
+            for (section, key), version in reversed(self._changes.items()):
+                if version <= since:
+                    break
+                if key in self._sections.get(section, {}):
+                    ret['set'].setdefault(section, {})[key] = self._sections[section][key]
+                else:
+                    ret['removed'].setdefault(section, []).append(key)
+            return ret
+
+    def apply(self, delta):
+        """
+        Apply the changes received from the Leader (replica)
+        :param delta: dicc returned by delta()
+        :return: Current version
+        """
+        with self._lock:
+            self._version = int(delta.get('version', self._version))
+            if delta.get('full'):
+                self._sections = {}
+                self._changes.clear()
+                self._tombstones.clear()
+                self._minVersion = self._version
+            for section, values in delta.get('set', {}).items():
+                for key, value in values.items():
+                    self.__set(section, key, value)
+            for section, keys in delta.get('removed', {}).items():
+                for key in keys:
+                    if key in self._sections.get(section, {}):
+                        self.__remove(section, key)
+            return self._version
+
+    def section(self, section):
+        """
+        :param section: Name of the section
+        :return: Copy of the content of the section
+        """
+        with self._lock:
+            return dict(self._sections.get(section, {}))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+    Light Discovery - UDP beacon reply messages
+
+    Agent -> Leader (unicast):
+        | magic (4s) | version (B) | type (B) | seq (I) | deviceID len (B) | deviceID | cpu_cores (h) | mem_avail (f) | stg_avail (f) |
+    Leader -> Agent (unicast):
+        | magic (4s) | version (B) | type (B) | seq (I) |
+"""
+
+import struct
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+MAGIC = b'CRMB'
+VERSION = 1
+TYPE_REPLY = 1
+TYPE_ACK = 2
+
+MAX_DATAGRAM = 512
+
+_HEADER = struct.Struct('!4sBBI')
+_METRICS = struct.Struct('!hff')
+
+
+class BeaconReply:
+    __slots__ = ('seq', 'deviceID', 'cpu_cores', 'mem_avail', 'stg_avail')
+
+    def __init__(self, seq, deviceID, cpu_cores, mem_avail, stg_avail):
+        self.seq = seq
+        self.deviceID = deviceID
+        self.cpu_cores = cpu_cores
+        self.mem_avail = mem_avail
+        self.stg_avail = stg_avail
+
+    def getDict(self):
+        """
+        :return: Beacon reply payload (same format than the HTTP beacon reply)
+        """
+        return {
+            'deviceID': self.deviceID,
+            'cpu_cores': self.cpu_cores,
+            'mem_avail': self.mem_avail,
+            'stg_avail': self.stg_avail
+        }
+
+
+class BeaconReplyAck:
+    __slots__ = ('seq',)
+
+    def __init__(self, seq):
+        self.seq = seq
+
+
+def pack_reply(seq, deviceID, cpu_cores, mem_avail, stg_avail):
+    """
+    Build a beacon reply datagram
+    :param seq: Sequence number
+    :param deviceID: ID of the agent
+    :param cpu_cores: Number of logical cores
+    :param mem_avail: Available memory (GB)
+    :param stg_avail: Available storage (GB)
+    :return: bytes
+    """
+    bID = str(deviceID).encode()[:255]
+    return _HEADER.pack(MAGIC, VERSION, TYPE_REPLY, seq & 0xFFFFFFFF) + bytes((len(bID),)) + bID + \
+        _METRICS.pack(max(-32768, min(32767, int(cpu_cores))), float(mem_avail), float(stg_avail))
+
+
+def pack_ack(seq):
+    """
+    Build an acknowledgement datagram
+    :param seq: Sequence number of the acknowledged reply
+    :return: bytes
+    """
+    return _HEADER.pack(MAGIC, VERSION, TYPE_ACK, seq & 0xFFFFFFFF)
+
+
+def unpack(data):
+    """
+    Decode a beacon reply or an acknowledgement datagram
+    :param data: bytes received
+    :return: BeaconReply, BeaconReplyAck or None if the datagram is not valid
+    """
+    try:
+        magic, version, mtype, seq = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        if mtype == TYPE_ACK:
+            return BeaconReplyAck(seq)
+        elif mtype == TYPE_REPLY:
+            offset = _HEADER.size
+            length = data[offset]
+            offset += 1
+            bID = data[offset:offset + length]
+            if len(bID) != length or length == 0:
+                return None
+            deviceID = bID.decode()
+            cpu_cores, mem_avail, stg_avail = _METRICS.unpack_from(data, offset + length)
+            return BeaconReply(seq, deviceID, cpu_cores, mem_avail, stg_avail)
+        return None
+    except (struct.error, IndexError, UnicodeDecodeError):
+        return None
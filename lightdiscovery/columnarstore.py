@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+    Light Discovery - Columnar topology store
+
+    Alternative to the dict of DeviceInformation of the Leader (COLUMNAR_TOPOLOGY policy): deviceID in a string
+    list (one string per device, see intern()), IPv4 deviceIP packed in a NumPy column and
+    cpu_cores/mem_avail/stg_avail/lastSeen in NumPy columns, with a deviceID -> row index ordered from the least to
+    the most recently seen device. Filters, top-k queries, aging and stats are evaluated on the columns, without
+    building a device per row.
+    NumPy is optional (requirements-extras.txt): available() is False if it is not installed.
+"""
+
+import socket
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def available():
+    return numpy is not None
+
+
+class ColumnarTopology:
+    """
+    Mapping deviceID -> device, least recently seen first (same use as an OrderedDict of DeviceInformation).
+    Only the values of the devices are stored: each mapping read builds a new device with the factory, the other
+    reads (oldest, countSeenBefore, deviceIP, pairs, getDict, dicts) use the columns directly.
+    Not thread-safe: the owner must hold its own lock (LightDiscovery._db_lock).
+    """
+    COLUMNS = ('cpu_cores', 'mem_avail', 'stg_avail')
+
+    def __init__(self, capacity=1024, factory=None):
+        """
+        :param capacity: Initial rows (doubled when full)
+        :param factory: Function (deviceID, deviceIP, cpu_cores, mem_avail, stg_avail, lastSeen) that builds the
+                        devices read from the store (DeviceInformation dicc + lastSeen if None)
+        """
+        if numpy is None:
+            raise RuntimeError('NumPy is required by the columnar topology store')
+        self._factory = factory if factory is not None else self.__getDict
+        self._index = OrderedDict()     # deviceID -> row, least recently seen first
+        self._free = []     # Rows of removed devices
+        self._rows = 0      # Rows in use (including the free ones)
+        self.__allocate(max(1, capacity))
+
+    def __allocate(self, capacity):
+        self._ids = [None] * capacity
+        self._ips = numpy.zeros(capacity, dtype=numpy.uint32)
+        self._otherIPs = {}     # row -> deviceIP that is not a dotted IPv4 address (e.g. '')
+        self._alive = numpy.zeros(capacity, dtype=bool)
+        self._lastSeen = numpy.zeros(capacity, dtype=numpy.float64)
+        self._columns = {
+            'cpu_cores': numpy.zeros(capacity, dtype=numpy.int32),
+            'mem_avail': numpy.zeros(capacity, dtype=numpy.float64),
+            'stg_avail': numpy.zeros(capacity, dtype=numpy.float64)
+        }
+
+    def __grow(self):
+        capacity = len(self._ids)
+        ids, ips, otherIPs, alive, lastSeen = self._ids, self._ips, self._otherIPs, self._alive, self._lastSeen
+        columns = self._columns
+        self.__allocate(2 * capacity)
+        self._ids[:capacity] = ids
+        self._ips[:capacity] = ips
+        self._otherIPs = otherIPs
+        self._alive[:capacity] = alive
+        self._lastSeen[:capacity] = lastSeen
+        for name, column in columns.items():
+            self._columns[name][:capacity] = column
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, deviceID):
+        return deviceID in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __getitem__(self, deviceID):
+        return self.__build(self._index[deviceID])
+
+    def __setitem__(self, deviceID, dev_obj):
+        """
+        :param dev_obj: DeviceInformation (only its values are kept)
+        """
+        self.upsert(deviceID, dev_obj.deviceIP, dev_obj.cpu_cores, dev_obj.mem_avail, dev_obj.stg_avail, dev_obj.lastSeen)
+
+    def __delitem__(self, deviceID):
+        if not self.remove(deviceID):
+            raise KeyError(deviceID)
+
+    def get(self, deviceID, default=None):
+        row = self._index.get(deviceID)
+        return default if row is None else self.__build(row)
+
+    def items(self):
+        for deviceID, row in self._index.items():
+            yield deviceID, self.__build(row)
+
+    def values(self):
+        for row in self._index.values():
+            yield self.__build(row)
+
+    def move_to_end(self, deviceID):
+        """
+        The device is the most recently seen
+        """
+        self._index.move_to_end(deviceID)
+
+    def upsert(self, deviceID, deviceIP, cpu_cores, mem_avail, stg_avail, lastSeen=.0):
+        """
+        Add a device (most recently seen) or update its values (order not modified)
+        """
+        row = self._index.get(deviceID)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._rows == len(self._ids):
+                    self.__grow()
+                row = self._rows
+                self._rows += 1
+            self._index[deviceID] = row
+            self._ids[row] = deviceID
+            self._alive[row] = True
+        self.__setIP(row, deviceIP)
+        self._lastSeen[row] = lastSeen
+        self._columns['cpu_cores'][row] = cpu_cores
+        self._columns['mem_avail'][row] = mem_avail
+        self._columns['stg_avail'][row] = stg_avail
+
+    def remove(self, deviceID):
+        row = self._index.pop(deviceID, None)
+        if row is None:
+            return False
+        self._ids[row] = None
+        self._otherIPs.pop(row, None)
+        self._alive[row] = False
+        self._free.append(row)
+        return True
+
+    def intern(self, deviceID):
+        """
+        :return: deviceID string kept by the store (the same object for every reply of a device) or deviceID if the
+                 device is not in the store
+        """
+        row = self._index.get(deviceID)
+        return deviceID if row is None else self._ids[row]
+
+    def oldest(self):
+        """
+        :return: (deviceID, lastSeen) of the least recently seen device or None if empty
+        """
+        for deviceID, row in self._index.items():
+            return deviceID, float(self._lastSeen[row])
+        return None
+
+    def countSeenBefore(self, lastSeen):
+        """
+        :return: Number of devices seen before lastSeen
+        """
+        n = self._rows
+        return int(numpy.count_nonzero(self._alive[:n] & (self._lastSeen[:n] < lastSeen)))
+
+    def deviceIP(self, deviceID):
+        return self.__getIP(self._index[deviceID])
+
+    def pairs(self):
+        """
+        :return: Iterator of (deviceID, deviceIP), least recently seen first
+        """
+        for deviceID, row in self._index.items():
+            yield deviceID, self.__getIP(row)
+
+    def getDict(self, deviceID):
+        """
+        :return: DeviceInformation dicc of a device
+        """
+        return self.__getDict(*self.__row(self._index[deviceID]))
+
+    def dicts(self):
+        """
+        :return: List of DeviceInformation dicc, least recently seen first
+        """
+        return [self.__getDict(*self.__row(row)) for row in self._index.values()]
+
+    def clear(self):
+        self._index.clear()
+        self._free.clear()
+        self._rows = 0
+        self.__allocate(len(self._ids))
+
+    def query(self, minimums=None, order_by=None, descending=True, k=None):
+        """
+        :param minimums: dicc {column: minimum value} (devices with a lower value are filtered out)
+        :param order_by: Column used to sort the devices (not sorted if None)
+        :param descending: Highest values first
+        :param k: Max devices returned (the top k if order_by is set)
+        :return: List of DeviceInformation dicc
+        """
+        n = self._rows
+        mask = self._alive[:n].copy()
+        for name, minimum in (minimums or {}).items():
+            if minimum is not None:
+                mask &= self._columns[name][:n] >= minimum
+        rows = numpy.flatnonzero(mask)
+        if order_by is not None:
+            values = self._columns[order_by][rows]
+            if descending:
+                values = -values
+            if k is not None and k < len(rows):
+                top = numpy.argpartition(values, k - 1)[:k]
+                rows, values = rows[top], values[top]
+            rows = rows[numpy.argsort(values, kind='stable')]
+        elif k is not None:
+            rows = rows[:k]
+        return [self.__getDict(*self.__row(row)) for row in rows.tolist()]
+
+    def __setIP(self, row, deviceIP):
+        try:
+            packed = socket.inet_aton(deviceIP)
+            if socket.inet_ntoa(packed) == deviceIP:
+                self._ips[row] = int.from_bytes(packed, 'big')
+                self._otherIPs.pop(row, None)
+                return
+        except (OSError, TypeError, ValueError):
+            pass
+        self._otherIPs[row] = deviceIP
+
+    def __getIP(self, row):
+        deviceIP = self._otherIPs.get(row)
+        if deviceIP is None:
+            deviceIP = socket.inet_ntoa(int(self._ips[row]).to_bytes(4, 'big'))
+        return deviceIP
+
+    def __row(self, row):
+        return (self._ids[row], self.__getIP(row), int(self._columns['cpu_cores'][row]),
+                float(self._columns['mem_avail'][row]), float(self._columns['stg_avail'][row]), float(self._lastSeen[row]))
+
+    def __build(self, row):
+        return self._factory(*self.__row(row))
+
+    @staticmethod
+    def __getDict(deviceID, deviceIP, cpu_cores, mem_avail, stg_avail, lastSeen=None):
+        return {
+            'deviceID': deviceID,
+            'deviceIP': deviceIP,
+            'cpu_cores': cpu_cores,
+            'mem_avail': mem_avail,
+            'stg_avail': stg_avail
+        }
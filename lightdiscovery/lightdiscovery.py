@@ -8,13 +8,23 @@
 import threading
 import requests
 import socket
-from time import sleep
+import random
+from queue import Queue, Full
+from requests.adapters import HTTPAdapter
+from time import monotonic
 from json import dumps, loads, JSONDecodeError
-import psutil as psutil
+from heapq import heappush, heappop, heapify, nlargest, nsmallest
+from itertools import count
+from collections import OrderedDict
+from types import MappingProxyType
 
 
 from common.logs import LOG
 from common.common import CPARAMS, URLS
+from common.devicemetrics import DEVICE_METRICS
+from lightdiscovery import beaconreply, columnarstore
+from policies.agentcapability import LeaderMandatoryRequirements, LeaderDiscretionaryRequirements, capabilityScore
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
 
 __maintainer__ = 'Alejandro Jurnet'
 __email__ = 'ajurnet@ac.upc.edu'
@@ -22,7 +32,12 @@ __author__ = 'Universitat Politècnica de Catalunya'
 
 
 class LightDiscovery:
-    def __init__(self, bcast_addr, deviceID):
+    PIPELINE_QUEUE_SIZE = 16    # Beacons waiting for categorization / replies waiting to be sent (scanning mode)
+    RECV_TIMEOUT = 1.   # Max time to detect the scanning stop
+    UDP_BATCH_SIZE = 256    # UDP beacon replies applied to the topology at once
+    UDP_ACK_TIMEOUT = .5
+
+    def __init__(self, bcast_addr, deviceID, lmr=None, ldr=None, ldp=None):
         self._connected = False
         self._isStarted = False
         self._isBroadcasting = False
@@ -33,28 +48,77 @@ class LightDiscovery:
 
         self._bcast_addr = bcast_addr
         self._th_proc = threading.Thread()
+        self._th_udp = threading.Thread()
+        self._stopEvent = threading.Event()     # Set on stop (beacon and reply waits)
         self._db_lock = threading.Lock()
-        self._db = {}
+        self._db = DeviceTopology()     # deviceID -> DeviceInformation, least recently seen first (or ColumnarTopology)
+        self._lmr = lmr if lmr is not None else LeaderMandatoryRequirements()
+        self._ldr = ldr if ldr is not None else LeaderDiscretionaryRequirements()
+        self._ldp = ldp if ldp is not None else LightDiscoveryPolicies()
+        self._evictions = 0
+        # Scanning pipeline: receive -> categorize -> reply
+        self._th_categorize = threading.Thread()
+        self._th_reply = threading.Thread()
+        self._categorizeQueue = Queue(self.PIPELINE_QUEUE_SIZE)     # (leaderIP, leaderID, replyPort, replyWindow)
+        self._replyQueue = Queue(self.PIPELINE_QUEUE_SIZE)          # (leaderIP, leaderID, replyPort, DeviceInformation, due)
+        self._pendingLeaders = set()    # Leaders with a reply in the pipeline (duplicate beacons are coalesced)
+        self._pendingLock = threading.Lock()
+        self._beaconsCoalesced = 0
+        self._beaconsDropped = 0
+        self._lastReplies = {}  # leaderIP -> (leaderID, DeviceInformation, beacons not replied since), last reply sent
+        self._repliesSuppressed = 0
+        self._udpReplies = 0
+        self._unackedReplies = {}   # leaderIP -> consecutive UDP replies without ack
+        self._udpFallbacks = set()  # Leaders that only receive HTTP beacon replies
+        self._leaders = LeaderTable()   # Leaders heard in scanning mode (leaderIP/leaderID: the selected one)
+        self._candidates = CandidateIndex(self._lmr, self._ldr)
+        self._topology = TopologySnapshot()     # Replaced (never modified) when a device joins/leaves or changes IP
+        self._topologyVersion = 0               # Version of the topology in _db (snapshot built on the next read)
+        self._changes = TopologyChanges()       # Change version per device, for the delta queries
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-    def startBeaconning(self):
+    def startBeaconning(self, seed=None):
+        """
+        Start the Leader mode (beacons)
+        :param seed: List of devices (DeviceInformation dicc) to start with, i.e. topology replicated from the Leader
+        :return: True if started, False otherwise
+        """
         if self._isStarted or self._isBroadcasting:
             LOG.warning('LDiscovery is already started: isStarted={} isBroadcasting={}'.format(self._isStarted, self._isBroadcasting))
             return False
         self._th_proc = threading.Thread(name='LDiscB', target=self.__beaconning_flow, daemon=True)
+        self._stopEvent.clear()
         self._connected = True
         self._isStarted = True
         self._isBroadcasting = True
         self.leaderIP = None
         self.leaderID = self._deviceID
-        self._db = {}
+        with self._db_lock:
+            self._db = DeviceTopology()
+            if self._ldp.get(self._ldp.COLUMNAR_TOPOLOGY, default=False):
+                if columnarstore.available():
+                    self._db = columnarstore.ColumnarTopology(factory=DeviceInformation.fromColumns)
+                else:
+                    LOG.warning('NumPy not available. Columnar topology store disabled.')
+            self._candidates.clear()
+            self._changes.reset()
+            for device in seed if seed is not None else []:
+                dev_obj = DeviceInformation(dict=device)
+                self._db[dev_obj.deviceID] = dev_obj
+                self._candidates.update(dev_obj)
+                self._changes.changed(dev_obj.deviceID)
+            self.__publishTopology()
         self._th_proc.start()
+        if self._ldp.get(self._ldp.UDP_BEACON_REPLY, default=False):
+            self._th_udp = threading.Thread(name='LDiscU', target=self.__udpReplies_flow, daemon=True)
+            self._th_udp.start()
         LOG.info('LDiscovery successfully started in Beacon Mode.')
         return True
 
     def stopBeaconning(self):
         if self._isStarted and self._isBroadcasting:
             self._connected = False
+            self._stopEvent.set()
             try:
                 self._socket.shutdown(socket.SHUT_RDWR)
                 self._socket.close()
@@ -62,6 +126,8 @@ class LightDiscovery:
             except:
                 pass
             self._th_proc.join()
+            if self._th_udp.is_alive():
+                self._th_udp.join()
             LOG.info('LDisc Beaconning Stopped')
             self._isBroadcasting = False
             self._isStarted = False
@@ -77,11 +143,22 @@ class LightDiscovery:
                                                                                                self._isScanning))
             return False
         self._th_proc = threading.Thread(name='LDiscS', target=self.__scanning_flow, daemon=True)
+        self._th_categorize = threading.Thread(name='LDiscC', target=self.__categorize_flow, daemon=True)
+        self._th_reply = threading.Thread(name='LDiscR', target=self.__reply_flow, daemon=True)
+        self._stopEvent.clear()
         self._connected = True
         self._isStarted = True
         self._isScanning = True
         self.leaderIP = None
         self.leaderID = None
+        with self._pendingLock:
+            self._pendingLeaders.clear()
+        self._unackedReplies.clear()
+        self._udpFallbacks.clear()
+        self._lastReplies.clear()
+        self._leaders.clear()
+        self._th_reply.start()
+        self._th_categorize.start()
         self._th_proc.start()
         LOG.info('LDiscovery successfully started in Scan Mode.')
         return True
@@ -89,6 +166,7 @@ class LightDiscovery:
     def stopScanning(self):
         if self._isStarted and self._isScanning:
             self._connected = False
+            self._stopEvent.set()
             try:
                 self._socket.shutdown(socket.SHUT_RDWR)
                 self._socket.close()
@@ -96,6 +174,10 @@ class LightDiscovery:
             except:
                 pass
             self._th_proc.join()
+            # Stop the pipeline (the sentinel goes through all the stages)
+            self._categorizeQueue.put(None)
+            self._th_categorize.join()
+            self._th_reply.join()
             LOG.info('LDisc Scanning Stopped')
             self._isScanning = False
             self._isStarted = False
@@ -109,48 +191,343 @@ class LightDiscovery:
         try:
             dev_obj = DeviceInformation(dict=payload)
             dev_obj.deviceIP = deviceIP
-            with self._db_lock:
-                self._db.update({dev_obj.deviceID: dev_obj})
+            self.__ingest([dev_obj])
             LOG.debug('Topology added/modified device: {}'.format(dev_obj))
             return True
         except:
             LOG.exception('Error on receiving reply from device to a beacon.')
             return False
 
+    def recv_replies(self, payloads, deviceIP):
+        """
+        Batch of beacon replies (e.g. collected by a relay), applied to the topology under a single lock acquisition
+        :param payloads: List of beacon replies (DeviceInformation dicc)
+        :param deviceIP: IP used for the records without deviceIP (sender of the batch)
+        :return: List of (deviceID, error) per record, error is None if the record is correct
+        """
+        dev_objs = []
+        results = []
+        for payload in payloads:
+            try:
+                deviceID = payload.get('deviceID')
+                if deviceID is None or str(deviceID) == '':
+                    raise ValueError('deviceID is required')
+                dev_obj = DeviceInformation(deviceID=deviceID,
+                                            deviceIP=payload.get('deviceIP') or deviceIP,
+                                            cpuCores=payload['cpu_cores'],
+                                            memAvail=payload['mem_avail'],
+                                            stgAvail=payload['stg_avail'])
+                dev_objs.append(dev_obj)
+                results.append((dev_obj.deviceID, None))
+            except (AttributeError, KeyError, TypeError, ValueError) as ex:
+                deviceID = payload.get('deviceID') if isinstance(payload, dict) else None
+                results.append((None if deviceID is None else str(deviceID), '{}: {}'.format(type(ex).__name__, ex)))
+        if dev_objs:
+            self.__ingest(dev_objs)
+        LOG.debug('Topology added/modified {} devices ({} errors)'.format(len(dev_objs), len(results) - len(dev_objs)))
+        return results
+
+    def __ingest(self, dev_objs):
+        """
+        Add/update devices of the topology (one lock acquisition and at most one new snapshot)
+        :param dev_objs: List of DeviceInformation
+        """
+        delta = float(self._ldp.get(self._ldp.METRICS_DELTA, default=.0))
+        with self._db_lock:
+            changed = False
+            for dev_obj in dev_objs:
+                dev_obj.deviceID = self._db.intern(dev_obj.deviceID)    # One string per device in all the indexes
+                old = self._db.get(dev_obj.deviceID)
+                self._db[dev_obj.deviceID] = dev_obj
+                self._db.move_to_end(dev_obj.deviceID)
+                self._candidates.update(dev_obj)
+                if old is None or old.deviceIP != dev_obj.deviceIP:
+                    changed = True
+                    self._changes.changed(dev_obj.deviceID)
+                elif dev_obj.differs(old, delta):
+                    self._changes.changed(dev_obj.deviceID)
+            if self.__evictStale(monotonic()) or changed:
+                self.__publishTopology()
+
+    def __evictStale(self, now):
+        """
+        Remove the devices that missed MAX_MISSED_BEACONS beacons and the least recently seen over MAX_DEVICES.
+        Only the oldest entries are checked (the caller must hold _db_lock).
+        :param now: time.monotonic() reference
+        :return: Number of devices removed
+        """
+        horizon = now - self.__beaconPeriod() * (float(self._ldp.get(self._ldp.MAX_MISSED_BEACONS)) +
+                                              self.__replyRefreshBeacons() - 1)
+        max_devices = int(self._ldp.get(self._ldp.MAX_DEVICES))
+        evicted = 0
+        while self._db:
+            deviceID, lastSeen = self._db.oldest()
+            if lastSeen >= horizon and len(self._db) <= max_devices:
+                break
+            del self._db[deviceID]
+            self._candidates.remove(deviceID)
+            self._changes.removed(deviceID)
+            evicted += 1
+            LOG.debug('Device {} removed from the topology (last seen {:.1f}s ago)'.format(deviceID, now - lastSeen))
+        self._evictions += evicted
+        return evicted
+
+    def get_stats(self):
+        """
+        :return: dicc with the topology liveness counters
+        """
+        now = monotonic()
+        period = self.__beaconPeriod() * self.__replyRefreshBeacons()
+        with self._db_lock:
+            stale = self._db.countSeenBefore(now - period)
+            return {
+                'devices': len(self._db),
+                'staleDevices': stale,  # Devices that missed at least one (forced) reply
+                'evictions': self._evictions,
+                'topologyVersion': self._topologyVersion,
+                'beaconsCoalesced': self._beaconsCoalesced,
+                'beaconsDropped': self._beaconsDropped,
+                'repliesSuppressed': self._repliesSuppressed,
+                'udpReplies': self._udpReplies,
+                'udpFallbacks': len(self._udpFallbacks)
+            }
+
+    def __beaconPeriod(self):
+        return float(self._ldp.get(self._ldp.BEACON_PERIOD, default=5.))
+
+    def __replyRefreshBeacons(self):
+        return max(1, int(self._ldp.get(self._ldp.REPLY_REFRESH_BEACONS, default=1)))
+
+    def __publishTopology(self):
+        """
+        New topology version (the caller must hold _db_lock). The snapshot is built on the next read,
+        so a burst of new devices costs a single rebuild.
+        """
+        self._topologyVersion += 1
+
     def get_topology(self):
+        """
+        :return: tuple of (deviceID, deviceIP), read-only
+        """
+        return self.get_topology_snapshot().pairs
+
+    def get_topology_snapshot(self):
+        """
+        Current topology snapshot (lock-free if the topology has not changed since the last read, it is never modified)
+        :return: TopologySnapshot
+        """
+        snapshot = self._topology
+        if snapshot.version != self._topologyVersion:
+            with self._db_lock:
+                if self._topology.version != self._topologyVersion:
+                    self._topology = TopologySnapshot(self._topologyVersion, self._db.pairs())
+                snapshot = self._topology
+        return snapshot
+
+    def get_topology_version(self):
+        return self._topologyVersion
+
+    def get_topology_changes(self, since=None, limit=None, cursor=None, info=False):
+        """
+        Devices added/updated and removed after a change version, in change order.
+        Pages of a listing are requested with the same since and the cursor of the previous page.
+        :param since: Change version already known by the consumer (None: whole topology)
+        :param limit: Max devices + removals returned (None: no limit)
+        :param cursor: Cursor returned in the previous page
+        :param info: True to return all the DeviceInformation fields, only deviceID and deviceIP otherwise
+        :return: dicc {'version', 'reset', 'devices', 'removed', 'cursor'}. If reset is True, the changes since
+                 that version are not available anymore and devices is the whole topology (no removals).
+                 cursor is None on the last page.
+        """
+        with self._db_lock:
+            reset = since is None or since < self._changes.minVersion
+            start = 0 if reset else since
+            if cursor is not None:
+                start = max(start, cursor)
+            items = self._changes.after(start, tombstones=not reset)
+            more = limit is not None and len(items) > limit
+            if more:
+                items = items[:limit]
+            devices = []
+            removed = []
+            for version, deviceID, alive in items:
+                if not alive:
+                    removed.append(deviceID)
+                elif info:
+                    devices.append(self._db.getDict(deviceID))
+                else:
+                    devices.append({'deviceID': deviceID, 'deviceIP': self._db.deviceIP(deviceID)})
+            return {
+                'version': self._changes.version,
+                'reset': reset,
+                'devices': devices,
+                'removed': removed,
+                'cursor': items[-1][0] if more else None
+            }
+
+    def query_topology(self, minimums=None, order_by=None, descending=True, k=None):
+        """
+        Devices filtered by minimum values and sorted by a field (vectorized if the columnar store is enabled)
+        e.g. query_topology({'mem_avail': 2.}, order_by='stg_avail', k=10)
+        :param minimums: dicc {field: minimum value}, fields: cpu_cores, mem_avail, stg_avail
+        :param order_by: Field used to sort the devices (not sorted if None)
+        :param descending: Highest values first
+        :param k: Max devices returned (the top k if order_by is set)
+        :return: List of DeviceInformation dicc
+        """
+        minimums = {name: value for name, value in (minimums or {}).items() if value is not None}
+        for name in list(minimums) + ([order_by] if order_by is not None else []):
+            if name not in columnarstore.ColumnarTopology.COLUMNS:
+                raise ValueError('Unknown field {}'.format(name))
+        with self._db_lock:
+            if isinstance(self._db, columnarstore.ColumnarTopology):
+                return self._db.query(minimums, order_by, descending, k)
+            devices = [dev_obj for dev_obj in self._db.values()
+                       if all(getattr(dev_obj, name) >= value for name, value in minimums.items())]
+        if order_by is not None:
+            key = lambda dev_obj: getattr(dev_obj, order_by)
+            if k is not None:
+                devices = (nlargest if descending else nsmallest)(k, devices, key=key)
+            else:
+                devices = sorted(devices, key=key, reverse=descending)
+        elif k is not None:
+            devices = devices[:k]
+        return [dev_obj.getDict() for dev_obj in devices]
+
+    def pop_candidate(self):
+        """
+        Get the best device to be Backup (capability ranking) and remove it from the candidates.
+        The device is ranked again on its next beacon reply or with restore_candidate().
+        :return: dicc {'deviceID', 'deviceIP'} or None if there are no capable devices
+        """
+        with self._db_lock:
+            deviceID = self._candidates.pop()
+            if deviceID is None or deviceID not in self._db:
+                return None
+            return {'deviceID': deviceID, 'deviceIP': self._db.deviceIP(deviceID)}
+
+    def restore_candidate(self, deviceID):
+        """
+        Rank again a device got with pop_candidate() that did not become Backup (skipped or failed election),
+        without waiting for its next beacon reply
+        :param deviceID: deviceID of the device
+        :return: True if the device is ranked again, False if it is not in the topology anymore
+        """
+        with self._db_lock:
+            dev_obj = self._db.get(deviceID)
+            if dev_obj is None:
+                return False
+            self._candidates.update(dev_obj)
+            return True
+
+    def get_leaders(self):
+        """
+        Leaders heard in scanning mode
+        :return: List of dicc {'leaderIP', 'leaderID', 'lastSeen', 'rtt', 'beacons', 'healthy', 'selected'}
+        """
+        return self._leaders.getList(monotonic(), self.__leaderTimeout())
+
+    def __leaderTimeout(self):
+        return self.__beaconPeriod() * float(self._ldp.get(self._ldp.MAX_MISSED_BEACONS))
+
+    def is_capable(self):
+        """
+        :return: True if this device meets the mandatory requirements to be Leader/Backup, None if the device
+                 metrics are not available
+        """
+        cpu, mem, stg = self.__categorize_device()
+        if cpu <= 0:
+            return None
+        return capabilityScore(self._lmr, self._ldr, cpu, mem, stg) is not None
+
+    def get_topology_info(self):
         with self._db_lock:
-            return [(self._db[item].deviceID, self._db[item].deviceIP) for item in self._db]
+            return self._db.dicts()
 
     def __beaconning_flow(self):
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        beacon = dumps({
-            'leaderID': self._deviceID
-        })
         while self._connected:
+            period = self.__beaconPeriod()
+            beacon = {
+                'leaderID': self._deviceID
+            }
+            window = min(float(self._ldp.get(self._ldp.REPLY_WINDOW, default=.0)), period)
+            if window > 0:
+                beacon['replyWindow'] = window
+            if self._ldp.get(self._ldp.UDP_BEACON_REPLY, default=False):
+                beacon['replyPort'] = CPARAMS.BEACONREPLY_PORT
+            beacon = dumps(beacon)
+            with self._db_lock:
+                if self.__evictStale(monotonic()):
+                    self.__publishTopology()
             try:
                 LOG.debug('Sending beacon at [{}:{}]'.format(CPARAMS.BROADCAST_ADDR_FLAG,CPARAMS.LDISCOVERY_PORT))
                 self._socket.sendto(beacon.encode(),(CPARAMS.BROADCAST_ADDR_FLAG, CPARAMS.LDISCOVERY_PORT))
-                sleep_ticks = 0
-                while sleep_ticks < 5 / .1:     # TODO: Policies
-                    if not self._connected:
-                        break
-                    else:
-                        sleep_ticks += 1
-                        sleep(0.1)
             except:
                 LOG.exception('Error sending beacons')
                 self._connected = False
+                break
+            if self._stopEvent.wait(period):
+                break
+
 
+    def __udpReplies_flow(self):
+        """
+        Leader thread that receives the UDP beacon replies. The pending datagrams are drained in batches,
+        applied to the topology at once and acknowledged.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('0.0.0.0', CPARAMS.BEACONREPLY_PORT))
+        except OSError:
+            LOG.exception('UDP beacon reply socket cannot be created. Only HTTP beacon replies are available.')
+            return
+        LOG.debug('Receiving UDP beacon replies at [:{}]'.format(CPARAMS.BEACONREPLY_PORT))
+        while self._connected:
+            sock.settimeout(self.RECV_TIMEOUT)
+            try:
+                batch = [sock.recvfrom(beaconreply.MAX_DATAGRAM)]
+            except socket.timeout:
+                continue
+            except OSError:
+                LOG.exception('Error receiving UDP beacon reply')
+                continue
+            sock.setblocking(False)
+            while len(batch) < self.UDP_BATCH_SIZE:
+                try:
+                    batch.append(sock.recvfrom(beaconreply.MAX_DATAGRAM))
+                except OSError:
+                    break
+            dev_objs = []
+            acks = []
+            for data, addr in batch:
+                msg = beaconreply.unpack(data)
+                if isinstance(msg, beaconreply.BeaconReply):
+                    dev_objs.append(DeviceInformation(deviceID=msg.deviceID, deviceIP=addr[0], cpuCores=msg.cpu_cores,
+                                                      memAvail=msg.mem_avail, stgAvail=msg.stg_avail))
+                    acks.append((beaconreply.pack_ack(msg.seq), addr))
+            if dev_objs:
+                self.__ingest(dev_objs)
+                self._udpReplies += len(dev_objs)
+            for ack, addr in acks:
+                try:
+                    sock.sendto(ack, addr)
+                except OSError:
+                    LOG.debug('UDP beacon reply ack to [{}] not sent'.format(addr[0]))
+        sock.close()
+        LOG.info('UDP beacon reply receiver stopped')
 
     def __scanning_flow(self):
         # 1. Get Beacon
-        # 2. Categorize
-        # 3. Send Categorization info
+        # 2. Categorize (__categorize_flow)
+        # 3. Send Categorization info (__reply_flow)
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
             self._socket.bind(('0.0.0.0', CPARAMS.LDISCOVERY_PORT))
+            self._socket.settimeout(self.RECV_TIMEOUT)
             LOG.info('Scan server created correctly')
         except:
             LOG.exception('Error on creating the scan receiver')
@@ -159,57 +536,463 @@ class LightDiscovery:
         while self._connected:
             try:
                 data, addr = self._socket.recvfrom(4096)
-                if not self._connected:
-                    break
-                LOG.debug('Received beacon from [{}]: \"{}\"'.format(addr[0], data.decode()))
-                self.leaderIP = addr[0]
-                try:
-                    ddata = loads(data.decode())
-                    self.leaderID = ddata.get('leaderID')
-                except JSONDecodeError:
-                    LOG.warning('Beacon payload malformed')
-                cpu, mem, stg = self.__categorize_device()
-                LOG.debug('CPU: {}, MEM: {}, STG: {}'.format(cpu,mem,stg))
-                payload = DeviceInformation(deviceID=self._deviceID, cpuCores=cpu, memAvail=mem, stgAvail=stg).getDict()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._connected:
+                    LOG.exception('Error on beacon received')
+                continue
+            if not self._connected:
+                break
+            LOG.debug('Received beacon from [{}]: \"{}\"'.format(addr[0], data.decode(errors='replace')))
+            leaderID = None
+            replyPort = None
+            replyWindow = .0
+            try:
+                ddata = loads(data.decode())
+                leaderID = ddata.get('leaderID')
+                replyPort = ddata.get('replyPort')
+                replyWindow = max(.0, float(ddata.get('replyWindow', .0)))
+            except (JSONDecodeError, UnicodeDecodeError, AttributeError, TypeError, ValueError):
+                LOG.warning('Beacon payload malformed')
+            now = monotonic()
+            self._leaders.beacon(addr[0], leaderID, now)
+            selected = self._leaders.select(now, self.__leaderTimeout(),
+                                            float(self._ldp.get(self._ldp.LEADER_HYSTERESIS, default=.0)))
+            if selected is not None and selected.leaderIP != self.leaderIP:
+                LOG.info('Leader [{}] ({}) selected'.format(selected.leaderIP, selected.leaderID))
+            if selected is not None:
+                self.leaderIP, self.leaderID = selected.leaderIP, selected.leaderID
+            with self._pendingLock:
+                if addr[0] in self._pendingLeaders:
+                    # A reply to this Leader is already in the pipeline
+                    self._beaconsCoalesced += 1
+                    continue
+                self._pendingLeaders.add(addr[0])
+            try:
+                self._categorizeQueue.put_nowait((addr[0], leaderID, replyPort, replyWindow))
+            except Full:
+                LOG.warning('Beacon from [{}] dropped, categorization pipeline is full'.format(addr[0]))
+                self.__replyDone(addr[0])
+                self._beaconsDropped += 1
+        try:
+            self._socket.close()
+            LOG.info('Scan Server Stopped')
+        except:
+            LOG.exception('Server Stop not successful')
+
+    def __categorize_flow(self):
+        """
+        Scanning pipeline stage: categorization of the device for each beacon
+        """
+        while True:
+            item = self._categorizeQueue.get()
+            if item is None:
+                self._replyQueue.put(None)
+                break
+            leaderIP, leaderID, replyPort, replyWindow = item
+            cpu, mem, stg = self.__categorize_device()
+            LOG.debug('CPU: {}, MEM: {}, STG: {}'.format(cpu, mem, stg))
+            dev_obj = DeviceInformation(deviceID=self._deviceID, cpuCores=cpu, memAvail=mem, stgAvail=stg)
+            if self.__suppressReply(leaderIP, leaderID, dev_obj):
+                self._repliesSuppressed += 1
+                self.__replyDone(leaderIP)
+                continue
+            # Random instant of the reply window advertised by the Leader (agents do not reply all at once)
+            self._replyQueue.put((leaderIP, leaderID, replyPort, dev_obj, monotonic() + random.uniform(.0, replyWindow)))
+
+    def __suppressReply(self, leaderIP, leaderID, dev_obj):
+        """
+        The beacon is not replied if the last reply was sent to the same Leader with the same metrics
+        (METRICS_DELTA), unless REPLY_REFRESH_BEACONS beacons have been received since then.
+        :return: True if the reply is not needed
+        """
+        last = self._lastReplies.get(leaderIP)
+        if last is None:
+            return False
+        lastLeaderID, lastDevice, skipped = last
+        if lastLeaderID != leaderID or skipped + 1 >= self.__replyRefreshBeacons() or \
+                dev_obj.differs(lastDevice, float(self._ldp.get(self._ldp.METRICS_DELTA, default=.0))):
+            return False
+        self._lastReplies[leaderIP] = (lastLeaderID, lastDevice, skipped + 1)
+        return True
+
+    def __reply_flow(self):
+        """
+        Scanning pipeline stage: beacon replies sent to the Leaders (persistent connections)
+        """
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        seq = 0
+        while True:
+            item = self._replyQueue.get()
+            if item is None:
+                break
+            leaderIP, leaderID, replyPort, dev_obj, due = item
+            if self._stopEvent.wait(max(.0, due - monotonic())):
+                self.__replyDone(leaderIP)
+                continue
+            payload = dev_obj.getDict()
+            self._lastReplies.pop(leaderIP, None)   # Set again if the reply is delivered
+            if replyPort is not None and leaderIP not in self._udpFallbacks:
+                seq += 1
+                sent = monotonic()
+                if self.__sendUDPReply(sock, leaderIP, replyPort, seq, payload):
+                    self._leaders.rtt(leaderIP, monotonic() - sent)
+                    self._lastReplies[leaderIP] = (leaderID, dev_obj, 0)
+                    self.__replyDone(leaderIP)
+                    continue
+            try:
                 LOG.info('Sending beacon reply to Leader...')
-                r = requests.post(URLS.build_url_address(URLS.URL_BEACONREPLY, portaddr=(addr[0],CPARAMS.POLICIES_PORT)),json=payload, timeout=2)
+                sent = monotonic()
+                r = session.post(URLS.build_url_address(URLS.URL_BEACONREPLY, portaddr=(leaderIP, CPARAMS.POLICIES_PORT)), json=payload, timeout=2)
                 if r.status_code == 200:
+                    self._leaders.rtt(leaderIP, monotonic() - sent)
+                    self._lastReplies[leaderIP] = (leaderID, dev_obj, 0)
                     LOG.info('Discovery Message successfully sent to Leader')
                 else:
                     LOG.warning('Discovery Message received error status code {}'.format(r.status_code))
             except:
-                LOG.exception('Error on beacon received')
+                LOG.exception('Error sending beacon reply to [{}]'.format(leaderIP))
+            finally:
+                self.__replyDone(leaderIP)
+        session.close()
+        sock.close()
+
+    def __sendUDPReply(self, sock, leaderIP, replyPort, seq, payload):
+        """
+        Send the beacon reply in a UDP datagram and wait for the ack of the Leader. After MAX_UNACKED_REPLIES
+        consecutive replies without ack, the Leader only receives HTTP beacon replies.
+        :return: True if the reply is acknowledged, False otherwise (HTTP must be used)
+        """
         try:
-            self._socket.close()
-            LOG.info('Scan Server Stopped')
-        except:
-            LOG.exception('Server Stop not successful')
+            sock.sendto(beaconreply.pack_reply(seq, payload['deviceID'], payload['cpu_cores'], payload['mem_avail'],
+                                               payload['stg_avail']), (leaderIP, int(replyPort)))
+            deadline = monotonic() + self.UDP_ACK_TIMEOUT
+            while monotonic() < deadline:
+                sock.settimeout(max(.001, deadline - monotonic()))
+                data, addr = sock.recvfrom(beaconreply.MAX_DATAGRAM)
+                msg = beaconreply.unpack(data)
+                if addr[0] == leaderIP and isinstance(msg, beaconreply.BeaconReplyAck) and msg.seq == seq:
+                    self._unackedReplies[leaderIP] = 0
+                    LOG.debug('UDP beacon reply #{} acknowledged by Leader'.format(seq))
+                    return True
+        except (OSError, ValueError):
+            pass
+        self._unackedReplies[leaderIP] = self._unackedReplies.get(leaderIP, 0) + 1
+        if self._unackedReplies[leaderIP] >= int(self._ldp.get(self._ldp.MAX_UNACKED_REPLIES, default=3)):
+            LOG.warning('UDP beacon replies to [{}] not acknowledged. Using HTTP beacon replies.'.format(leaderIP))
+            self._udpFallbacks.add(leaderIP)
+        return False
+
+    def __replyDone(self, leaderIP):
+        with self._pendingLock:
+            self._pendingLeaders.discard(leaderIP)
 
     def __categorize_device(self):
-        try:
-            cpu_cores = int(psutil.cpu_count()) if psutil.cpu_count() is not None else -1
-            mem_avail = float(psutil.virtual_memory().available / (2 ** 30))
-            storage_avail = float(sum([psutil.disk_usage(disk.mountpoint).free for disk in psutil.disk_partitions()]) / 2 ** 30)
-        except:
-            LOG.exception('Categorization not successful')
-            cpu_cores = 0
-            mem_avail = .0
-            storage_avail = .0
-        finally:
-            return cpu_cores, mem_avail, storage_avail
+        """
+        :return: cpu_cores, mem_avail, storage_avail (last snapshot of the device metrics sampler)
+        """
+        return DEVICE_METRICS.snapshot()
+
+class LeaderEntry:
+    __slots__ = ('leaderIP', 'leaderID', 'lastSeen', 'rtt', 'beacons')
+
+    def __init__(self, leaderIP, leaderID, lastSeen):
+        self.leaderIP = leaderIP
+        self.leaderID = leaderID
+        self.lastSeen = lastSeen
+        self.rtt = None     # Smoothed beacon reply RTT (seconds), None until the first reply
+        self.beacons = 0
+
+
+class LeaderTable:
+    """
+    Leaders heard by a scanning agent. The selected Leader is kept while it is healthy (beacons received in the
+    last MAX_MISSED_BEACONS periods), unless another healthy Leader has a lower RTT by more than the hysteresis.
+    """
+    RTT_WEIGHT = .2     # Weight of the new RTT sample (exponential moving average)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leaders = {}  # leaderIP -> LeaderEntry
+        self._selected = None
+
+    def beacon(self, leaderIP, leaderID, now):
+        with self._lock:
+            entry = self._leaders.get(leaderIP)
+            if entry is None:
+                entry = LeaderEntry(leaderIP, leaderID, now)
+                self._leaders[leaderIP] = entry
+            entry.leaderID = leaderID
+            entry.lastSeen = now
+            entry.beacons += 1
+
+    def rtt(self, leaderIP, rtt):
+        with self._lock:
+            entry = self._leaders.get(leaderIP)
+            if entry is not None:
+                entry.rtt = rtt if entry.rtt is None else (1 - self.RTT_WEIGHT) * entry.rtt + self.RTT_WEIGHT * rtt
+
+    def select(self, now, timeout, hysteresis):
+        """
+        :param now: time.monotonic() reference
+        :param timeout: Seconds without beacons until a Leader is not healthy (removed after twice this time)
+        :param hysteresis: Relative RTT improvement needed to change the selected Leader
+        :return: Selected LeaderEntry or None
+        """
+        with self._lock:
+            for leaderIP in [ip for ip, entry in self._leaders.items() if now - entry.lastSeen > 2 * timeout]:
+                del self._leaders[leaderIP]
+            healthy = [entry for entry in self._leaders.values() if now - entry.lastSeen <= timeout]
+            if not healthy:
+                self._selected = None
+                return None
+            # Lowest RTT first, Leaders without RTT after (most recently seen first)
+            best = min(healthy, key=lambda entry: (entry.rtt is None, entry.rtt or .0, -entry.lastSeen))
+            current = self._leaders.get(self._selected)
+            if current is None or now - current.lastSeen > timeout or \
+                    (best.rtt is not None and (current.rtt is None or best.rtt < current.rtt * (1. - hysteresis))):
+                current = best
+            self._selected = current.leaderIP
+            return current
+
+    def getList(self, now, timeout):
+        with self._lock:
+            return [{
+                'leaderIP': entry.leaderIP,
+                'leaderID': entry.leaderID,
+                'lastSeen': now - entry.lastSeen,
+                'rtt': entry.rtt,
+                'beacons': entry.beacons,
+                'healthy': now - entry.lastSeen <= timeout,
+                'selected': entry.leaderIP == self._selected
+            } for entry in self._leaders.values()]
+
+    def clear(self):
+        with self._lock:
+            self._leaders.clear()
+            self._selected = None
+
+
+class TopologySnapshot:
+    """
+    Immutable, version-stamped view of the topology. Readers get the current snapshot without locks or copies.
+    """
+    __slots__ = ('version', 'pairs', 'devices', 'byID')
+
+    def __init__(self, version=0, pairs=()):
+        """
+        :param version: Topology version (increased on every membership or IP change)
+        :param pairs: Iterable of (deviceID, deviceIP)
+        """
+        self.version = version
+        self.pairs = tuple(pairs)
+        self.devices = tuple(MappingProxyType({'deviceID': deviceID, 'deviceIP': deviceIP}) for deviceID, deviceIP in self.pairs)
+        self.byID = MappingProxyType({device['deviceID']: device for device in self.devices})
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+
+class TopologyChanges:
+    """
+    Change version of each device of the topology and of the removed ones (tombstones, up to MAX_TOMBSTONES).
+    Not thread-safe: the owner must hold its own lock (LightDiscovery._db_lock).
+    """
+    MAX_TOMBSTONES = 4096
+
+    def __init__(self):
+        self.version = 0
+        self.minVersion = 0     # Changes after this version are complete (older tombstones are discarded)
+        self._devices = OrderedDict()       # deviceID -> version, oldest change first
+        self._tombstones = OrderedDict()    # deviceID -> version, oldest removal first
+
+    def changed(self, deviceID):
+        self.version += 1
+        self._tombstones.pop(deviceID, None)
+        self._devices.pop(deviceID, None)
+        self._devices[deviceID] = self.version
+
+    def removed(self, deviceID):
+        self.version += 1
+        self._devices.pop(deviceID, None)
+        self._tombstones.pop(deviceID, None)
+        self._tombstones[deviceID] = self.version
+        while len(self._tombstones) > self.MAX_TOMBSTONES:
+            _, version = self._tombstones.popitem(last=False)
+            self.minVersion = max(self.minVersion, version)
+
+    def reset(self):
+        """
+        New topology: the previous changes are not valid anymore
+        """
+        self._devices.clear()
+        self._tombstones.clear()
+        self.version += 1
+        self.minVersion = self.version
+
+    def after(self, version, tombstones=True):
+        """
+        :param version: Change version
+        :param tombstones: Include the removed devices
+        :return: List of (version, deviceID, alive) changed after version, oldest first
+        """
+        items = self.__after(self._devices, version, True)
+        if tombstones:
+            items = sorted(items + self.__after(self._tombstones, version, False))
+        return items
+
+    @staticmethod
+    def __after(entries, version, alive):
+        items = []
+        for deviceID in reversed(entries):
+            if entries[deviceID] <= version:
+                break
+            items.append((entries[deviceID], deviceID, alive))
+        items.reverse()
+        return items
+
+
+class CandidateIndex:
+    """
+    Devices ranked by capabilityScore(), updated on every beacon reply. Outdated heap items are discarded on pop,
+    and the heap is rebuilt from the current entries when they are more than half of it.
+    Not thread-safe: the owner must hold its own lock (LightDiscovery._db_lock).
+    """
+    MIN_COMPACT = 16    # Heap size below which outdated items are not compacted
+
+    def __init__(self, lmr, ldr):
+        self._lmr = lmr
+        self._ldr = ldr
+        self._heap = []
+        self._entries = {}  # deviceID -> current heap item
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, dev_obj):
+        score = capabilityScore(self._lmr, self._ldr, dev_obj.cpu_cores, dev_obj.mem_avail, dev_obj.stg_avail)
+        if score is None:
+            # Not capable (anymore)
+            self._entries.pop(dev_obj.deviceID, None)
+            return
+        rank = tuple(-value for value in score)
+        current = self._entries.get(dev_obj.deviceID)
+        if current is not None and current[0] == rank:
+            # Same ranking, the heap item is still valid
+            return
+        item = (rank, next(self._counter), dev_obj.deviceID)
+        self._entries[dev_obj.deviceID] = item
+        heappush(self._heap, item)
+        self.__compact()
+
+    def remove(self, deviceID):
+        if self._entries.pop(deviceID, None) is not None:
+            self.__compact()
+
+    def __compact(self):
+        if len(self._heap) > max(2 * len(self._entries), self.MIN_COMPACT):
+            self._heap = list(self._entries.values())
+            heapify(self._heap)
+
+    def pop(self):
+        """
+        :return: deviceID of the best ranked device or None if empty
+        """
+        while self._heap:
+            item = heappop(self._heap)
+            if self._entries.get(item[2]) is item:
+                del self._entries[item[2]]
+                return item[2]
+        return None
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+
+
+class DeviceTopology(OrderedDict):
+    """
+    Default topology store of the Leader: deviceID -> DeviceInformation, least recently seen first.
+    Same reads as columnarstore.ColumnarTopology. Not thread-safe (LightDiscovery._db_lock).
+    """
+    def intern(self, deviceID):
+        """
+        :return: deviceID string kept by the store (the same object for every reply of a device) or deviceID if the
+                 device is not in the store
+        """
+        dev_obj = self.get(deviceID)
+        return deviceID if dev_obj is None else dev_obj.deviceID
+
+    def oldest(self):
+        """
+        :return: (deviceID, lastSeen) of the least recently seen device or None if empty
+        """
+        for deviceID, dev_obj in self.items():
+            return deviceID, dev_obj.lastSeen
+        return None
+
+    def countSeenBefore(self, lastSeen):
+        """
+        :return: Number of devices seen before lastSeen (only the oldest entries are checked)
+        """
+        count = 0
+        for dev_obj in self.values():
+            if dev_obj.lastSeen >= lastSeen:
+                break
+            count += 1
+        return count
+
+    def deviceIP(self, deviceID):
+        return self[deviceID].deviceIP
+
+    def pairs(self):
+        """
+        :return: Iterator of (deviceID, deviceIP), least recently seen first
+        """
+        return ((dev_obj.deviceID, dev_obj.deviceIP) for dev_obj in self.values())
+
+    def getDict(self, deviceID):
+        return self[deviceID].getDict()
+
+    def dicts(self):
+        """
+        :return: List of DeviceInformation dicc, least recently seen first
+        """
+        return [dev_obj.getDict() for dev_obj in self.values()]
+
 
 class DeviceInformation:
+    __slots__ = ('deviceID', 'deviceIP', 'cpu_cores', 'mem_avail', 'stg_avail', 'lastSeen')
+
     def __init__(self, json=None, dict=None, **kwargs):
         self.deviceID = str(kwargs.get('deviceID') if kwargs.get('deviceID') is not None else '')
         self.deviceIP = str(kwargs.get('deviceIP') if kwargs.get('deviceID') is not None else '')
         self.cpu_cores = int(kwargs.get('cpuCores') if kwargs.get('deviceID') is not None else 0)
         self.mem_avail = float(kwargs.get('memAvail') if kwargs.get('deviceID') is not None else .0)
         self.stg_avail = float(kwargs.get('stgAvail') if kwargs.get('deviceID') is not None else .0)
+        self.lastSeen = monotonic()     # Local reference, not sent
         if json is not None:
             correct = self.setJson(json)
         if dict is not None:
             correct = self.setDict(dict)
 
+    @staticmethod
+    def fromColumns(deviceID, deviceIP, cpu_cores, mem_avail, stg_avail, lastSeen):
+        """
+        :return: DeviceInformation read from the columnar topology store
+        """
+        dev_obj = DeviceInformation(deviceID=deviceID, deviceIP=deviceIP, cpuCores=cpu_cores, memAvail=mem_avail,
+                                    stgAvail=stg_avail)
+        dev_obj.lastSeen = lastSeen
+        return dev_obj
+
     def getJson(self):
         return dumps({
             'deviceID' : str(self.deviceID),
@@ -239,6 +1022,16 @@ class DeviceInformation:
             LOG.exception('Error on getting new device via Dict.')
             return False
 
+    def differs(self, other, delta=.0):
+        """
+        :param other: DeviceInformation
+        :param delta: Relative change of mem_avail and stg_avail ignored
+        :return: True if the device information changed
+        """
+        return self.deviceIP != other.deviceIP or self.cpu_cores != other.cpu_cores or \
+            abs(self.mem_avail - other.mem_avail) > delta * abs(other.mem_avail) or \
+            abs(self.stg_avail - other.stg_avail) > delta * abs(other.stg_avail)
+
     def getDict(self):
         return {
             'deviceID': str(self.deviceID),
@@ -20,12 +20,15 @@ from leaderprotection.arearesilience import AreaResilience
 from agentstart.agentstart import AgentStart
 from leaderprotection.leaderreelection import LeaderReelection
 from policies.policiesdistribution import PoliciesDistribution
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
 from lightdiscovery.lightdiscovery import LightDiscovery
+from common.CIMI import CIMI_READINESS
 
 from flask import Flask, request
+from werkzeug.serving import WSGIRequestHandler
 from flask_restplus import Api, Resource, fields
 from threading import Thread
-from time import sleep
+from time import sleep, monotonic
 import requests
 
 __status__ = 'Production'
@@ -39,6 +42,7 @@ arearesilience = AreaResilience()
 agentstart = AgentStart()
 policiesdistribution = PoliciesDistribution()
 lightdiscovery = LightDiscovery('', '')
+role_transition = {'lastRoleTransition': None, 'lastRoleTransitionTime': None, 'lastStopTime': None}
 
 # ### main.py code ### #
 # Set Logger
@@ -67,13 +71,51 @@ reelection_model = api.model('Reelection_msg', {
 })
 
 keepalive_model = api.model('Keepalive Message', {
-    'deviceID': fields.String(required=True, description='The deviceID of the device that is sending the message.')
+    'deviceID': fields.String(required=True, description='The deviceID of the device that is sending the message.'),
+    'controlVersion': fields.Integer(required=False, description='Version of the control state replicated in the backup.')
+})
+
+backup_model = api.model('Backup', {
+    'deviceID': fields.String(description='The deviceID of the backup.'),
+    'deviceIP': fields.String(description='The IP address of the backup.'),
+    'priority': fields.Integer(description='Order of the backup in the area.')
 })
 
 keepalive_reply_model = api.model('Keepalive Reply Message', {
     'deviceID': fields.String(required=True, description='The deviceID of the device that is replying the message.'),
     'backupPriority': fields.Integer(required=True, description='Order of the backup in the area.'),
-    'controlInformation': fields.String(required=False, description='Control Data Replication payload.')
+    'backups': fields.List(fields.Nested(backup_model), required=False, description='Backups of the area (used on Leader takeover).'),
+    'controlInformation': fields.String(required=False, description='Control Data Replication payload (JSON with the area state changes since controlVersion).')
+})
+
+ar_metrics_model = api.model('Area Resilience Metrics', {
+    'imLeader': fields.Boolean(description='If the actual role is Leader'),
+    'imBackup': fields.Boolean(description='If the actual role is Backup'),
+    'backups': fields.Integer(description='Number of registered backups (Leader only)'),
+    'lastProtectionRestoreTime': fields.Float(description='Seconds needed to restore BACKUP_MINIMUM on the last backup election'),
+    'keepaliveRTTLast': fields.Float(description='RTT of the last keepalive sent to the Leader (Backup only)'),
+    'keepaliveRTTMean': fields.Float(description='Mean RTT of the last keepalives sent to the Leader (Backup only)'),
+    'keepaliveRTTMax': fields.Float(description='Max RTT of the last keepalives sent to the Leader (Backup only)'),
+    'keepaliveReconnections': fields.Integer(description='Keepalive connections reopened after an error (Backup only)'),
+    'heartbeatsLost': fields.Integer(description='UDP heartbeats of the Leader not received (Backup only)'),
+    'lastFailureDetectionTime': fields.Float(description='Seconds from the last contact with the failed Leader to its failure detection (Backup only)'),
+    'lastLeaderlessWindow': fields.Float(description='Seconds from the last contact with the failed Leader to the takeover (new Leader only)'),
+    'controlVersion': fields.Integer(description='Version of the control state (Leader: master copy, Backup: replica)'),
+    'lastStopTime': fields.Float(description='Seconds needed to stop the module threads on the last stop'),
+    'lastRoleTransition': fields.String(description='Last role change of the agent (e.g. Backup -> Leader)'),
+    'lastRoleTransitionTime': fields.Float(description='Seconds needed to complete the last role change')
+})
+
+takeover_model = api.model('Takeover Claim', {
+    'deviceID': fields.String(required=True, description='The deviceID of the backup that claims the takeover.'),
+    'backupPriority': fields.Integer(required=True, description='Order of the backup in the area.')
+})
+
+takeover_reply_model = api.model('Takeover Claim Reply', {
+    'deviceID': fields.String(required=True, description='The deviceID of the device that is replying the claim.'),
+    'backupPriority': fields.Integer(required=True, description='Order of the backup in the area.'),
+    'imLeader': fields.Boolean(required=True, description='If the actual role is Leader'),
+    'imBackup': fields.Boolean(required=True, description='If the actual role is Backup')
 })
 
 leader_info_model = api.model('Leader Info Message', {
@@ -94,7 +136,20 @@ components_info_model = api.model('Resource Manager Components Information', {
     "identification_description": fields.String(description='Identification module description / parameters received'),
     "categorization_description": fields.String(description='Categorization module description / parameters received'),
     "policies_description": fields.String(description='Policies module description / parameters received'),
-    "cau_client_description": fields.String(description='CAUClient module description / parameters received')
+    "cau_client_description": fields.String(description='CAUClient module description / parameters received'),
+    "timeToReady": fields.Float(description='Seconds until the last startup trigger finished (critical path)'),
+    "criticalPath": fields.List(fields.String, description='Startup triggers on the critical path')
+})
+
+cimi_stats_model = api.model('CIMI Readiness', {
+    "ready": fields.Boolean(description='CIMI is up'),
+    "checks": fields.Integer(description='CIMI checks done'),
+    "failures": fields.Integer(description='CIMI checks failed'),
+    "availability": fields.Float(description='Ratio of successful checks'),
+    "latency": fields.Float(description='Smoothed latency of the successful checks (seconds)'),
+    "lastLatency": fields.Float(description='Latency of the last check (seconds)'),
+    "timeToReady": fields.Float(description='Seconds until CIMI was ready for the first time'),
+    "readyFor": fields.Float(description='Seconds since CIMI is ready')
 })
 
 policies_distr_model = api.model('Policies',{
@@ -104,7 +159,34 @@ policies_distr_model = api.model('Policies',{
     "ALSP": fields.String(description='Automatic Leader Selection Policies in JSON format.'),
     "LPP": fields.String(description='Leader Protection Policies in JSON format.'),
     "LRP": fields.String(description='Leader Reelection Policies in JSON format.'),
-    "DP": fields.String(description='Distribution Policies in JSON format.')
+    "DP": fields.String(description='Distribution Policies in JSON format.'),
+    "LDP": fields.String(description='Light Discovery Policies in JSON format.')
+})
+
+ld_metrics_model = api.model('Light Discovery Metrics', {
+    'devices': fields.Integer(description='Devices in the topology'),
+    'staleDevices': fields.Integer(description='Devices that missed the last beacon (last forced reply if REPLY_REFRESH_BEACONS > 1)'),
+    'evictions': fields.Integer(description='Devices removed from the topology (missed beacons or MAX_DEVICES)'),
+    'topologyVersion': fields.Integer(description='Version of the topology snapshot'),
+    'beaconsCoalesced': fields.Integer(description='Beacons received while a reply to the same Leader was pending (Scanning mode)'),
+    'beaconsDropped': fields.Integer(description='Beacons dropped because the reply pipeline was full (Scanning mode)'),
+    'repliesSuppressed': fields.Integer(description='Beacons not replied because nothing changed since the last reply (Scanning mode)'),
+    'udpReplies': fields.Integer(description='UDP beacon replies received (Beacon mode)'),
+    'udpFallbacks': fields.Integer(description='Leaders that receive HTTP beacon replies because the UDP ones were not acknowledged (Scanning mode)')
+})
+
+ld_leader_model = api.model('Light Discovery Leader', {
+    'leaderIP': fields.String(description='IP of the Leader'),
+    'leaderID': fields.String(description='ID of the Leader'),
+    'lastSeen': fields.Float(description='Seconds since the last beacon'),
+    'rtt': fields.Float(description='Smoothed beacon reply RTT (seconds), null until the first reply'),
+    'beacons': fields.Integer(description='Beacons received'),
+    'healthy': fields.Boolean(description='Beacons received in the last MAX_MISSED_BEACONS periods'),
+    'selected': fields.Boolean(description='Leader of this agent (disc_leaderIP)')
+})
+
+ld_leaders_model = api.model('Light Discovery Leaders', {
+    'leaders': fields.List(fields.Nested(ld_leader_model), description='Leaders heard in scanning mode')
 })
 
 beacon_reply_model = api.model('Beacon Reply',{
@@ -115,6 +197,21 @@ beacon_reply_model = api.model('Beacon Reply',{
     "stg_avail": fields.Float(required=True, description='Device Total Storage Available'),
 })
 
+beacon_replies_model = api.model('Beacon Replies',{
+    "devices": fields.List(fields.Nested(beacon_reply_model), required=True, description='Beacon replies of several Agents (deviceIP of the sender if empty)')
+})
+
+beacon_reply_result_model = api.model('Beacon Reply Result',{
+    "deviceID": fields.String(description='ID of the Agent'),
+    "status": fields.String(description='OK if the device is added/modified on the topology, ERROR otherwise'),
+    "error": fields.String(description='Error on the beacon reply record')
+})
+
+beacon_replies_result_model = api.model('Beacon Replies Result',{
+    "accepted": fields.Integer(description='Devices added/modified on the topology'),
+    "results": fields.List(fields.Nested(beacon_reply_result_model), description='Status of each record (same order)')
+})
+
 
 # API Endpoints
 # #### Resource Manager #### #
@@ -134,7 +231,9 @@ class ResourceManagerStatus(Resource):
             'identification': not agentstart.identification_failed if agentstart.identification_failed is not None else False,
             'cau_client': not agentstart.cauclient_failed if agentstart.cauclient_failed is not None else False,
             'categorization': not agentstart.categorization_failed if agentstart.categorization_failed is not None else False,
-            'policies': not agentstart.policies_failed if agentstart.policies_failed is not None else False
+            'policies': not agentstart.policies_failed if agentstart.policies_failed is not None else False,
+            'timeToReady': agentstart.startupReport.get('timeToReady') if agentstart.startupReport is not None else None,
+            'criticalPath': agentstart.startupReport.get('criticalPath') if agentstart.startupReport is not None else []
         }
         # if fcjp.isLeader:        # I'm a leader #TODO; Decide if there is any distinction if leader
         payload.update({'discovery_description': 'detectedLeaderID: \"{}\", MACaddr: \"{}\"'.format(
@@ -160,6 +259,17 @@ class ResourceManagerStatus(Resource):
         return payload, 200
 
 
+@rm.route('/cimi')
+class ResourceManagerCIMI(Resource):
+    """CIMI readiness"""
+    @rm.doc('get_cimi')
+    @rm.marshal_with(cimi_stats_model)
+    @rm.response(200, 'CIMI availability and latency')
+    def get(self):
+        """CIMI availability and latency stats"""
+        return CIMI_READINESS.getStats(), 200
+
+
 # #### Policies Module #### #
 @pl.route(URLS.END_START_FLOW)      # Start Agent
 class startAgent(Resource):
@@ -204,6 +314,7 @@ class role_change(Resource):
     def get(self, role):
         global arearesilience
         """Promotion/Demotion of the agent role."""
+        start = monotonic()
         imLeader = arearesilience.imLeader()
         imBackup = arearesilience.imBackup()
         if role.lower() == 'leader':
@@ -217,11 +328,16 @@ class role_change(Resource):
                 LOG.debug('Role change: Backup -> Leader')
                 # ret = agentstart.switch(imLeader=True)
                 lightdiscovery.stopScanning()
-                ret = lightdiscovery.startBeaconning()
+                # Start with the area state replicated from the failed Leader
+                ret = lightdiscovery.startBeaconning(seed=arearesilience.getReplicatedTopology())
+                replicated_policies = arearesilience.getReplicatedPolicies()
+                if len(replicated_policies) > 0:
+                    policiesdistribution.receivePolicies(replicated_policies)
                 if ret:
                     LOG.info('Successful promotion to Leader')
                 else:
                     LOG.warning('Unsuccessful promotion from Backup to Leader')
+                _roleTransitionDone('Backup -> Leader', start)
                 return {'imLeader': True, 'imBackup': False}, 200
             else:
                 # Nor leader, nor Backup, just a normal agent
@@ -247,6 +363,7 @@ class role_change(Resource):
                 ret = arearesilience.promotedToBackup(leaderIP=leaderIP)    # TODO: get leaderIP from CIMI
                 if ret:
                     LOG.info('Successful promotion to Backup')
+                    _roleTransitionDone('Agent -> Backup', start)
                     return {'imLeader': imLeader, 'imBackup': True}, 200
                 else:
                     LOG.warning('Unsuccessful promotion from Agent to Backup')
@@ -259,20 +376,24 @@ class role_change(Resource):
                 # Leader demotion
                 LOG.debug('Role change: Leader -> Agent')
                 arearesilience.stop()
+                role_transition['lastStopTime'] = arearesilience.lastStopTime   # The instance is replaced
                 # agentstart.switch(imLeader=False)
                 lightdiscovery.stopBeaconning()
                 lightdiscovery.startScanning()
                 CPARAMS.LEADER_FLAG = False
                 arearesilience = AreaResilience(cimi, policiesdistribution.LPP)
                 arearesilience.start(agentstart.deviceID)
+                _roleTransitionDone('Leader -> Agent', start)
                 return {'imLeader': False, 'imBackup': False}, 200
             elif imBackup:
                 # Maybe we are gonna call you latter.... or not
                 # Backup demotion
                 LOG.debug('Role change: Backup -> Agent')
                 arearesilience.stop()
+                role_transition['lastStopTime'] = arearesilience.lastStopTime   # The instance is replaced
                 arearesilience = AreaResilience(cimi, policiesdistribution.LPP)
                 arearesilience.start(agentstart.deviceID)
+                _roleTransitionDone('Backup -> Agent', start)
                 return {'imLeader': False, 'imBackup': False}, 200
             else:
                 # You're so tiny that I don't even care.
@@ -284,6 +405,12 @@ class role_change(Resource):
             return {'imLeader': imLeader, 'imBackup': imBackup}, 404
 
 
+def _roleTransitionDone(transition, start):
+    role_transition['lastRoleTransition'] = transition
+    role_transition['lastRoleTransitionTime'] = monotonic() - start
+    LOG.info('Role change {} done in {:.3f}s'.format(transition, role_transition['lastRoleTransitionTime']))
+
+
 @pl.route('/reelection')
 class reelection(Resource):
     """Reelection of the Leader"""
@@ -296,14 +423,10 @@ class reelection(Resource):
     @pl.response(404, 'Device not found or IP not available')
     def post(self):
         """Reelection of the Leader"""
-        found = False
-        deviceIP = ''
         deviceID = api.payload['deviceID']
-        for device in cimi('topology', default=[]):     # TODO: use real topology
-            if device.get('deviceID') == deviceID:
-                found = True
-                deviceIP = device.get('deviceIP')
-                break
+        device = lightdiscovery.get_topology_snapshot().byID.get(deviceID)
+        found = device is not None
+        deviceIP = device.get('deviceIP') if found else ''
 
         if not arearesilience.imLeader():
             LOG.error('Device is not a Leader, cannot perform a reelection in a non-leader device.')
@@ -339,12 +462,26 @@ class keepalive(Resource):
         LOG.debug('Device {} has sent a keepalive. Result correct: {}, Priority: {}'.format(api.payload['deviceID'],correct,priority))
         if correct:
             # Authorized
-            return {'deviceID': agentstart.deviceID, 'backupPriority': priority}, 200
+            reply = arearesilience.getKeepaliveReply(api.payload.get('controlVersion'))
+            reply.update({'deviceID': agentstart.deviceID, 'backupPriority': priority})
+            return reply, 200
         else:
             # Not Authorized
             return {'deviceID': agentstart.deviceID, 'backupPriority': priority}, 403
 
 
+@pl.route(URLS.END_POLICIES_TAKEOVER)
+class takeover(Resource):
+    """Takeover claim entrypoint"""
+    @pl.doc('post_takeover')
+    @pl.expect(takeover_model)
+    @pl.marshal_with(takeover_reply_model, code=200)
+    @pl.response(200, 'Agent alive, role and priority in the reply')
+    def post(self):
+        """Takeover claim of a backup that detected the Leader failure"""
+        return arearesilience.receive_takeover_claim(api.payload['deviceID'], api.payload['backupPriority']), 200
+
+
 @pl.route('/leaderinfo')
 class leaderInfo(Resource):     # TODO: Provisional, remove when possible
     """Leader and Backup information"""
@@ -359,6 +496,19 @@ class leaderInfo(Resource):     # TODO: Provisional, remove when possible
         }, 200
 
 
+@pl.route(URLS.END_POLICIES_METRICS)
+class arMetrics(Resource):
+    """Area Resilience metrics"""
+    @pl.doc('get_metrics')
+    @pl.marshal_with(ar_metrics_model, code=200)
+    @pl.response(200, 'Area Resilience metrics')
+    def get(self):
+        """Area Resilience metrics"""
+        metrics = arearesilience.getMetrics()
+        metrics.update(role_transition)
+        return metrics, 200
+
+
 @pl.route(URLS.END_POLICIESDISTR_RECV)
 class policyDistr(Resource):
     """Policies Distribution Entrypoint"""
@@ -415,6 +565,25 @@ class beaconReply(Resource):
             return '', 400
 
 
+@ld.route(URLS.END_BEACONREPLIES)
+class beaconReplies(Resource):
+    """Beacon Replies (batch)"""
+    @ld.doc('post_beaconreplies')
+    @ld.expect(beacon_replies_model)
+    @ld.marshal_with(beacon_replies_result_model, code=200)
+    @ld.response(200, 'Records processed, status of each one in the reply')
+    @ld.response(400, 'Error on beacon replies message')
+    def post(self):
+        """Beacon Replies (batch)"""
+        devices = api.payload.get('devices') if isinstance(api.payload, dict) else None
+        if not isinstance(devices, list):
+            return {'accepted': 0, 'results': []}, 400
+        deviceIP = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
+        results = [{'deviceID': deviceID, 'status': 'OK' if error is None else 'ERROR', 'error': error}
+                   for deviceID, error in lightdiscovery.recv_replies(devices, deviceIP)]
+        return {'accepted': sum(1 for result in results if result['status'] == 'OK'), 'results': results}, 200
+
+
 # noinspection PyUnresolvedReferences
 @ld.route('{}/<string:mode>/<string:operation>'.format(URLS.END_LDISCOVERY_CONTROL))
 @ld.param('mode', description='LDiscovery mode (beacon/scan)')
@@ -467,10 +636,67 @@ class ldiscoveryControl(Resource):
 @ld.route(URLS.END_LDISCOVERY_TOPOLOGY)
 class ldiscoveryTopology(Resource):
     """Get the current topology"""
-    @ld.doc('get_topology')
+    @ld.doc('get_topology', params={
+        'since': 'Change version known by the consumer: only the devices added/updated/removed after it are returned',
+        'limit': 'Page size (devices + removals)',
+        'cursor': 'Cursor of the previous page (same since)',
+        'full': 'true to include all the device information (cpu_cores, mem_avail, stg_avail)',
+        'minCpu': 'Devices with at least these cpu_cores',
+        'minMem': 'Devices with at least this mem_avail',
+        'minStg': 'Devices with at least this stg_avail',
+        'orderBy': 'Sort the devices by cpu_cores, mem_avail or stg_avail',
+        'order': 'desc (default) or asc',
+        'top': 'Max devices returned (the top ones if orderBy is set)'})
     @ld.response(200, 'Topology Successful received')
+    @ld.response(400, 'Wrong query parameters')
+    def get(self):
+        args = request.args
+        if any(key in args for key in ('minCpu', 'minMem', 'minStg', 'orderBy', 'order', 'top')):
+            try:
+                minimums = {field: float(args[key]) for key, field in
+                            (('minCpu', 'cpu_cores'), ('minMem', 'mem_avail'), ('minStg', 'stg_avail')) if key in args}
+                top = int(args['top']) if 'top' in args else None
+                if top is not None and top <= 0:
+                    raise ValueError('top must be positive')
+                devices = lightdiscovery.query_topology(minimums, order_by=args.get('orderBy'), k=top,
+                                                        descending=args.get('order', 'desc').lower() != 'asc')
+            except ValueError as ex:
+                return {'error': str(ex)}, 400
+            return {'devices': devices}, 200
+        if not any(key in args for key in ('since', 'limit', 'cursor', 'full')):
+            return {'topology': lightdiscovery.get_topology()}, 200
+        try:
+            since = int(args['since']) if 'since' in args else None
+            limit = int(args['limit']) if 'limit' in args else None
+            cursor = int(args['cursor']) if 'cursor' in args else None
+            if (limit is not None and limit <= 0) or (cursor is not None and cursor < 0):
+                raise ValueError('limit must be positive and cursor must not be negative')
+        except ValueError as ex:
+            return {'error': str(ex)}, 400
+        full = args.get('full', 'false').lower() in ('true', '1')
+        return lightdiscovery.get_topology_changes(since=since, limit=limit, cursor=cursor, info=full), 200
+
+
+@ld.route(URLS.END_LDISCOVERY_METRICS)
+class ldiscoveryMetrics(Resource):
+    """Light Discovery topology metrics"""
+    @ld.doc('get_metrics')
+    @ld.marshal_with(ld_metrics_model, code=200)
+    @ld.response(200, 'Light Discovery metrics')
+    def get(self):
+        """Light Discovery topology metrics"""
+        return lightdiscovery.get_stats(), 200
+
+
+@ld.route(URLS.END_LDISCOVERY_LEADERS)
+class ldiscoveryLeaders(Resource):
+    """Leaders heard by this agent"""
+    @ld.doc('get_leaders')
+    @ld.marshal_with(ld_leaders_model, code=200)
+    @ld.response(200, 'Leader table')
     def get(self):
-        return {'topology': lightdiscovery.get_topology()}, 200
+        """Leaders heard in scanning mode (the selected one has the lowest RTT, with hysteresis)"""
+        return {'leaders': lightdiscovery.get_leaders()}, 200
 
 
 # And da Main Program
@@ -479,18 +705,23 @@ def cimi(key, default=None):
     if key == 'leader':
         value = CPARAMS.LEADER_FLAG
     elif key == 'topology':
-        value = []
-        try:
-            # for item in CPARAMS.TOPOLOGY_FLAG:
-            for item in lightdiscovery.get_topology():
-                i = {
-                    'deviceID': item[0],
-                    'deviceIP': item[1]
-                }
-                value.append(i)
-        except:
-            LOG.exception('Topology Environment variable format is not correct.')
-            value = []
+        # Read-only devices ({'deviceID', 'deviceIP'}) of the current topology snapshot
+        value = lightdiscovery.get_topology_snapshot().devices
+    elif key == 'topology_version':
+        value = lightdiscovery.get_topology_version()
+    elif key == 'backup_candidate':
+        value = lightdiscovery.pop_candidate()
+        if value is None:
+            value = default
+    elif key == 'restore_candidate':
+        # Function (deviceID) to rank again a backup candidate that was not elected
+        value = lightdiscovery.restore_candidate
+    elif key == 'capable':
+        value = lightdiscovery.is_capable()
+    elif key == 'topology_info':
+        value = lightdiscovery.get_topology_info()
+    elif key == 'policies':
+        value = policiesdistribution.getPolicies()
     elif key == 'disc_leaderIP':
         value = lightdiscovery.leaderIP
         if value is None:
@@ -528,15 +759,25 @@ def initialization():
 
     # 4. Light Discovery Module Creation
     LOG.debug('Light Discovery submodule creation')
-    lightdiscovery = LightDiscovery(CPARAMS.BROADCAST_ADDR_FLAG,CPARAMS.DEVICEID_FLAG)
+    lightdiscovery = LightDiscovery(CPARAMS.BROADCAST_ADDR_FLAG,CPARAMS.DEVICEID_FLAG, policiesdistribution.LMR, policiesdistribution.LDR, policiesdistribution.LDP)
     LOG.debug('Light discovery created')
 
     return
 
 
+class PoliciesRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'   # Keep-alive connections (i.e. Backup keepalive session)
+
+    @property
+    def timeout(self):
+        # Each open connection holds a server thread: the idle ones are closed after TIME_KEEPALIVE + margin
+        # (read on each new connection, so a new TIME_KEEPALIVE policy applies to the next sessions)
+        return LeaderProtectionPolicies().getIdleConnectionTimeout()
+
+
 def main():
     LOG.info('API documentation page at: http://{}:{}/'.format('localhost', 46050))
-    app.run(debug=False, host='0.0.0.0', port=CPARAMS.POLICIES_PORT)
+    app.run(debug=False, host='0.0.0.0', port=CPARAMS.POLICIES_PORT, request_handler=PoliciesRequestHandler)
 
 
 def debug():
@@ -89,3 +89,19 @@ class LeaderDiscretionaryRequirements:
                 return self.POLICIES.get(key)
             else:
                 return default
+
+
+def capabilityScore(lmr, ldr, cpu_cores, mem_avail, stg_avail):
+    """
+    Evaluate the capability of a device to be Leader/Backup
+    :param lmr: LeaderMandatoryRequirements
+    :param ldr: LeaderDiscretionaryRequirements
+    :param cpu_cores: Number of logical cores
+    :param mem_avail: Memory available (GBytes)
+    :param stg_avail: Storage available (GBytes)
+    :return: Comparable score (higher is better) or None if the mandatory requirements are not met
+    """
+    if mem_avail * 1024. < float(lmr.get(lmr.RAM_MIN, default=.0)):
+        return None
+    discretionary = stg_avail * 1024. >= float(ldr.get(ldr.DISK_MIN, default=.0))
+    return int(discretionary), cpu_cores, mem_avail, stg_avail
@@ -8,6 +8,7 @@
 from json import loads, dumps, JSONDecodeError
 from threading import Lock
 from common.logs import LOG
+from common.common import CPARAMS
 
 __maintainer__ = 'Alejandro Jurnet'
 __email__ = 'ajurnet@ac.upc.edu'
@@ -21,18 +22,41 @@ class LeaderProtectionPolicies:
         'MAX_TTL': 3 / .1,                      # 30 ticks ~ 3 secs (Time to Live for backups)
         'MAX_RETRY_ATTEMPTS': 5,                # Retry attempts before Leader Down
         'TIME_TO_WAIT_BACKUP_SELECTION': 3,     # Time until check backups
+        'MAX_PARALLEL_ELECTIONS': 4,            # Election messages in flight when electing new backups
         'TIME_KEEPALIVE': 1,                    # Time until check leader from backup
-        'TIME_KEEPER': .1                       # Leader decreasing TTL on backups
+        'HEARTBEAT_MODE': 'REST',               # REST: Backups send keepalives; UDP: Leader pushes heartbeats
+        'HEARTBEAT_GROUP': None,                # Multicast group or broadcast address for UDP heartbeats
+        'TAKEOVER_TIMEOUT': 10.,                # Time to wait for the takeover of a backup with more preference
+        'FAILURE_DETECTOR': 'FIXED',            # FIXED: MAX_RETRY_ATTEMPTS and MAX_TTL; PHI: Phi Accrual detector
+        'PHI_THRESHOLD': 8.,                    # Suspicion level to assume Leader/Backup down (PHI detector)
+        'PHI_MIN_STD_DEVIATION': .1,            # Minimum deviation of the keepalive inter-arrival times (PHI detector)
+        'CHECK_CAPABILITY': False,              # Agent checks the Leader Mandatory Requirements to be backup
+        'TIME_KEEPER': .1                       # Length of a MAX_TTL tick (backup deadline = MAX_TTL * TIME_KEEPER)
     }
 
     BACKUP_MINIMUM = 'BACKUP_MINIMUM'
     BACKUP_MAXIMUM = 'BACKUP_MAXIMUM'
     MAX_TTL = 'MAX_TTL'
     MAX_RETRY_ATTEMPTS = 'MAX_RETRY_ATTEMPTS'
+    MAX_PARALLEL_ELECTIONS = 'MAX_PARALLEL_ELECTIONS'
 
     TIME_TO_WAIT_BACKUP_SELECTION = 'TIME_TO_WAIT_BACKUP_SELECTION'
     TIME_KEEPALIVE = 'TIME_KEEPALIVE'
     TIME_KEEPER = 'TIME_KEEPER'
+    HEARTBEAT_MODE = 'HEARTBEAT_MODE'
+    HEARTBEAT_GROUP = 'HEARTBEAT_GROUP'
+
+    TAKEOVER_TIMEOUT = 'TAKEOVER_TIMEOUT'
+    FAILURE_DETECTOR = 'FAILURE_DETECTOR'
+    PHI_THRESHOLD = 'PHI_THRESHOLD'
+    PHI_MIN_STD_DEVIATION = 'PHI_MIN_STD_DEVIATION'
+    CHECK_CAPABILITY = 'CHECK_CAPABILITY'
+
+    FAILURE_DETECTOR_FIXED = 'FIXED'
+    FAILURE_DETECTOR_PHI = 'PHI'
+
+    HEARTBEAT_MODE_REST = 'REST'
+    HEARTBEAT_MODE_UDP = 'UDP'
 
     __lock = Lock()
 
@@ -64,4 +88,12 @@ class LeaderProtectionPolicies:
             else:
                 return default
 
+    def getIdleConnectionTimeout(self):
+        """
+        Idle time after which a keep-alive connection of the Policies API is closed (and its server thread released):
+        the Backup keepalive period (TIME_KEEPALIVE) plus a margin, so the keepalive session of the Backups is reused
+        :return: Timeout in seconds
+        """
+        return float(self.get(self.TIME_KEEPALIVE)) + CPARAMS.TIME_IDLE_MARGIN
+
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+    LIGHT DISCOVERY POLICIES
+    Common methods and utilities
+"""
+
+from json import loads, dumps, JSONDecodeError
+from threading import Lock
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class LightDiscoveryPolicies:
+
+    POLICIES = {
+        'BEACON_PERIOD': 5.,            # Leader: seconds between beacons
+        'REPLY_WINDOW': 2.,             # Leader: seconds advertised in the beacons to spread the replies (0: immediate)
+        'MAX_MISSED_BEACONS': 3,        # Beacon periods without reply until a device is removed from the topology
+        'MAX_DEVICES': 10000,           # Max devices in the topology (the least recently seen are removed first)
+        'UDP_BEACON_REPLY': False,      # Leader: advertise the UDP beacon reply port in the beacons
+        'MAX_UNACKED_REPLIES': 3,       # Agent: UDP replies without ack until the HTTP beacon reply is used
+        'METRICS_DELTA': .1,            # Relative change of mem_avail/stg_avail considered a device update
+        'REPLY_REFRESH_BEACONS': 1,     # Agent: beacons between forced replies if nothing changed (1: reply to all)
+        'LEADER_HYSTERESIS': .2,        # Agent: relative RTT improvement needed to change to another Leader
+        'COLUMNAR_TOPOLOGY': False      # Leader: columnar copy of the topology for the queries (NumPy required)
+    }
+
+    BEACON_PERIOD = 'BEACON_PERIOD'
+    REPLY_WINDOW = 'REPLY_WINDOW'
+    MAX_MISSED_BEACONS = 'MAX_MISSED_BEACONS'
+    MAX_DEVICES = 'MAX_DEVICES'
+    UDP_BEACON_REPLY = 'UDP_BEACON_REPLY'
+    MAX_UNACKED_REPLIES = 'MAX_UNACKED_REPLIES'
+    METRICS_DELTA = 'METRICS_DELTA'
+    REPLY_REFRESH_BEACONS = 'REPLY_REFRESH_BEACONS'
+    LEADER_HYSTERESIS = 'LEADER_HYSTERESIS'
+    COLUMNAR_TOPOLOGY = 'COLUMNAR_TOPOLOGY'
+
+    __lock = Lock()
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            if key in self.POLICIES.keys():
+                self.POLICIES[key] = value
+
+    def get_json(self):
+        with self.__lock:
+            return dumps(self.POLICIES)
+
+    def set_json(self, json):
+        with self.__lock:
+            try:
+                ljson = loads(json)
+                for key in ljson.keys():
+                    if key in self.POLICIES.keys():
+                        self.POLICIES[key] = ljson[key]
+                return True
+            except JSONDecodeError:
+                LOG.exception('Error on getting new policies.')
+                return False
+
+    def get(self, key, default=None):
+        with self.__lock:
+            if key in self.POLICIES:
+                return self.POLICIES.get(key)
+            else:
+                return default
\ No newline at end of file
@@ -17,6 +17,7 @@ from policies.agentcapability import LeaderDiscretionaryRequirements, LeaderMand
 from policies.leaderprotectionpolicies import LeaderProtectionPolicies
 from policies.leaderselectionpolicies import AutomaticLeaderSelectionPolicies, PassiveLeaderSelectionPolicies
 from policies.leaderreelectionpolicies import LeaderReelectionPolicies
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
 
 
 __maintainer__ = 'Alejandro Jurnet'
@@ -73,6 +74,7 @@ class PoliciesDistribution:
             'LPP': LeaderProtectionPolicies(),
             'LRP': LeaderReelectionPolicies(),
             'DP': DistributionPolicies(),
+            'LDP': LightDiscoveryPolicies(),
         }
         self.LMR = self.__POLICIES['LMR']
         self.LDR = self.__POLICIES['LDR']
@@ -81,6 +83,7 @@ class PoliciesDistribution:
         self.LPP = self.__POLICIES['LPP']
         self.LRP = self.__POLICIES['LRP']
         self.DP = self.__POLICIES['DP']
+        self.LDP = self.__POLICIES['LDP']
 
     def distributePolicies(self, listIPs):
         # 1. Get all the policies
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Agent Start startup graph (triggers replaced by stubs)
+"""
+
+import logging
+import threading
+import unittest
+from unittest import mock
+
+from agentstart import agentstart
+from agentstart.agentstart import AgentStart
+from agentstart.taskgraph import TaskGraph
+from common.common import CPARAMS
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestAgentStartup(unittest.TestCase):
+    def setUp(self):
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        for target, name, value in ((agentstart.CIMI_READINESS, 'wait', lambda timeout=None: True),
+                                    (agentstart.CIMI, 'createAgentResource', lambda data: 'agent/1'),
+                                    (agentstart.CIMI, 'modify_resource', lambda resourceID, data: None),
+                                    (CPARAMS, 'DEBUG_FLAG', False)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.triggered = []
+        self.lock = threading.Lock()
+        self.agent = AgentStart()
+        self.trigger('requestID', self.__identification)
+        self.trigger('startScan', self.__scan)
+        self.trigger('triggerCAUclient')
+        self.trigger('startCategorization')
+        self.trigger('startLeaderProtectionPolicies', lambda: True)
+        self.trigger('startDiscoveryWatch')
+        self.trigger('aliveDiscovery', lambda: self.agent.stop() or True)
+
+    def __identification(self):
+        self.agent.deviceID, self.agent.IDkey = 'agent/1', 'key'
+
+    def __scan(self):
+        self.agent.detectedLeaderID, self.agent.MACaddr = 'leader/1', '00:00:00:00:00:01'
+
+    def trigger(self, name, function=lambda: None):
+        def stub():
+            with self.lock:
+                self.triggered.append(name)
+            return function()
+        setattr(self.agent, '_AgentStart__trigger_{}'.format(name), stub)
+
+    def failTrigger(self, name):
+        def failure():
+            raise RuntimeError('{} failed'.format(name))
+        self.trigger(name, failure)
+
+    def run_startup(self):
+        self.agent.start(False)
+        self.agent.th_proc.join(5.)
+        self.assertFalse(self.agent.th_proc.is_alive())
+        return {name: task['status'] for name, task in self.agent.startupReport['tasks'].items()}
+
+    def test_startup(self):
+        status = self.run_startup()
+        self.assertEqual(set(status.values()), {TaskGraph.DONE})
+        self.assertIn('startDiscoveryWatch', self.triggered)
+        self.assertEqual(self.agent.startupReport['criticalPath'][-1], 'policies')
+
+    def test_cau_client_failure_stops_area_resilience(self):
+        self.failTrigger('triggerCAUclient')
+        status = self.run_startup()
+        self.assertEqual(status['cau_client'], TaskGraph.FAILED)
+        self.assertEqual(status['policies'], TaskGraph.CANCELLED)
+        self.assertNotIn('startLeaderProtectionPolicies', self.triggered)
+        self.assertNotIn('startDiscoveryWatch', self.triggered)
+
+    def test_categorization_failure_stops_area_resilience(self):
+        self.failTrigger('startCategorization')
+        status = self.run_startup()
+        self.assertEqual(status['categorization'], TaskGraph.FAILED)
+        self.assertEqual(status['policies'], TaskGraph.CANCELLED)
+        self.assertNotIn('startLeaderProtectionPolicies', self.triggered)
+
+    def test_failures_ignored_with_debug_flag(self):
+        CPARAMS.DEBUG_FLAG = True
+        self.failTrigger('triggerCAUclient')
+        status = self.run_startup()
+        self.assertEqual(status['policies'], TaskGraph.DONE)
+        self.assertIn('startLeaderProtectionPolicies', self.triggered)
+
+    def test_identification_failure(self):
+        self.failTrigger('requestID')
+        status = self.run_startup()
+        self.assertEqual(status['identification'], TaskGraph.FAILED)
+        for name in ('cau_client', 'categorization', 'policies'):
+            self.assertEqual(status[name], TaskGraph.CANCELLED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Area Resilience shutdown (Leader and Backup threads waiting on long periods)
+"""
+
+import logging
+import threading
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+
+from common.common import CPARAMS, URLS
+from common.logs import LOG
+from leaderprotection.arearesilience import AreaResilience
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestAreaResilienceStop(unittest.TestCase):
+    MAX_STOP_TIME = .5  # Much shorter than the periods of the module threads
+
+    def setUp(self):
+        self._policies = dict(LeaderProtectionPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.lpp = LeaderProtectionPolicies(TIME_KEEPALIVE=10., TIME_TO_WAIT_BACKUP_SELECTION=10., BACKUP_MINIMUM=1,
+                                            HEARTBEAT_MODE='REST', FAILURE_DETECTOR='FIXED', CHECK_CAPABILITY=False)
+        self.cimi = {'leader': False}
+        self.ar = AreaResilience(lambda key, default=None: self.cimi.get(key, default), self.lpp)
+        self.addCleanup(self.ar.stop)
+
+    def tearDown(self):
+        LeaderProtectionPolicies.POLICIES.update(self._policies)
+
+    def leader(self):
+        """
+        Leader with the keepalive endpoint of the Policies API (only the keepalive reply)
+        :return: Event set on the first keepalive
+        """
+        received = threading.Event()
+        app = Flask('test_arearesilience')
+
+        @app.route(URLS.URL_POLICIES_KEEPALIVE, methods=['POST'])
+        def keepalive():
+            received.set()
+            return jsonify({'deviceID': 'leader/1', 'backupPriority': 1, 'backups': None, 'controlInformation': None})
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        th_srv = threading.Thread(target=server.serve_forever, daemon=True)
+        th_srv.start()
+        self.addCleanup(th_srv.join)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch.object(CPARAMS, 'POLICIES_PORT', server.port)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return received
+
+    def assertStopped(self):
+        threads = [self.ar.th_proc, self.ar.th_keep]
+        self.ar.stop()
+        for thread in threads:
+            self.assertFalse(thread is not None and thread.is_alive())
+        self.assertLess(self.ar.lastStopTime, self.MAX_STOP_TIME)
+        self.assertEqual(self.ar.getMetrics()['lastStopTime'], self.ar.lastStopTime)
+
+    def test_leader_stop(self):
+        self.cimi['leader'] = True
+        self.assertTrue(self.ar.start('leader/1'))
+        # Backup selection done (no candidates): waiting for the next selection and the keeper for new backups
+        while self.ar.th_keep is None:
+            threading.Event().wait(.01)
+        threading.Event().wait(.1)
+        self.assertTrue(self.ar.th_proc.is_alive())
+        self.assertStopped()
+
+    def test_backup_stop(self):
+        received = self.leader()
+        self.assertTrue(self.ar.start('backup/1'))
+        self.ar.th_proc.join(5.)
+        self.assertTrue(self.ar.promotedToBackup('127.0.0.1'))
+        # Keepalive sent: waiting for the next one (TIME_KEEPALIVE)
+        self.assertTrue(received.wait(5.))
+        threading.Event().wait(.1)
+        self.assertTrue(self.ar.imBackup())
+        self.assertTrue(self.ar.th_proc.is_alive())
+        self.assertStopped()
+        self.assertFalse(self.ar.imLeader())
+
+    def test_stop_not_started(self):
+        self.ar.stop()
+        self.assertIsNone(self.ar.lastStopTime)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Area Resilience concurrent backup election (election messages replaced by stubs)
+"""
+
+import logging
+import threading
+import unittest
+from time import monotonic
+
+from common.logs import LOG
+from leaderprotection.arearesilience import AreaResilience
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def device(i):
+    return {'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.0.0.{}'.format(i)}
+
+
+class TestBackupElection(unittest.TestCase):
+    def setUp(self):
+        self._policies = dict(LeaderProtectionPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.lpp = LeaderProtectionPolicies(MAX_PARALLEL_ELECTIONS=4, BACKUP_MINIMUM=1, TIME_TO_WAIT_BACKUP_SELECTION=.05)
+        self.restored = []
+        self.ar = AreaResilience(self.cimi, self.lpp)
+        self.ar._connected = True
+        # Election replies: IP -> (delay, accepted)
+        self.replies = {}
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.elected = []
+        self.demoted = []
+        self.ar._AreaResilience__send_election_message = self.election
+        self.ar._AreaResilience__send_demotion_message = self.demotion
+
+    def tearDown(self):
+        self.ar._connected = False
+        LeaderProtectionPolicies.POLICIES.update(self._policies)
+
+    def cimi(self, key, default=None):
+        if key == 'restore_candidate':
+            return self.restored.append
+        return default
+
+    def election(self, address):
+        delay, accepted = self.replies.get(address, (.0, True))
+        with self.lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        threading.Event().wait(delay)
+        with self.lock:
+            self.inFlight -= 1
+            self.elected.append(address)
+        return accepted
+
+    def demotion(self, address):
+        with self.lock:
+            self.demoted.append(address)
+        return True
+
+    def elect(self, candidates, needed):
+        rejected = []
+        new_backups = self.ar._AreaResilience__electBackups(candidates, needed, rejected)
+        return new_backups, rejected
+
+    def waitFor(self, condition, timeout=5.):
+        deadline = monotonic() + timeout
+        while not condition() and monotonic() < deadline:
+            threading.Event().wait(.01)
+        return condition()
+
+    def test_first_acceptances_elected(self):
+        self.replies['10.0.0.0'] = (.3, True)   # Slow: the others are elected first
+        start = monotonic()
+        new_backups, rejected = self.elect([device(i) for i in range(4)], 2)
+        self.assertLess(monotonic() - start, .3)
+        self.assertEqual(len(new_backups), 2)
+        self.assertNotIn('agent/0', [backup.deviceID for backup in new_backups])
+        self.assertEqual([backup.priority for backup in new_backups], [1, 2])
+        self.assertEqual(len(self.ar.backupDatabase), 2)
+        self.assertEqual(rejected, [])
+        # The slow candidate accepts later and is demoted (and ranked again)
+        self.assertTrue(self.waitFor(lambda: '10.0.0.0' in self.demoted))
+        self.assertTrue(self.waitFor(lambda: 'agent/0' in self.restored))
+
+    def test_rejected_candidates(self):
+        for i in (0, 1, 2):
+            self.replies['10.0.0.{}'.format(i)] = (.0, False)
+        new_backups, rejected = self.elect([device(i) for i in range(6)], 2)
+        self.assertEqual(len(new_backups), 2)
+        self.assertEqual(sorted(d['deviceID'] for d in rejected), ['agent/0', 'agent/1', 'agent/2'])
+        self.assertTrue(all(backup.deviceID not in ('agent/0', 'agent/1', 'agent/2') for backup in new_backups))
+
+    def test_elections_in_flight_bounded(self):
+        LeaderProtectionPolicies(MAX_PARALLEL_ELECTIONS=3)
+        for i in range(10):
+            self.replies['10.0.0.{}'.format(i)] = (.05, False)
+        new_backups, rejected = self.elect([device(i) for i in range(10)], 1)
+        self.assertEqual(new_backups, [])
+        self.assertEqual(len(rejected), 10)
+        self.assertEqual(self.maxInFlight, 3)
+
+    def test_dead_candidates_do_not_delay_protection(self):
+        # Dead candidates answer after the election timeout: the live ones are elected meanwhile
+        for i in range(3):
+            self.replies['10.0.0.{}'.format(i)] = (.5, False)
+        start = monotonic()
+        new_backups, _ = self.elect([device(i) for i in range(4)], 1)
+        self.assertLess(monotonic() - start, .5)
+        self.assertEqual([backup.deviceID for backup in new_backups], ['agent/3'])
+
+    def test_nothing_needed(self):
+        self.assertEqual(self.elect([device(0)], 0), ([], []))
+        self.assertEqual(self.elected, [])
+
+    def test_protection_restore_time(self):
+        candidates = [device(i) for i in range(3)]
+        self.replies['10.0.0.0'] = (.1, True)
+        self.ar._CIMIRequesterFunction = lambda key, default=None: \
+            (candidates.pop(0) if candidates else None) if key == 'backup_candidate' else self.cimi(key, default)
+        th_proc = threading.Thread(target=self.ar._AreaResilience__backupSelection, daemon=True)
+        th_proc.start()
+        self.assertTrue(self.waitFor(lambda: self.ar.lastProtectionRestoreTime is not None))
+        self.ar._connected = False
+        self.ar._stopEvent.set()
+        th_proc.join(5.)
+        self.assertFalse(th_proc.is_alive())
+        self.assertLess(self.ar.lastProtectionRestoreTime, .1)
+        self.assertEqual(self.ar.getMetrics()['backups'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
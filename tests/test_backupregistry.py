@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Area Resilience backup registry (monotonic deadlines)
+"""
+
+import unittest
+
+from leaderprotection.arearesilience import BackupEntry, BackupRegistry
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def entry(deviceID, priority, deadline):
+    backup = BackupEntry(deviceID, '10.0.0.{}'.format(priority), priority)
+    backup.deadline = deadline
+    return backup
+
+
+class TestBackupRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = BackupRegistry()
+
+    def test_add_and_replace(self):
+        self.assertTrue(self.registry.add(entry('a', 1, 10.)))
+        self.assertFalse(self.registry.add(entry('a', 2, 10.)))
+        self.assertEqual(len(self.registry), 1)
+        self.assertEqual(self.registry.get('a').priority, 2)
+
+    def test_entries_ordered_by_priority(self):
+        for deviceID, priority in (('c', 3), ('a', 1), ('b', 2)):
+            self.registry.add(entry(deviceID, priority, 10.))
+        self.assertEqual([backup.deviceID for backup in self.registry.entries()], ['a', 'b', 'c'])
+
+    def test_entries_cached_until_changed(self):
+        self.registry.add(entry('a', 2, 10.))
+        self.registry.add(entry('b', 1, 10.))
+        version = self.registry.version
+        entries = self.registry.entries()
+        self.registry.refresh('a', 20.)
+        self.assertIs(self.registry.entries(), entries)
+        self.assertEqual(self.registry.version, version)
+        self.registry.setPriority('a', 0)
+        self.assertGreater(self.registry.version, version)
+        self.assertEqual([backup.deviceID for backup in self.registry.entries()], ['a', 'b'])
+        version = self.registry.version
+        self.registry.setPriority('a', 0)
+        self.assertEqual(self.registry.version, version)
+        self.registry.popExpired(15.)
+        self.assertEqual([backup.deviceID for backup in self.registry.entries()], ['a'])
+        self.assertGreater(self.registry.version, version)
+
+    def test_pop_expired(self):
+        self.registry.add(entry('a', 1, 10.))
+        self.registry.add(entry('b', 2, 20.))
+        self.assertEqual(self.registry.popExpired(5.), [])
+        self.assertEqual([backup.deviceID for backup in self.registry.popExpired(10.)], ['a'])
+        self.assertNotIn('a', self.registry)
+        self.assertIn('b', self.registry)
+
+    def test_refresh_moves_deadline_forward_only(self):
+        self.registry.add(entry('a', 1, 10.))
+        self.registry.refresh('a', 30.)
+        self.registry.refresh('a', 15.)
+        self.assertEqual(self.registry.get('a').deadline, 30.)
+        self.assertEqual(self.registry.popExpired(20.), [])
+        # Rescheduled with the refreshed deadline
+        self.assertEqual(self.registry.nextDeadline(), 30.)
+        self.assertEqual(len(self.registry.popExpired(30.)), 1)
+
+    def test_refresh_unknown(self):
+        self.assertIsNone(self.registry.refresh('a', 10.))
+
+    def test_removed_and_replaced_entries_do_not_expire(self):
+        self.registry.add(entry('a', 1, 10.))
+        self.registry.add(entry('b', 2, 10.))
+        self.registry.remove('a')
+        self.registry.add(entry('b', 3, 50.))
+        self.assertEqual(self.registry.nextDeadline(), 50.)
+        self.assertEqual(self.registry.popExpired(20.), [])
+        self.assertEqual(len(self.registry), 1)
+
+    def test_next_deadline_empty(self):
+        self.assertIsNone(self.registry.nextDeadline())
+        self.registry.add(entry('a', 1, 10.))
+        self.registry.clear()
+        self.assertIsNone(self.registry.nextDeadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - UDP beacon reply messages and Leader receiver
+"""
+
+import logging
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from common.common import CPARAMS
+from common.logs import LOG
+from lightdiscovery import beaconreply
+from lightdiscovery.lightdiscovery import LightDiscovery
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+from tests.test_scanning import free_port, wait_for
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestBeaconReply(unittest.TestCase):
+    def test_reply_roundtrip(self):
+        msg = beaconreply.unpack(beaconreply.pack_reply(2 ** 32 + 7, 'agent/1', 4, 8., 100.5))
+        self.assertIsInstance(msg, beaconreply.BeaconReply)
+        self.assertEqual(msg.seq, 7)
+        self.assertEqual(msg.getDict(), {'deviceID': 'agent/1', 'cpu_cores': 4, 'mem_avail': 8., 'stg_avail': 100.5})
+
+    def test_ack_roundtrip(self):
+        msg = beaconreply.unpack(beaconreply.pack_ack(9))
+        self.assertIsInstance(msg, beaconreply.BeaconReplyAck)
+        self.assertEqual(msg.seq, 9)
+
+    def test_limits(self):
+        data = beaconreply.pack_reply(1, 'a' * 300, 10 ** 6, 1., 1.)
+        self.assertLessEqual(len(data), beaconreply.MAX_DATAGRAM)
+        msg = beaconreply.unpack(data)
+        self.assertEqual(msg.deviceID, 'a' * 255)
+        self.assertEqual(msg.cpu_cores, 32767)
+
+    def test_malformed(self):
+        data = beaconreply.pack_reply(1, 'agent/1', 4, 8., 100.)
+        self.assertIsNone(beaconreply.unpack(b'XXXX' + data[4:]))
+        self.assertIsNone(beaconreply.unpack(data[:-3]))
+        self.assertIsNone(beaconreply.unpack(b''))
+        self.assertIsNone(beaconreply.unpack(beaconreply.pack_reply(1, '', 4, 8., 100.)))
+        self.assertIsNone(beaconreply.unpack(data[:4] + bytes((beaconreply.VERSION + 1,)) + data[5:]))
+
+
+class TestUDPReplyReceiver(unittest.TestCase):
+    def setUp(self):
+        self._policies = dict(LightDiscoveryPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        patcher = mock.patch.object(CPARAMS, 'BEACONREPLY_PORT', free_port())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ld = LightDiscovery('', 'leader/1', ldp=LightDiscoveryPolicies(UDP_BEACON_REPLY=False, MAX_DEVICES=10000))
+        # Topology store of the Leader mode, the UDP receiver runs alone
+        self.ld.startBeaconning()
+        self.ld.stopBeaconning()
+        self.ld.RECV_TIMEOUT = .1
+        self.ld._connected = True
+        th_udp = threading.Thread(target=self.ld._LightDiscovery__udpReplies_flow, daemon=True)
+        th_udp.start()
+        self.addCleanup(th_udp.join)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(.1)
+        self.addCleanup(self.sock.close)
+
+    def tearDown(self):
+        self.ld._connected = False
+        LightDiscoveryPolicies.POLICIES.update(self._policies)
+
+    def send(self, data):
+        self.sock.sendto(data, ('127.0.0.1', CPARAMS.BEACONREPLY_PORT))
+
+    def ack(self):
+        try:
+            return beaconreply.unpack(self.sock.recv(beaconreply.MAX_DATAGRAM))
+        except socket.timeout:
+            return None
+
+    def test_reply_acknowledged(self):
+        # Sent again until the receiver is bound
+        ack = None
+        for _ in range(50):
+            self.send(beaconreply.pack_reply(5, 'agent/1', 4, 8., 100.))
+            ack = self.ack()
+            if ack is not None:
+                break
+        self.assertIsInstance(ack, beaconreply.BeaconReplyAck)
+        self.assertEqual(ack.seq, 5)
+        self.assertEqual(self.ld.get_topology(), (('agent/1', '127.0.0.1'),))
+        self.assertEqual(self.ld.get_topology_info()[0]['mem_avail'], 8.)
+        self.assertGreaterEqual(self.ld.get_stats()['udpReplies'], 1)
+
+    def test_batch(self):
+        self.assertTrue(wait_for(lambda: self.send(beaconreply.pack_reply(0, 'agent/0', 4, 8., 100.)) or
+                                 self.ack() is not None))
+        for i in range(1, 100):
+            self.send(beaconreply.pack_reply(i, 'agent/{}'.format(i), 4, 8., 100.))
+        self.send(b'not a beacon reply')
+        acks = set()
+        while True:
+            ack = self.ack()
+            if ack is None:
+                break
+            acks.add(ack.seq)
+        acks.discard(0)     # Late ack of a retry before the receiver was bound
+        self.assertEqual(acks, set(range(1, 100)))
+        self.assertEqual(len(self.ld.get_topology()), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
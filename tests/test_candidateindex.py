@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Light Discovery backup candidate index
+"""
+
+import unittest
+from unittest import mock
+
+from leaderprotection.arearesilience import AreaResilience
+from lightdiscovery import lightdiscovery
+from lightdiscovery.lightdiscovery import CandidateIndex, DeviceInformation, LightDiscovery
+from policies.agentcapability import LeaderMandatoryRequirements, LeaderDiscretionaryRequirements
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def device(deviceID, cpu=4, mem=8., stg=100.):
+    return DeviceInformation(deviceID=deviceID, deviceIP='10.0.0.1', cpuCores=cpu, memAvail=mem, stgAvail=stg)
+
+
+class TestCandidateIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = CandidateIndex(LeaderMandatoryRequirements(), LeaderDiscretionaryRequirements())
+
+    def popAll(self):
+        deviceIDs = []
+        deviceID = self.index.pop()
+        while deviceID is not None:
+            deviceIDs.append(deviceID)
+            deviceID = self.index.pop()
+        return deviceIDs
+
+    def test_ranking(self):
+        self.index.update(device('small', cpu=2))
+        self.index.update(device('big', cpu=8))
+        self.index.update(device('nodisk', cpu=16, stg=.5))    # Discretionary requirement not met
+        self.index.update(device('nomem', cpu=32, mem=.5))     # Not capable
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.popAll(), ['big', 'small', 'nodisk'])
+
+    def test_update_ranks_again(self):
+        self.index.update(device('a', cpu=8))
+        self.index.update(device('b', cpu=4))
+        self.index.update(device('a', cpu=2))
+        self.index.update(device('b', mem=.5))  # Not capable anymore
+        self.assertEqual(self.popAll(), ['a'])
+
+    def test_remove(self):
+        self.index.update(device('a'))
+        self.index.update(device('b', cpu=2))
+        self.index.remove('a')
+        self.assertEqual(self.popAll(), ['b'])
+        self.assertIsNone(self.index.pop())
+
+    def test_unchanged_score_not_pushed(self):
+        for _ in range(100):
+            self.index.update(device('a'))
+        self.assertEqual(len(self.index._heap), 1)
+
+    def test_heap_bounded(self):
+        for beacon in range(50):
+            for i in range(100):
+                self.index.update(device('agent/{}'.format(i), mem=8. + beacon + i / 1000.))
+        self.assertEqual(len(self.index), 100)
+        self.assertLessEqual(len(self.index._heap), 2 * len(self.index))
+        self.assertEqual(self.popAll(), ['agent/{}'.format(i) for i in reversed(range(100))])
+        for i in range(100):
+            self.index.update(device('agent/{}'.format(i)))
+        for i in range(100):
+            self.index.remove('agent/{}'.format(i))
+        self.assertLessEqual(len(self.index._heap), CandidateIndex.MIN_COMPACT)
+
+    def test_clear(self):
+        self.index.update(device('a'))
+        self.index.clear()
+        self.assertEqual(len(self.index), 0)
+        self.assertIsNone(self.index.pop())
+
+
+class TestBackupCandidates(unittest.TestCase):
+    def setUp(self):
+        self.ld = LightDiscovery('', 'leader/1')
+        self.ld.recv_replies([device('agent/{}'.format(i), cpu=i + 1).getDict() for i in range(3)], '10.0.0.1')
+
+    def test_pop_and_restore(self):
+        candidate = self.ld.pop_candidate()
+        self.assertEqual(candidate, {'deviceID': 'agent/2', 'deviceIP': '10.0.0.1'})
+        self.assertEqual(self.ld.pop_candidate()['deviceID'], 'agent/1')
+        # Not elected: ranked again without waiting for its next beacon reply
+        self.assertTrue(self.ld.restore_candidate('agent/2'))
+        self.assertEqual(self.ld.pop_candidate()['deviceID'], 'agent/2')
+        self.assertEqual(self.ld.pop_candidate()['deviceID'], 'agent/0')
+        self.assertIsNone(self.ld.pop_candidate())
+
+    def test_restore_unknown(self):
+        self.assertFalse(self.ld.restore_candidate('agent/9'))
+
+
+
+class TestCapability(unittest.TestCase):
+    def setUp(self):
+        self._policies = dict(LeaderProtectionPolicies.POLICIES)
+        self.lpp = LeaderProtectionPolicies()
+        self.capable = None
+
+    def tearDown(self):
+        LeaderProtectionPolicies.POLICIES.update(self._policies)
+
+    def imCapable(self):
+        ar = AreaResilience(lambda key, default=None: self.capable if key == 'capable' else default, self.lpp)
+        return ar._AreaResilience__imCapable()
+
+    def test_capable_by_default(self):
+        self.capable = False
+        self.assertFalse(self.lpp.get(LeaderProtectionPolicies.CHECK_CAPABILITY))
+        self.assertTrue(self.imCapable())
+
+    def test_check_capability(self):
+        LeaderProtectionPolicies(CHECK_CAPABILITY=True)
+        self.capable = False
+        self.assertFalse(self.imCapable())
+        self.capable = True
+        self.assertTrue(self.imCapable())
+        self.capable = None     # Not decided
+        self.assertTrue(self.imCapable())
+
+    def test_is_capable(self):
+        ld = LightDiscovery('', 'agent/1', LeaderMandatoryRequirements(), LeaderDiscretionaryRequirements())
+        ramMin = float(LeaderMandatoryRequirements().get(LeaderMandatoryRequirements.RAM_MIN)) / 1024.
+        for snapshot, capable in (((0, .0, .0), None), ((4, ramMin / 2., 100.), False), ((4, ramMin, 100.), True)):
+            with mock.patch.object(lightdiscovery.DEVICE_METRICS, 'snapshot', lambda: snapshot):
+                self.assertIs(ld.is_capable(), capable)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - CIMI readiness monitor
+"""
+
+import logging
+import threading
+import unittest
+from time import monotonic
+
+from common.CIMI import CIMIReadiness
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class Check:
+    """
+    CIMI check that fails the first checks (or while up is False), with the time of each check
+    """
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.up = True
+        self.times = []
+
+    def __call__(self):
+        self.times.append(monotonic())
+        return self.up and len(self.times) > self.failures
+
+
+class TestCIMIReadiness(unittest.TestCase):
+    def setUp(self):
+        self._level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        LOG.setLevel(self._level)
+
+    def monitor(self, check, **kw):
+        readiness = CIMIReadiness(check=check)
+        readiness.BACKOFF_MIN = .02
+        readiness.BACKOFF_MAX = .1
+        readiness.CHECK_PERIOD = .05
+        for name, value in kw.items():
+            setattr(readiness, name, value)
+        self.addCleanup(readiness.stop)
+        return readiness
+
+    def test_ready(self):
+        readiness = self.monitor(Check(failures=3))
+        self.assertFalse(readiness.isReady())
+        self.assertTrue(readiness.wait(5.))
+        self.assertTrue(readiness.isReady())
+        stats = readiness.getStats()
+        self.assertTrue(stats['ready'])
+        self.assertEqual(stats['failures'], 3)
+        self.assertGreaterEqual(stats['checks'], 4)
+        self.assertGreater(stats['timeToReady'], .0)
+        self.assertIsNotNone(stats['latency'])
+        self.assertGreaterEqual(stats['readyFor'], .0)
+
+    def test_wait_timeout(self):
+        check = Check()
+        check.up = False
+        readiness = self.monitor(check)
+        self.assertFalse(readiness.wait(.2))
+        stats = readiness.getStats()
+        self.assertFalse(stats['ready'])
+        self.assertEqual(stats['availability'], .0)
+        self.assertIsNone(stats['latency'])
+        self.assertIsNone(stats['timeToReady'])
+        self.assertIsNone(stats['readyFor'])
+
+    def test_backoff(self):
+        check = Check(failures=6)
+        readiness = self.monitor(check, BACKOFF_MAX=.08, CHECK_PERIOD=10.)
+        self.assertTrue(readiness.wait(5.))
+        readiness.stop()
+        intervals = [later - earlier for earlier, later in zip(check.times, check.times[1:])]
+        # .02, .03, .045, .0675, .08 (max), .08
+        self.assertEqual(len(intervals), 6)
+        self.assertGreaterEqual(intervals[0], .02)
+        for earlier, later in zip(intervals[:3], intervals[1:4]):
+            self.assertGreater(later, earlier)
+        self.assertGreaterEqual(min(intervals[4:]), .08)
+        self.assertLess(max(intervals[4:]), .08 * CIMIReadiness.BACKOFF_FACTOR)
+
+    def test_not_ready_anymore(self):
+        check = Check()
+        readiness = self.monitor(check)
+        self.assertTrue(readiness.wait(5.))
+        check.up = False
+        deadline = monotonic() + 5.
+        while readiness.isReady() and monotonic() < deadline:
+            threading.Event().wait(.01)
+        stats = readiness.getStats()
+        self.assertFalse(stats['ready'])
+        self.assertIsNone(stats['readyFor'])
+        self.assertIsNotNone(stats['timeToReady'])
+        check.up = True
+        self.assertTrue(readiness.wait(5.))
+
+    def test_single_monitor(self):
+        readiness = self.monitor(Check())
+        readiness.start()
+        th_proc = readiness._th_proc
+        readiness.start()
+        self.assertIs(readiness._th_proc, th_proc)
+        readiness.stop()
+        self.assertFalse(th_proc.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
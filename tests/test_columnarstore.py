@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Light Discovery columnar topology store
+"""
+
+import unittest
+
+from lightdiscovery import columnarstore
+from lightdiscovery.columnarstore import ColumnarTopology
+from lightdiscovery.lightdiscovery import LightDiscovery
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+from tests import test_topology
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+NUMPY_REQUIRED = 'NumPy not installed (requirements-extras.txt)'
+
+
+@unittest.skipUnless(columnarstore.available(), NUMPY_REQUIRED)
+class TestColumnarTopology(unittest.TestCase):
+    def setUp(self):
+        self.store = ColumnarTopology(capacity=2)
+
+    def upsert(self, i, deviceIP=None, cpu_cores=4, mem_avail=8., stg_avail=100.):
+        self.store.upsert('agent/{}'.format(i), '10.0.0.{}'.format(i) if deviceIP is None else deviceIP, cpu_cores,
+                          mem_avail, stg_avail, lastSeen=float(i))
+
+    def test_mapping(self):
+        self.upsert(0)
+        self.upsert(1, mem_avail=2.5)
+        self.assertEqual(len(self.store), 2)
+        self.assertIn('agent/1', self.store)
+        self.assertEqual(self.store['agent/1'], {'deviceID': 'agent/1', 'deviceIP': '10.0.0.1', 'cpu_cores': 4,
+                                                 'mem_avail': 2.5, 'stg_avail': 100.})
+        self.assertIsNone(self.store.get('agent/2'))
+        del self.store['agent/0']
+        self.assertNotIn('agent/0', self.store)
+        with self.assertRaises(KeyError):
+            del self.store['agent/0']
+        with self.assertRaises(KeyError):
+            self.store['agent/0']
+
+    def test_factory(self):
+        store = ColumnarTopology(factory=lambda *values: values)
+        store.upsert('agent/0', '10.0.0.0', 4, 8., 100., lastSeen=3.)
+        self.assertEqual(store['agent/0'], ('agent/0', '10.0.0.0', 4, 8., 100., 3.))
+
+    def test_order(self):
+        for i in range(3):
+            self.upsert(i)
+        self.upsert(0, mem_avail=1.)     # Update: order not modified
+        self.assertEqual(list(self.store), ['agent/0', 'agent/1', 'agent/2'])
+        self.store.move_to_end('agent/0')
+        self.assertEqual(list(self.store), ['agent/1', 'agent/2', 'agent/0'])
+        self.assertEqual([deviceID for deviceID, _ in self.store.items()], list(self.store))
+        self.assertEqual([device['mem_avail'] for device in self.store.values()], [8., 8., 1.])
+
+    def test_grow(self):
+        for i in range(9):
+            self.upsert(i, cpu_cores=i)
+        self.assertGreaterEqual(len(self.store._ids), 9)
+        self.assertEqual([device['cpu_cores'] for device in self.store.values()], list(range(9)))
+        self.assertEqual(self.store['agent/8']['deviceIP'], '10.0.0.8')
+
+    def test_free_rows_reused(self):
+        for i in range(2):
+            self.upsert(i)
+        self.store.remove('agent/0')
+        self.upsert(2)
+        self.assertEqual(len(self.store._ids), 2)
+        self.assertEqual(list(self.store), ['agent/1', 'agent/2'])
+        self.assertEqual(self.store['agent/2']['deviceIP'], '10.0.0.2')
+
+    def test_device_ips(self):
+        for i, deviceIP in enumerate(['', '255.255.255.255', 'fe80::1', '10.1']):
+            self.upsert(i, deviceIP=deviceIP)
+        self.assertEqual([device['deviceIP'] for device in self.store.values()],
+                         ['', '255.255.255.255', 'fe80::1', '10.1'])
+        self.upsert(0, deviceIP='192.168.1.7')
+        self.assertEqual(self.store['agent/0']['deviceIP'], '192.168.1.7')
+        self.assertNotIn(self.store._index['agent/0'], self.store._otherIPs)
+
+    def test_query(self):
+        for i, (cpu_cores, mem_avail) in enumerate([(2, 4.), (8, 1.), (4, 16.), (1, 8.)]):
+            self.upsert(i, cpu_cores=cpu_cores, mem_avail=mem_avail)
+        ids = lambda devices: [device['deviceID'] for device in devices]
+        self.assertEqual(ids(self.store.query({'mem_avail': 4.})), ['agent/0', 'agent/2', 'agent/3'])
+        self.assertEqual(ids(self.store.query({'mem_avail': 4., 'cpu_cores': 2})), ['agent/0', 'agent/2'])
+        self.assertEqual(ids(self.store.query(order_by='cpu_cores')), ['agent/1', 'agent/2', 'agent/0', 'agent/3'])
+        self.assertEqual(ids(self.store.query(order_by='cpu_cores', k=2)), ['agent/1', 'agent/2'])
+        self.assertEqual(ids(self.store.query(order_by='mem_avail', descending=False, k=2)), ['agent/1', 'agent/0'])
+        self.assertEqual(ids(self.store.query(k=10)), ['agent/0', 'agent/1', 'agent/2', 'agent/3'])
+        self.store.remove('agent/2')
+        self.assertEqual(ids(self.store.query(order_by='mem_avail', k=1)), ['agent/3'])
+
+    def test_column_reads(self):
+        for i in range(3):
+            self.upsert(i, mem_avail=float(i))
+        self.store.move_to_end('agent/0')
+        self.assertEqual(self.store.oldest(), ('agent/1', 1.))
+        self.assertEqual(self.store.countSeenBefore(2.), 2)
+        self.assertEqual(self.store.deviceIP('agent/2'), '10.0.0.2')
+        self.assertEqual(list(self.store.pairs()), [('agent/1', '10.0.0.1'), ('agent/2', '10.0.0.2'),
+                                                    ('agent/0', '10.0.0.0')])
+        self.assertEqual(self.store.getDict('agent/1')['mem_avail'], 1.)
+        self.assertEqual([device['deviceID'] for device in self.store.dicts()], ['agent/1', 'agent/2', 'agent/0'])
+        self.store.remove('agent/1')
+        self.assertEqual(self.store.countSeenBefore(2.), 1)
+        self.assertIsNone(ColumnarTopology().oldest())
+
+    def test_interned_device_ids(self):
+        deviceID = ''.join(['agent/', '7'])
+        self.store.upsert(deviceID, '10.0.0.7', 4, 8., 100.)
+        self.assertIs(next(iter(self.store)), self.store._ids[self.store._index['agent/7']])
+        self.assertIs(self.store.intern(''.join(['agent/', '7'])), deviceID)
+        self.assertEqual(self.store.intern('agent/8'), 'agent/8')
+
+    def test_clear(self):
+        for i in range(5):
+            self.upsert(i)
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.query(), [])
+        self.upsert(0)
+        self.assertEqual(list(self.store), ['agent/0'])
+
+
+@unittest.skipUnless(columnarstore.available(), NUMPY_REQUIRED)
+class TestColumnarTopologyAging(test_topology.TestTopologyAging):
+    COLUMNAR = True
+
+
+@unittest.skipUnless(columnarstore.available(), NUMPY_REQUIRED)
+class TestColumnarTopologyDeltas(test_topology.TestTopologyDeltas):
+    COLUMNAR = True
+
+
+@unittest.skipUnless(columnarstore.available(), NUMPY_REQUIRED)
+class TestColumnarQuery(test_topology.TopologyTestCase):
+    COLUMNAR = True
+
+    def test_aging_and_stats_do_not_build_devices(self):
+        self.ld.recv_replies([test_topology.reply(i) for i in range(5)], '')
+        self.ld._db._factory = lambda *values: self.fail('Device built from the columns')
+        LightDiscoveryPolicies(MAX_DEVICES=3)
+        self.assertEqual(self.ld.get_stats()['devices'], 5)
+        self.ld.get_topology()
+        self.ld.get_topology_changes(info=True)
+        self.ld.get_topology_info()
+        self.ld.pop_candidate()
+        self.ld._LightDiscovery__evictStale(0.)
+        self.assertEqual(self.ld.get_stats()['devices'], 3)
+
+    def test_same_result_as_dict_store(self):
+        replies = [dict(test_topology.reply(i, mem=float(i * 7 % 10)), cpu_cores=i % 4 + 1, stg_avail=float(i))
+                   for i in range(20)]
+        self.ld.recv_replies(replies, '')
+        self.assertIsInstance(self.ld._db, ColumnarTopology)
+        LightDiscoveryPolicies(COLUMNAR_TOPOLOGY=False)
+        ld = LightDiscovery('', 'leader/2', ldp=self.ldp)
+        ld.startBeaconning()
+        ld.stopBeaconning()
+        ld.recv_replies(replies, '')
+        self.assertNotIsInstance(ld._db, ColumnarTopology)
+        for query in [{}, {'minimums': {'mem_avail': 5., 'cpu_cores': 2}}, {'order_by': 'stg_avail', 'k': 5},
+                      {'minimums': {'cpu_cores': 3}, 'order_by': 'stg_avail', 'descending': False}]:
+            self.assertEqual(self.ld.query_topology(**query), ld.query_topology(**query), query)
+        with self.assertRaises(ValueError):
+            self.ld.query_topology(order_by='lastSeen')
+
+
+if __name__ == '__main__':
+    unittest.main()
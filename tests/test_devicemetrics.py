@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Device metrics sampler
+"""
+
+import logging
+import sys
+import threading
+import unittest
+from time import monotonic
+
+from common.devicemetrics import DeviceMetrics
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class FakeMetrics(DeviceMetrics):
+    """
+    Sampler with counted, slow samples instead of psutil
+    """
+    def __init__(self, intervals=None, delay=.0):
+        super().__init__(intervals=intervals)
+        self.delay = delay
+        self.samples = {self.CPU: 0, self.MEMORY: 0, self.STORAGE: 0}
+        self._DeviceMetrics__sample = self.__sample
+
+    def __sample(self, metric):
+        if self.delay:
+            threading.Event().wait(self.delay)
+        self.samples[metric] += 1
+        if metric == self.CPU:
+            return 4
+        return float(self.samples[metric])
+
+
+class TestDeviceMetrics(unittest.TestCase):
+    def metrics(self, **kw):
+        metrics = FakeMetrics(**kw)
+        self.addCleanup(metrics.stop)
+        return metrics
+
+    def test_first_snapshot_is_sampled(self):
+        metrics = self.metrics()
+        self.assertEqual(metrics.snapshot(), (4, 1., 1.))
+        self.assertEqual(metrics.samples, {'cpu_cores': 1, 'mem_avail': 1, 'stg_avail': 1})
+        self.assertEqual(metrics.snapshot(), (4, 1., 1.))     # Not sampled again
+
+    def test_concurrent_snapshots(self):
+        # Frequent thread switches: the readers interleave inside start()
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        for _ in range(20):
+            metrics = self.metrics(delay=.001)
+            barrier = threading.Barrier(4)
+            snapshots = []
+            errors = []
+
+            def reader():
+                barrier.wait()
+                try:
+                    snapshots.append(metrics.snapshot())
+                except Exception as ex:
+                    errors.append(ex)
+            threads = [threading.Thread(target=reader) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(snapshots, [(4, 1., 1.)] * 4)
+            self.assertEqual(metrics.samples['mem_avail'], 1)
+            self.assertTrue(metrics._th_proc.is_alive())
+
+    def test_intervals(self):
+        metrics = self.metrics(intervals={'mem_avail': .02})
+        metrics.start()
+        deadline = monotonic() + 5.
+        while metrics.samples['mem_avail'] < 4 and monotonic() < deadline:
+            threading.Event().wait(.01)
+        self.assertGreaterEqual(metrics.snapshot()[1], 4.)
+        self.assertEqual(metrics.samples['cpu_cores'], 1)
+        self.assertEqual(metrics.samples['stg_avail'], 1)
+
+    def test_refresh(self):
+        metrics = self.metrics()
+        metrics.refresh(['stg_avail'])
+        self.assertEqual(metrics.snapshot(), (0, .0, 1.))    # Ready: the sampler is not started
+        self.assertIsNone(metrics._th_proc)
+        metrics.refresh()
+        self.assertEqual(metrics.snapshot(), (4, 1., 2.))
+
+    def test_failed_sample_keeps_last_value(self):
+        metrics = self.metrics()
+        metrics.refresh()
+
+        def fail(metric):
+            raise OSError(metric)
+        metrics._DeviceMetrics__sample = fail
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        metrics.refresh()
+        self.assertEqual(metrics.snapshot(), (4, 1., 1.))
+
+    def test_stop(self):
+        metrics = self.metrics()
+        metrics.start()
+        th_proc = metrics._th_proc
+        metrics.start()
+        self.assertIs(metrics._th_proc, th_proc)
+        metrics.stop()
+        self.assertFalse(th_proc.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
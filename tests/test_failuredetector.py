@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Phi Accrual Failure Detector
+"""
+
+import unittest
+
+from leaderprotection.failuredetector import PhiAccrualFailureDetector
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def detector(interval=1., heartbeats=20, threshold=8., minStdDeviation=.1):
+    fd = PhiAccrualFailureDetector(threshold, interval, minStdDeviation=minStdDeviation)
+    for i in range(heartbeats):
+        fd.heartbeat(100. + i * interval)
+    return fd, 100. + (heartbeats - 1) * interval
+
+
+class TestPhiAccrualFailureDetector(unittest.TestCase):
+    def test_no_heartbeat(self):
+        fd = PhiAccrualFailureDetector(8., 1.)
+        self.assertEqual(fd.phi(10.), .0)
+        self.assertTrue(fd.isAvailable(10.))
+
+    def test_phi_increases_with_silence(self):
+        fd, last = detector()
+        values = [fd.phi(last + elapsed) for elapsed in (.5, 1., 1.5, 2., 3.)]
+        self.assertEqual(values, sorted(values))
+        self.assertLess(values[0], 1.)
+
+    def test_regular_heartbeats_available(self):
+        fd, last = detector()
+        self.assertTrue(fd.isAvailable(last + 1.))
+        self.assertFalse(fd.isAvailable(last + 10.))
+
+    def test_long_silence(self):
+        fd, last = detector()
+        self.assertFalse(fd.isAvailable(last + 1000.))
+        self.assertGreater(fd.phi(last + 1000.), fd.phi(last + 10.))
+        # Heartbeat received much earlier than expected
+        fd = PhiAccrualFailureDetector(8., 100., minStdDeviation=.001)
+        fd.heartbeat(1.)
+        self.assertTrue(fd.isAvailable(1.))
+
+    def test_expiry_time_matches_threshold(self):
+        fd, last = detector()
+        expiry = fd.expiryTime()
+        self.assertGreater(expiry, last + 1.)
+        self.assertTrue(fd.isAvailable(expiry - .01))
+        self.assertFalse(fd.isAvailable(expiry + .01))
+
+    def test_jitter_delays_suspicion(self):
+        stable, last = detector()
+        jittery = PhiAccrualFailureDetector(8., 1., minStdDeviation=.1)
+        now = 100.
+        for i in range(20):
+            now += .5 if i % 2 else 1.5
+            jittery.heartbeat(now)
+        self.assertGreater(jittery.expiryTime() - now, stable.expiryTime() - last)
+
+    def test_window_size(self):
+        fd, _ = detector(heartbeats=PhiAccrualFailureDetector.WINDOW_SIZE * 2)
+        self.assertEqual(len(fd._intervals), PhiAccrualFailureDetector.WINDOW_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - UDP Heartbeat messages
+"""
+
+import unittest
+
+from leaderprotection import heartbeat
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestHeartbeat(unittest.TestCase):
+    def test_heartbeat_roundtrip(self):
+        backups = [('agent/1', '10.0.0.1', 1), ('agent/2', '10.0.0.2', -3)]
+        msg = heartbeat.unpack(heartbeat.pack_heartbeat(42, 'leader/1', backups, controlVersion=7))
+        self.assertIsInstance(msg, heartbeat.Heartbeat)
+        self.assertEqual(msg.seq, 42)
+        self.assertEqual(msg.leaderID, 'leader/1')
+        self.assertEqual(msg.controlVersion, 7)
+        self.assertEqual(msg.backups, {'agent/1': ('10.0.0.1', 1), 'agent/2': ('10.0.0.2', -3)})
+
+    def test_priorities_after_many_elections(self):
+        # Priorities keep growing with every election: they must not collide
+        backups = [('agent/{}'.format(priority), '10.0.0.1', priority) for priority in (126, 127, 128, 1000, 70000)]
+        msg = heartbeat.unpack(heartbeat.pack_heartbeat(1, 'leader/1', backups))
+        self.assertEqual(sorted(priority for _, priority in msg.backups.values()), [126, 127, 128, 1000, 70000])
+
+    def test_ack_roundtrip(self):
+        msg = heartbeat.unpack(heartbeat.pack_ack(2 ** 32 + 5, 'agent/1'))
+        self.assertIsInstance(msg, heartbeat.HeartbeatAck)
+        self.assertEqual(msg.seq, 5)
+        self.assertEqual(msg.deviceID, 'agent/1')
+
+    def test_invalid_ip(self):
+        msg = heartbeat.unpack(heartbeat.pack_heartbeat(1, 'leader/1', [('agent/1', 'unknown', 1)]))
+        self.assertEqual(msg.backups['agent/1'], ('0.0.0.0', 1))
+
+    def test_max_datagram(self):
+        backups = [('agent/{:0>200}'.format(i), '10.0.0.1', i) for i in range(50)]
+        data = heartbeat.pack_heartbeat(1, 'leader/1', backups)
+        self.assertLessEqual(len(data), heartbeat.MAX_DATAGRAM)
+        msg = heartbeat.unpack(data)
+        self.assertGreater(len(msg.backups), 0)
+        self.assertLess(len(msg.backups), len(backups))
+
+    def test_malformed(self):
+        data = heartbeat.pack_heartbeat(1, 'leader/1', [('agent/1', '10.0.0.1', 1)])
+        self.assertIsNone(heartbeat.unpack(b'XXXX' + data[4:]))
+        self.assertIsNone(heartbeat.unpack(data[:-3]))
+        self.assertIsNone(heartbeat.unpack(b''))
+        # Other version of the protocol
+        self.assertIsNone(heartbeat.unpack(data[:4] + bytes((heartbeat.VERSION + 1,)) + data[5:]))
+
+    def test_multicast(self):
+        self.assertTrue(heartbeat.is_multicast('239.1.2.3'))
+        self.assertFalse(heartbeat.is_multicast('192.168.1.255'))
+        self.assertFalse(heartbeat.is_multicast(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
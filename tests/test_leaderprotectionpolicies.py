@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Leader Protection Policies
+"""
+
+import unittest
+
+from common.common import CPARAMS
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestIdleConnectionTimeout(unittest.TestCase):
+    def setUp(self):
+        self._policies = dict(LeaderProtectionPolicies.POLICIES)
+
+    def tearDown(self):
+        LeaderProtectionPolicies.POLICIES.update(self._policies)
+
+    def test_default(self):
+        lpp = LeaderProtectionPolicies(TIME_KEEPALIVE=1)
+        self.assertEqual(lpp.getIdleConnectionTimeout(), 1. + CPARAMS.TIME_IDLE_MARGIN)
+
+    def test_follows_keepalive_policy(self):
+        lpp = LeaderProtectionPolicies(TIME_KEEPALIVE=1)
+        self.assertTrue(lpp.set_json('{"TIME_KEEPALIVE": 4.5}'))
+        self.assertEqual(lpp.getIdleConnectionTimeout(), 4.5 + CPARAMS.TIME_IDLE_MARGIN)
+        # Same policies in every instance (i.e. the request handler of the Policies API)
+        self.assertEqual(LeaderProtectionPolicies().getIdleConnectionTimeout(), 4.5 + CPARAMS.TIME_IDLE_MARGIN)
+        self.assertGreater(LeaderProtectionPolicies().getIdleConnectionTimeout(),
+                           LeaderProtectionPolicies().get(LeaderProtectionPolicies.TIME_KEEPALIVE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Area Resilience control state replication
+"""
+
+import logging
+import unittest
+from json import dumps, loads
+
+from common.logs import LOG
+from leaderprotection.arearesilience import AreaResilience, BackupEntry
+from leaderprotection.replication import ControlState
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+TOPOLOGY = ControlState.SECTION_TOPOLOGY
+BACKUPS = ControlState.SECTION_BACKUPS
+POLICIES = ControlState.SECTION_POLICIES
+
+
+class TestControlState(unittest.TestCase):
+    def setUp(self):
+        self.master = ControlState()
+        self.master.update(TOPOLOGY, {'a': {'deviceIP': '10.0.0.1'}, 'b': {'deviceIP': '10.0.0.2'}})
+        self.master.update(POLICIES, {'LPP': '{}'})
+
+    def replicate(self, replica, since):
+        # Same path as the keepalive reply (JSON)
+        return replica.apply(loads(dumps(self.master.delta(since))))
+
+    def test_unchanged_update_keeps_version(self):
+        version = self.master.version
+        self.master.update(TOPOLOGY, {'a': {'deviceIP': '10.0.0.1'}, 'b': {'deviceIP': '10.0.0.2'}})
+        self.assertEqual(self.master.version, version)
+
+    def test_full_copy(self):
+        delta = self.master.delta()
+        self.assertTrue(delta['full'])
+        self.assertEqual(delta['version'], self.master.version)
+        self.assertEqual(set(delta['set'][TOPOLOGY]), {'a', 'b'})
+
+    def test_delta_only_changes(self):
+        version = self.master.version
+        self.master.update(TOPOLOGY, {'a': {'deviceIP': '10.0.0.9'}, 'b': {'deviceIP': '10.0.0.2'}, 'c': {'deviceIP': '10.0.0.3'}})
+        delta = self.master.delta(version)
+        self.assertFalse(delta['full'])
+        self.assertEqual(set(delta['set'][TOPOLOGY]), {'a', 'c'})
+        self.assertEqual(delta['removed'], {})
+        self.master.update(TOPOLOGY, {'a': {'deviceIP': '10.0.0.9'}})
+        delta = self.master.delta(version + 1)
+        self.assertEqual(delta['set'], {})
+        self.assertEqual(sorted(delta['removed'][TOPOLOGY]), ['b', 'c'])
+
+    def test_replica_converges(self):
+        replica = ControlState()
+        self.assertEqual(self.replicate(replica, None), self.master.version)
+        for values in ({'a': {'deviceIP': '10.0.0.1'}},
+                       {'a': {'deviceIP': '10.0.0.1'}, 'd': {'deviceIP': '10.0.0.4'}},
+                       {'d': {'deviceIP': '10.0.0.5'}}):
+            self.master.update(TOPOLOGY, values)
+            self.replicate(replica, replica.version)
+            self.assertEqual(replica.section(TOPOLOGY), self.master.section(TOPOLOGY))
+        self.assertEqual(replica.section(POLICIES), {'LPP': '{}'})
+        self.assertEqual(replica.version, self.master.version)
+
+    def test_pruned_tombstones_require_full_copy(self):
+        replica = ControlState()
+        self.replicate(replica, None)
+        old = replica.version
+        for i in range(ControlState.MAX_TOMBSTONES + 10):
+            self.master.update(TOPOLOGY, {'x{}'.format(i): {}})
+        self.assertTrue(self.master.delta(old)['full'])
+        self.replicate(replica, old)
+        self.assertEqual(replica.section(TOPOLOGY), self.master.section(TOPOLOGY))
+
+    def test_unknown_version_requires_full_copy(self):
+        self.assertTrue(self.master.delta(self.master.version + 1)['full'])
+
+    def test_section_is_a_copy(self):
+        self.master.section(TOPOLOGY)['z'] = {}
+        self.assertNotIn('z', self.master.section(TOPOLOGY))
+
+
+
+class TestTopologyReplication(unittest.TestCase):
+    def setUp(self):
+        self.devices = [{'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.0.0.{}'.format(i), 'cpu_cores': 4,
+                         'mem_avail': 8., 'stg_avail': 100.} for i in range(10)]
+        self.ar = AreaResilience(lambda key, default=None: [dict(device) for device in self.devices]
+                                 if key == 'topology_info' else default)
+        ldp = LightDiscoveryPolicies()
+        self.delta = float(ldp.get(ldp.METRICS_DELTA))
+
+    def refresh(self):
+        self.ar._controlStateRefreshed = None
+        return loads(self.ar.getControlInformation(None))['version']
+
+    def test_small_metric_changes_keep_version(self):
+        version = self.refresh()
+        for device in self.devices:
+            device['mem_avail'] *= 1. + self.delta / 2.
+        self.assertEqual(self.refresh(), version)
+        self.assertEqual(self.ar.getReplicatedTopology()[0]['mem_avail'], 8.)
+
+    def test_changes_replicated(self):
+        version = self.refresh()
+        self.devices[0]['mem_avail'] *= 1. + self.delta * 2.
+        self.devices[1]['deviceIP'] = '10.0.1.1'
+        self.devices.pop()
+        new = self.refresh()
+        self.assertGreater(new, version)
+        delta = loads(self.ar.getControlInformation(version))
+        self.assertEqual(set(delta['set'][TOPOLOGY]), {'agent/0', 'agent/1'})
+        self.assertEqual(delta['removed'][TOPOLOGY], ['agent/9'])
+
+
+
+class TestKeepaliveReply(unittest.TestCase):
+    def setUp(self):
+        self.ar = AreaResilience(lambda key, default=None: [{'deviceID': 'agent/0', 'deviceIP': '10.0.0.0'}]
+                                 if key == 'topology_info' else default)
+        for i in range(3):
+            self.ar.backupDatabase.add(BackupEntry('backup/{}'.format(i), '10.0.1.{}'.format(i), i + 1))
+
+    def test_backup_list_cached(self):
+        backups = self.ar.getBackupList()
+        self.assertEqual([backup['deviceID'] for backup in backups], ['backup/0', 'backup/1', 'backup/2'])
+        self.assertIs(self.ar.getBackupList(), backups)
+        self.assertTrue(self.ar.setBackupPriority('backup/2', 0))
+        self.assertEqual([backup['deviceID'] for backup in self.ar.getBackupList()],
+                         ['backup/2', 'backup/0', 'backup/1'])
+        self.assertFalse(self.ar.setBackupPriority('backup/9', 0))
+
+    def test_current_replica(self):
+        reply = self.ar.getKeepaliveReply(None)
+        self.assertEqual(len(reply['backups']), 3)
+        delta = loads(reply['controlInformation'])
+        self.assertTrue(delta['full'])
+        self.assertEqual(set(delta['set'][BACKUPS]), {'backup/0', 'backup/1', 'backup/2'})
+        reply = self.ar.getKeepaliveReply(delta['version'])
+        self.assertIsNone(reply['backups'])
+        self.assertEqual(loads(reply['controlInformation']), {'version': delta['version'], 'full': False, 'set': {},
+                                                               'removed': {}})
+
+    def test_serialized_once_per_version(self):
+        version = loads(self.ar.getControlInformation(None))['version']
+        self.assertIs(self.ar.getControlInformation(version), self.ar.getControlInformation(version))
+
+    def test_backups_replicated_at_once(self):
+        version = loads(self.ar.getControlInformation(None))['version']
+        self.ar.backupDatabase.remove('backup/0')
+        # Before the next refresh of the topology and policies (TIME_KEEPALIVE)
+        reply = self.ar.getKeepaliveReply(version)
+        self.assertEqual([backup['deviceID'] for backup in reply['backups']], ['backup/1', 'backup/2'])
+        delta = loads(reply['controlInformation'])
+        self.assertGreater(delta['version'], version)
+        self.assertEqual(delta['removed'], {BACKUPS: ['backup/0']})
+        self.assertIsNone(self.ar.getKeepaliveReply(delta['version'])['backups'])
+
+
+
+class TestBackupReplica(unittest.TestCase):
+    def setUp(self):
+        self.devices = [{'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.0.0.{}'.format(i), 'cpu_cores': 4,
+                         'mem_avail': 8., 'stg_avail': 100.} for i in range(5)]
+        self.policies = {'LPP': '{"TIME_KEEPALIVE": 1}'}
+        data = {'topology_info': lambda: [dict(device) for device in self.devices], 'policies': lambda: self.policies}
+        self.leader = AreaResilience(lambda key, default=None: data[key]() if key in data else default)
+        self.leader.backupDatabase.add(BackupEntry('backup/0', '10.0.1.0', 1))
+        self.backup = AreaResilience()
+
+    def keepalive(self):
+        # Keepalive reply of the Leader applied by the backup (same JSON path as the REST keepalive)
+        self.leader._controlStateRefreshed = None
+        reply = loads(dumps(self.leader.getKeepaliveReply(self.backup._controlState.version)))
+        self.backup._AreaResilience__applyControlInformation(reply['controlInformation'])
+        return reply
+
+    def assertReplicated(self):
+        self.assertEqual(self.backup._controlState.version, self.leader._controlState.version)
+        self.assertEqual(sorted(self.backup.getReplicatedTopology(), key=lambda device: device['deviceID']),
+                         sorted(self.leader.getReplicatedTopology(), key=lambda device: device['deviceID']))
+        self.assertEqual(self.backup._controlState.section(BACKUPS), self.leader._controlState.section(BACKUPS))
+
+    def test_replica_follows_leader(self):
+        reply = self.keepalive()
+        self.assertEqual(len(reply['backups']), 1)
+        self.assertReplicated()
+        self.assertEqual(self.backup.getReplicatedPolicies(), self.policies)
+        self.devices.append({'deviceID': 'agent/9', 'deviceIP': '10.0.0.9', 'cpu_cores': 2, 'mem_avail': 1.,
+                             'stg_avail': 10.})
+        self.devices.pop(0)
+        self.leader.backupDatabase.add(BackupEntry('backup/1', '10.0.1.1', 2))
+        self.policies = {'LPP': '{"TIME_KEEPALIVE": 2}'}
+        reply = self.keepalive()
+        delta = loads(reply['controlInformation'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(set(delta['set'][TOPOLOGY]), {'agent/9'})
+        self.assertEqual(delta['removed'][TOPOLOGY], ['agent/0'])
+        self.assertReplicated()
+        self.assertEqual(self.backup.getReplicatedPolicies(), self.policies)
+        # Current replica: only the version
+        reply = self.keepalive()
+        self.assertIsNone(reply['backups'])
+        self.assertEqual(loads(reply['controlInformation'])['set'], {})
+
+    def test_invalid_control_information_ignored(self):
+        self.keepalive()
+        version = self.backup._controlState.version
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        for controlInformation in (None, '', 'not json', '[1]'):
+            self.backup._AreaResilience__applyControlInformation(controlInformation)
+        self.assertEqual(self.backup._controlState.version, version)
+        self.assertReplicated()
+
+
+if __name__ == '__main__':
+    unittest.main()
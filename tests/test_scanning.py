@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Light Discovery scanning agent (beacons sent over loopback, Leader beacon reply endpoint in Flask)
+"""
+
+import logging
+import socket
+import threading
+import unittest
+from json import dumps, loads
+from time import monotonic
+from unittest import mock
+
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+from common.common import CPARAMS, URLS
+from common.logs import LOG
+from lightdiscovery import beaconreply, lightdiscovery
+from lightdiscovery.lightdiscovery import LightDiscovery, LeaderTable
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def free_port(kind=socket.SOCK_DGRAM):
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(condition, timeout=5.):
+    deadline = monotonic() + timeout
+    while not condition() and monotonic() < deadline:
+        threading.Event().wait(.01)
+    return condition()
+
+
+class ScanningTestCase(unittest.TestCase):
+    """
+    Scanning agent with fixed device metrics. The Leaders are loopback addresses (127.0.0.x) and their beacon
+    reply endpoint is a Flask server (replies: list of (leaderIP, payload, arrival time)).
+    The policies are restored after each test.
+    """
+    def setUp(self):
+        self._policies = dict(LightDiscoveryPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.ldp = LightDiscoveryPolicies(BEACON_PERIOD=5., MAX_MISSED_BEACONS=3, REPLY_REFRESH_BEACONS=1,
+                                          METRICS_DELTA=.1, LEADER_HYSTERESIS=.2, MAX_UNACKED_REPLIES=3)
+        self.metrics = (4, 8., 100.)
+        self.categorizeDelay = .0
+        self.replyDelay = .0
+        self.replyDelays = {}   # leaderIP -> delay of the beacon reply endpoint (replyDelay by default)
+        self.replyStatus = 200
+        self.replies = []
+        self.lock = threading.Lock()
+        self.__server()
+        patcher = mock.patch.object(CPARAMS, 'LDISCOVERY_PORT', free_port())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent = LightDiscovery('', 'agent/1', ldp=self.ldp)
+        self.agent._LightDiscovery__categorize_device = self.categorize
+        self.agent.RECV_TIMEOUT = .1    # Faster stop
+        self.assertTrue(self.agent.startScanning())
+        self.addCleanup(self.agent.stopScanning)
+        self.assertTrue(wait_for(self.__bound))
+
+    def tearDown(self):
+        LightDiscoveryPolicies.POLICIES.update(self._policies)
+
+    def __server(self):
+        app = Flask('test_scanning')
+
+        @app.route(URLS.URL_BEACONREPLY, methods=['POST'])
+        def beaconReply():
+            leaderIP = request.host.rsplit(':', 1)[0]
+            threading.Event().wait(self.replyDelays.get(leaderIP, self.replyDelay))
+            with self.lock:
+                self.replies.append((leaderIP, request.get_json(), monotonic()))
+            return '', self.replyStatus
+
+        server = make_server('0.0.0.0', 0, app, threaded=True)
+        th_srv = threading.Thread(target=server.serve_forever, daemon=True)
+        th_srv.start()
+        self.addCleanup(th_srv.join)
+        self.addCleanup(server.shutdown)
+        patcher = mock.patch.object(CPARAMS, 'POLICIES_PORT', server.port)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def __bound(self):
+        try:
+            return self.agent._socket.getsockname()[1] == CPARAMS.LDISCOVERY_PORT
+        except OSError:
+            return False
+
+    def categorize(self):
+        threading.Event().wait(self.categorizeDelay)
+        return self.metrics
+
+    def beacon(self, leaderIP='127.0.0.1', leaderID='leader/1', **fields):
+        """
+        Send a beacon to the agent from leaderIP
+        """
+        fields['leaderID'] = leaderID
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((leaderIP, 0))
+        sock.sendto(dumps(fields).encode(), ('127.0.0.1', CPARAMS.LDISCOVERY_PORT))
+        sock.close()
+
+    def received(self, n, timeout=5.):
+        """
+        :return: True if the Leaders received at least n beacon replies and the agent has no reply in flight
+        """
+        return wait_for(lambda: len(self.replies) >= n, timeout) and self.idle()
+
+    def idle(self):
+        """
+        :return: True when the agent has no reply in the pipeline (the next beacon is not coalesced)
+        """
+        return wait_for(lambda: not self.agent._pendingLeaders)
+
+
+class TestScanningPipeline(ScanningTestCase):
+    def test_reply(self):
+        self.beacon()
+        self.assertTrue(self.received(1))
+        leaderIP, payload, _ = self.replies[0]
+        self.assertEqual(leaderIP, '127.0.0.1')
+        # The Leader takes the deviceIP from the request
+        self.assertEqual({name: payload[name] for name in ('deviceID', 'cpu_cores', 'mem_avail', 'stg_avail')},
+                         {'deviceID': 'agent/1', 'cpu_cores': 4, 'mem_avail': 8., 'stg_avail': 100.})
+        self.assertEqual((self.agent.leaderIP, self.agent.leaderID), ('127.0.0.1', 'leader/1'))
+
+    def test_slow_categorization_does_not_stall_beacons(self):
+        self.categorizeDelay = .5
+        start = monotonic()
+        self.beacon('127.0.0.1', 'leader/1')
+        self.beacon('127.0.0.2', 'leader/2')
+        # Both beacons received while the first categorization is running
+        self.assertTrue(wait_for(lambda: len(self.agent.get_leaders()) == 2))
+        self.assertLess(monotonic() - start, .5)
+        self.assertTrue(self.received(2))
+        self.assertEqual(sorted(leaderIP for leaderIP, _, _ in self.replies), ['127.0.0.1', '127.0.0.2'])
+
+    def test_duplicate_beacons_coalesced(self):
+        self.replyDelay = .3
+        for _ in range(5):
+            self.beacon()
+        self.assertTrue(wait_for(lambda: self.agent.get_stats()['beaconsCoalesced'] == 4))
+        self.assertTrue(self.received(1))
+        threading.Event().wait(.3)
+        self.assertEqual(len(self.replies), 1)
+        # Reply delivered: the next beacon is replied
+        self.beacon()
+        self.assertTrue(self.received(2))
+
+    def test_stop(self):
+        self.beacon()
+        self.assertTrue(self.received(1))
+        threads = (self.agent._th_proc, self.agent._th_categorize, self.agent._th_reply)
+        start = monotonic()
+        self.agent.stopScanning()
+        self.assertLess(monotonic() - start, self.agent.RECV_TIMEOUT + .5)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertIsNone(self.agent.leaderIP)
+
+
+
+class TestUDPBeaconReply(ScanningTestCase):
+    def setUp(self):
+        super().setUp()
+        LightDiscoveryPolicies(MAX_UNACKED_REPLIES=2)
+        self.agent.UDP_ACK_TIMEOUT = .1
+        # UDP beacon reply port of the Leader
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(1.)
+        self.addCleanup(self.sock.close)
+        self.replyPort = self.sock.getsockname()[1]
+
+    def udpReply(self, ack=True):
+        data, addr = self.sock.recvfrom(beaconreply.MAX_DATAGRAM)
+        msg = beaconreply.unpack(data)
+        if ack:
+            self.sock.sendto(beaconreply.pack_ack(msg.seq), addr)
+        return msg
+
+    def test_reply_acknowledged(self):
+        self.beacon(replyPort=self.replyPort)
+        msg = self.udpReply()
+        self.assertIsInstance(msg, beaconreply.BeaconReply)
+        self.assertEqual(msg.getDict(), {'deviceID': 'agent/1', 'cpu_cores': 4, 'mem_avail': 8., 'stg_avail': 100.})
+        self.assertTrue(wait_for(lambda: self.agent.get_leaders()[0]['rtt'] is not None))
+        self.assertTrue(self.idle())
+        # Next beacon, next sequence number
+        self.beacon(replyPort=self.replyPort)
+        self.assertEqual(self.udpReply().seq, msg.seq + 1)
+        threading.Event().wait(.2)
+        self.assertEqual(self.replies, [])
+        self.assertEqual(self.agent.get_stats()['udpFallbacks'], 0)
+
+    def test_http_fallback(self):
+        # Not acknowledged: the same reply is sent over HTTP
+        self.beacon(replyPort=self.replyPort)
+        self.udpReply(ack=False)
+        self.assertTrue(self.received(1))
+        self.assertEqual(self.agent.get_stats()['udpFallbacks'], 0)
+        self.beacon(replyPort=self.replyPort)
+        self.udpReply(ack=False)
+        self.assertTrue(self.received(2))
+        # MAX_UNACKED_REPLIES: only HTTP for this Leader
+        self.assertEqual(self.agent.get_stats()['udpFallbacks'], 1)
+        self.beacon(replyPort=self.replyPort)
+        self.assertTrue(self.received(3))
+        with self.assertRaises(socket.timeout):
+            self.sock.settimeout(.2)
+            self.udpReply()
+
+    def test_ack_resets_unacked_replies(self):
+        self.beacon(replyPort=self.replyPort)
+        self.udpReply(ack=False)
+        self.assertTrue(self.received(1))
+        self.beacon(replyPort=self.replyPort)
+        self.udpReply()
+        self.assertTrue(self.idle())
+        self.beacon(replyPort=self.replyPort)
+        self.udpReply(ack=False)
+        self.assertTrue(self.received(2))
+        self.assertEqual(self.agent.get_stats()['udpFallbacks'], 0)
+
+
+
+class TestReplySuppression(ScanningTestCase):
+    def beacons(self, n, leaderID='leader/1'):
+        """
+        Send n beacons, one after the other is replied or suppressed
+        :return: List of booleans, True if the beacon was replied
+        """
+        replied = []
+        for _ in range(n):
+            replies = len(self.replies)
+            suppressed = self.agent.get_stats()['repliesSuppressed']
+            self.beacon(leaderID=leaderID)
+            self.assertTrue(wait_for(lambda: len(self.replies) + self.agent.get_stats()['repliesSuppressed'] >
+                                     replies + suppressed))
+            self.assertTrue(self.idle())
+            replied.append(len(self.replies) > replies)
+        return replied
+
+    def test_reply_all_beacons(self):
+        self.assertEqual(self.beacons(3), [True, True, True])
+        self.assertEqual(self.agent.get_stats()['repliesSuppressed'], 0)
+
+    def test_forced_refresh(self):
+        LightDiscoveryPolicies(REPLY_REFRESH_BEACONS=3)
+        self.assertEqual(self.beacons(7), [True, False, False, True, False, False, True])
+        self.assertEqual(self.agent.get_stats()['repliesSuppressed'], 4)
+
+    def test_metrics_changed(self):
+        LightDiscoveryPolicies(REPLY_REFRESH_BEACONS=10)
+        self.assertEqual(self.beacons(2), [True, False])
+        self.metrics = (4, 8. * 1.05, 100.)     # Under METRICS_DELTA
+        self.assertEqual(self.beacons(1), [False])
+        self.metrics = (4, 8. * 1.2, 100.)
+        self.assertEqual(self.beacons(2), [True, False])
+        self.assertEqual(self.replies[-1][1]['mem_avail'], 8. * 1.2)
+        self.metrics = (2, 8. * 1.2, 100.)
+        self.assertEqual(self.beacons(1), [True])
+
+    def test_leader_changed(self):
+        LightDiscoveryPolicies(REPLY_REFRESH_BEACONS=10)
+        self.assertEqual(self.beacons(2), [True, False])
+        # New Leader at the same address
+        self.assertEqual(self.beacons(2, leaderID='leader/2'), [True, False])
+
+    def test_not_delivered_is_not_suppressed(self):
+        LightDiscoveryPolicies(REPLY_REFRESH_BEACONS=10)
+        self.replyStatus = 500
+        self.assertEqual(self.beacons(2), [True, True])
+        self.replyStatus = 200
+        self.assertEqual(self.beacons(2), [True, False])
+
+
+
+class TestBeaconSchedule(unittest.TestCase):
+    """
+    Beacons of a Leader received at a loopback port
+    """
+    def setUp(self):
+        self._policies = dict(LightDiscoveryPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(1.)
+        self.addCleanup(self.sock.close)
+        for name, value in (('BROADCAST_ADDR_FLAG', '127.0.0.1'), ('LDISCOVERY_PORT', self.sock.getsockname()[1])):
+            patcher = mock.patch.object(CPARAMS, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ldp = LightDiscoveryPolicies(BEACON_PERIOD=.1, REPLY_WINDOW=2., UDP_BEACON_REPLY=False)
+        self.ld = LightDiscovery('127.0.0.1', 'leader/1', ldp=self.ldp)
+
+    def tearDown(self):
+        self.ld.stopBeaconning()
+        LightDiscoveryPolicies.POLICIES.update(self._policies)
+
+    def beacons(self, n):
+        """
+        :return: List of (arrival time, beacon) of the next n beacons
+        """
+        return [(monotonic(), loads(self.sock.recv(4096).decode())) for _ in range(n)]
+
+    def test_period(self):
+        self.assertTrue(self.ld.startBeaconning())
+        beacons = self.beacons(5)[1:]     # The first one can be queued before the first read
+        intervals = [later - earlier for (earlier, _), (later, _) in zip(beacons, beacons[1:])]
+        self.assertGreaterEqual(min(intervals), .05)
+        self.assertLess(max(intervals), .5)
+        # Reply window up to the beacon period
+        self.assertEqual(beacons[0][1], {'leaderID': 'leader/1', 'replyWindow': .1})
+
+    def test_reply_window(self):
+        LightDiscoveryPolicies(BEACON_PERIOD=5., REPLY_WINDOW=1.5, UDP_BEACON_REPLY=True)
+        self.assertTrue(self.ld.startBeaconning())
+        self.assertEqual(self.beacons(1)[0][1], {'leaderID': 'leader/1', 'replyWindow': 1.5,
+                                                 'replyPort': CPARAMS.BEACONREPLY_PORT})
+
+    def test_no_reply_window(self):
+        LightDiscoveryPolicies(BEACON_PERIOD=5., REPLY_WINDOW=0.)
+        self.assertTrue(self.ld.startBeaconning())
+        self.assertEqual(self.beacons(1)[0][1], {'leaderID': 'leader/1'})
+
+    def test_stop_during_period(self):
+        LightDiscoveryPolicies(BEACON_PERIOD=10.)
+        self.assertTrue(self.ld.startBeaconning())
+        self.beacons(1)
+        start = monotonic()
+        self.ld.stopBeaconning()
+        self.assertLess(monotonic() - start, .5)
+
+
+class TestReplyWindow(ScanningTestCase):
+    def test_replies_spread_over_window(self):
+        delays = []
+
+        def uniform(low, high):
+            delays.append((low, high))
+            return high
+        with mock.patch.object(lightdiscovery.random, 'uniform', uniform):
+            sent = monotonic()
+            self.beacon(replyWindow=.3)
+            self.assertTrue(self.received(1))
+        self.assertEqual(delays, [(.0, .3)])
+        self.assertGreaterEqual(self.replies[0][2] - sent, .3)
+
+    def test_replies_within_window(self):
+        sent = []
+        for i in range(5):
+            sent.append(monotonic())
+            self.beacon(leaderIP='127.0.0.{}'.format(i + 1), leaderID='leader/{}'.format(i), replyWindow=.2)
+        self.assertTrue(self.received(5))
+        arrivals = {leaderIP: arrival for leaderIP, _, arrival in self.replies}
+        for i in range(5):
+            self.assertLess(arrivals['127.0.0.{}'.format(i + 1)] - sent[i], .2 + .3)
+
+    def test_malformed_window(self):
+        self.beacon(replyWindow='soon')
+        self.assertTrue(self.received(1))
+        self.beacon(replyWindow=-1.)
+        self.assertTrue(self.received(2))
+
+    def test_stop_during_window(self):
+        self.beacon(replyWindow=10.)
+        self.assertTrue(wait_for(lambda: self.agent._replyQueue.qsize() == 0 and self.agent._pendingLeaders))
+        threading.Event().wait(.1)
+        start = monotonic()
+        self.agent.stopScanning()
+        self.assertLess(monotonic() - start, self.agent.RECV_TIMEOUT + .5)
+        self.assertEqual(self.replies, [])
+
+
+
+class TestLeaderTable(unittest.TestCase):
+    TIMEOUT = 15.
+    HYSTERESIS = .2
+
+    def setUp(self):
+        self.table = LeaderTable()
+
+    def select(self, now):
+        selected = self.table.select(now, self.TIMEOUT, self.HYSTERESIS)
+        return None if selected is None else selected.leaderIP
+
+    def test_first_leader(self):
+        self.assertIsNone(self.select(.0))
+        self.table.beacon('10.0.0.1', 'leader/1', 1.)
+        self.assertEqual(self.select(1.), '10.0.0.1')
+        # Without RTT, another Leader does not replace the selected one
+        self.table.beacon('10.0.0.2', 'leader/2', 2.)
+        self.assertEqual(self.select(2.), '10.0.0.1')
+
+    def test_rtt_average(self):
+        self.table.beacon('10.0.0.1', 'leader/1', .0)
+        self.table.rtt('10.0.0.1', .1)
+        self.table.rtt('10.0.0.1', .2)
+        self.table.rtt('10.0.0.9', .2)     # Unknown Leader
+        entry, = self.table.getList(1., self.TIMEOUT)
+        self.assertAlmostEqual(entry['rtt'], .1 * (1 - LeaderTable.RTT_WEIGHT) + .2 * LeaderTable.RTT_WEIGHT)
+
+    def test_hysteresis(self):
+        for i in range(1, 4):
+            self.table.beacon('10.0.0.{}'.format(i), 'leader/{}'.format(i), .0)
+        self.table.rtt('10.0.0.1', .1)
+        self.assertEqual(self.select(.0), '10.0.0.1')
+        # 10% better: not enough
+        self.table.rtt('10.0.0.2', .09)
+        self.assertEqual(self.select(1.), '10.0.0.1')
+        # 50% better
+        self.table.rtt('10.0.0.3', .05)
+        self.assertEqual(self.select(2.), '10.0.0.3')
+        self.assertEqual(self.select(3.), '10.0.0.3')
+
+    def test_measured_leader_preferred(self):
+        self.table.beacon('10.0.0.1', 'leader/1', .0)
+        self.table.beacon('10.0.0.2', 'leader/2', .5)
+        self.assertEqual(self.select(.5), '10.0.0.2')   # Most recently seen
+        self.table.rtt('10.0.0.1', .5)
+        self.assertEqual(self.select(1.), '10.0.0.1')
+
+    def test_unhealthy_leader_replaced(self):
+        self.table.beacon('10.0.0.1', 'leader/1', .0)
+        self.table.rtt('10.0.0.1', .01)
+        self.table.beacon('10.0.0.2', 'leader/2', .0)
+        self.table.rtt('10.0.0.2', .5)
+        self.assertEqual(self.select(.0), '10.0.0.1')
+        self.table.beacon('10.0.0.2', 'leader/2', self.TIMEOUT + 1.)
+        self.assertEqual(self.select(self.TIMEOUT + 1.), '10.0.0.2')
+        leaders = {entry['leaderIP']: entry for entry in self.table.getList(self.TIMEOUT + 1., self.TIMEOUT)}
+        self.assertFalse(leaders['10.0.0.1']['healthy'])
+        self.assertTrue(leaders['10.0.0.2']['selected'])
+        # Forgotten after twice the timeout
+        self.assertEqual(self.select(2 * self.TIMEOUT + 1.), '10.0.0.2')
+        self.assertEqual([entry['leaderIP'] for entry in self.table.getList(2 * self.TIMEOUT + 1., self.TIMEOUT)],
+                         ['10.0.0.2'])
+        self.assertIsNone(self.select(4 * self.TIMEOUT))
+
+    def test_list(self):
+        self.table.beacon('10.0.0.1', 'leader/1', .0)
+        self.table.beacon('10.0.0.1', 'leader/1', 5.)
+        self.select(5.)
+        self.assertEqual(self.table.getList(6., self.TIMEOUT), [{
+            'leaderIP': '10.0.0.1', 'leaderID': 'leader/1', 'lastSeen': 1., 'rtt': None, 'beacons': 2,
+            'healthy': True, 'selected': True}])
+        self.table.clear()
+        self.assertEqual(self.table.getList(6., self.TIMEOUT), [])
+
+
+class TestLeaderSelection(ScanningTestCase):
+    def test_lowest_rtt_leader(self):
+        self.replyDelays['127.0.0.1'] = .1
+        for _ in range(3):
+            for leaderIP in ('127.0.0.1', '127.0.0.2'):
+                self.beacon(leaderIP, 'leader/{}'.format(leaderIP[-1]))
+            self.assertTrue(self.received(len(self.replies) + 2))
+        self.beacon('127.0.0.1', 'leader/1')
+        self.assertTrue(self.received(len(self.replies) + 1))
+        self.assertEqual((self.agent.leaderIP, self.agent.leaderID), ('127.0.0.2', 'leader/2'))
+        leaders = {leader['leaderIP']: leader for leader in self.agent.get_leaders()}
+        self.assertGreater(leaders['127.0.0.1']['rtt'], leaders['127.0.0.2']['rtt'])
+        self.assertTrue(leaders['127.0.0.2']['selected'])
+
+
+if __name__ == '__main__':
+    unittest.main()
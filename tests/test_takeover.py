@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Area Resilience coordinated takeover among backups (takeover claims replaced by stubs)
+"""
+
+import logging
+import threading
+import unittest
+from time import monotonic
+
+from common.logs import LOG
+from leaderprotection.arearesilience import AreaResilience, BackupEntry
+from policies.leaderprotectionpolicies import LeaderProtectionPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestTakeoverClaim(unittest.TestCase):
+    def setUp(self):
+        self._policies = dict(LeaderProtectionPolicies.POLICIES)
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.lpp = LeaderProtectionPolicies(TAKEOVER_TIMEOUT=.3, TIME_KEEPALIVE=.05)
+        # Leader with three backups: the backup list is announced in the keepalive replies
+        leader = AreaResilience(leaderprotectionpolicies_obj=self.lpp)
+        for i in range(3):
+            leader.backupDatabase.add(BackupEntry('backup/{}'.format(i), '10.0.1.{}'.format(i), i + 1))
+        self.backups = leader.getKeepaliveReply(None)['backups']
+        self.cimi = {}
+        self.ar = AreaResilience(lambda key, default=None: self.cimi.get(key, default), self.lpp)
+        self.ar._connected = True
+        self.ar._AreaResilience__send_takeover_claim = self.claim
+        # Takeover claim replies: IP -> (delay, reply)
+        self.replies = {}
+        self.claims = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.ar._connected = False
+        LeaderProtectionPolicies.POLICIES.update(self._policies)
+
+    def claim(self, address, payload):
+        delay, reply = self.replies.get(address, (.0, None))
+        with self.lock:
+            self.claims.append((address, payload))
+        threading.Event().wait(delay)
+        return reply
+
+    def backup(self, priority):
+        # Backup with the given priority that received the backup list from the Leader
+        self.ar._deviceID = 'backup/{}'.format(priority - 1)
+        self.ar._backupPriority = priority
+        self.ar._AreaResilience__setPeers(self.backups)
+        return self.ar._AreaResilience__takeoverClaim()
+
+    def test_best_ranked_takes_over_at_once(self):
+        self.assertTrue(self.backup(1))
+        self.assertEqual(self.claims, [])
+
+    def test_claims_only_to_more_preference(self):
+        self.assertTrue(self.backup(3))
+        self.assertEqual(sorted(address for address, _ in self.claims), ['10.0.1.0', '10.0.1.1'])
+        self.assertEqual(self.claims[0][1], {'deviceID': 'backup/2', 'backupPriority': 3})
+
+    def test_live_backup_with_more_preference_wins(self):
+        self.replies['10.0.1.0'] = (.0, {'deviceID': 'backup/0', 'backupPriority': 1, 'imLeader': False, 'imBackup': True})
+        self.assertFalse(self.backup(2))
+        self.assertEqual(self.ar._takeoverWinnerIP, '10.0.1.0')
+
+    def test_live_agent_is_not_a_winner(self):
+        # Demoted (not a backup anymore) or with less preference: the claim is won
+        self.replies['10.0.1.0'] = (.0, {'deviceID': 'backup/0', 'backupPriority': -2, 'imLeader': False, 'imBackup': False})
+        self.replies['10.0.1.1'] = (.0, {'deviceID': 'backup/1', 'backupPriority': 4, 'imLeader': False, 'imBackup': True})
+        self.assertTrue(self.backup(3))
+
+    def test_new_leader_wins(self):
+        self.replies['10.0.1.1'] = (.0, {'deviceID': 'backup/1', 'backupPriority': 2, 'imLeader': True, 'imBackup': False})
+        self.assertFalse(self.backup(3))
+        self.assertEqual(self.ar._takeoverWinnerIP, '10.0.1.1')
+
+    def test_claims_in_parallel(self):
+        # Dead backups with more preference: one claim round-trip, not one per rank
+        for i in range(2):
+            self.replies['10.0.1.{}'.format(i)] = (.2, None)
+        start = monotonic()
+        self.assertTrue(self.backup(3))
+        self.assertLess(monotonic() - start, .4)
+
+    def test_receive_claim(self):
+        self.ar._deviceID = 'backup/0'
+        self.ar._backupPriority = 1
+        self.ar._imBackup = True
+        self.assertEqual(self.ar.receive_takeover_claim('backup/2', 3),
+                         {'deviceID': 'backup/0', 'backupPriority': 1, 'imLeader': False, 'imBackup': True})
+
+    def test_wait_new_leader(self):
+        self.ar._leaderIP = '10.0.0.1'
+        self.cimi['disc_leaderIP'] = '10.0.1.0'
+        self.assertTrue(self.ar._AreaResilience__waitNewLeader())
+
+    def test_wait_new_leader_timeout(self):
+        self.ar._leaderIP = '10.0.0.1'
+        self.cimi['disc_leaderIP'] = '10.0.0.1'
+        start = monotonic()
+        self.assertFalse(self.ar._AreaResilience__waitNewLeader())
+        self.assertGreaterEqual(monotonic() - start, .3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Agent Start task graph
+"""
+
+import logging
+import threading
+import unittest
+
+from agentstart.taskgraph import TaskGraph
+from common.logs import LOG
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+class TestTaskGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = TaskGraph('test')
+        self.order = []
+        self.lock = threading.Lock()
+
+    def task(self, name, result=None):
+        def target():
+            with self.lock:
+                self.order.append(name)
+            return result
+        return target
+
+    def statuses(self):
+        return {name: self.graph.status(name) for name in self.graph._tasks}
+
+    def test_dependency_order(self):
+        self.graph.add('a', self.task('a'))
+        self.graph.add('b', self.task('b'), depends=('a',))
+        self.graph.add('c', self.task('c'), depends=('b',))
+        self.assertTrue(self.graph.run())
+        self.assertEqual(self.order, ['a', 'b', 'c'])
+        self.assertEqual(set(self.statuses().values()), {TaskGraph.DONE})
+
+    def test_independent_tasks_in_parallel(self):
+        # Each task waits for the other one: only finishes if both are started at once
+        ready = (threading.Event(), threading.Event())
+        self.graph.add('a', lambda: (ready[0].set(), ready[1].wait(5.))[1])
+        self.graph.add('b', lambda: (ready[1].set(), ready[0].wait(5.))[1])
+        self.graph.add('c', self.task('c'), depends=('a', 'b'))
+        self.assertTrue(self.graph.run())
+        self.assertEqual(self.order, ['c'])
+
+    def test_failure_cancels_dependents(self):
+        self.graph.add('a', self.task('a', result=False))
+        self.graph.add('b', self.task('b'))
+        self.graph.add('c', self.task('c'), depends=('a',))
+        self.assertFalse(self.graph.run())
+        self.assertEqual(self.statuses(), {'a': TaskGraph.FAILED, 'b': TaskGraph.DONE, 'c': TaskGraph.CANCELLED})
+        self.assertNotIn('c', self.order)
+
+    def test_exception_is_failure(self):
+        level = LOG.level
+        LOG.setLevel(logging.CRITICAL)
+        self.addCleanup(LOG.setLevel, level)
+        self.graph.add('a', lambda: 1 / 0)
+        self.graph.add('b', self.task('b'), depends=('a',))
+        self.assertFalse(self.graph.run())
+        self.assertEqual(self.statuses(), {'a': TaskGraph.FAILED, 'b': TaskGraph.CANCELLED})
+
+    def test_running_tasks_finish_after_failure(self):
+        def slow():
+            while self.graph.status('fail') != TaskGraph.FAILED:
+                threading.Event().wait(.01)
+        self.graph.add('slow', slow)
+        self.graph.add('fail', self.task('fail', result=False))
+        self.graph.add('next', self.task('next'), depends=('slow',))
+        self.assertFalse(self.graph.run())
+        self.assertEqual(self.statuses(), {'slow': TaskGraph.DONE, 'fail': TaskGraph.FAILED,
+                                           'next': TaskGraph.CANCELLED})
+
+    def test_disconnected(self):
+        connected = threading.Event()
+        connected.set()
+        self.graph.add('a', lambda: connected.clear())
+        self.graph.add('b', self.task('b'), depends=('a',))
+        self.assertFalse(self.graph.run(connected=connected.is_set))
+        self.assertEqual(self.statuses(), {'a': TaskGraph.DONE, 'b': TaskGraph.CANCELLED})
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            self.graph.add('b', self.task('b'), depends=('a',))
+        self.assertIsNone(self.graph.status('b'))
+
+    def test_report(self):
+        self.graph.add('a', self.task('a'))
+        self.graph.add('b', self.task('b'))
+        self.graph.add('c', lambda: threading.Event().wait(.05) or None, depends=('a',))
+        self.graph.add('d', self.task('d', result=False), depends=('b', 'c'))
+        self.graph.add('e', self.task('e'), depends=('d',))
+        self.graph.run()
+        report = self.graph.report()
+        self.assertEqual(report['criticalPath'], ['a', 'c', 'd'])
+        self.assertEqual(report['timeToReady'], report['tasks']['d']['end'])
+        self.assertEqual(list(report['tasks']), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(report['tasks']['e'], {'status': TaskGraph.CANCELLED, 'start': None, 'end': None})
+        self.assertGreaterEqual(report['tasks']['c']['start'], report['tasks']['a']['end'])
+        self.assertGreaterEqual(report['tasks']['c']['end'] - report['tasks']['c']['start'], .05)
+
+    def test_empty_report(self):
+        self.assertTrue(self.graph.run())
+        self.assertEqual(self.graph.report(), {'timeToReady': None, 'criticalPath': [], 'tasks': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
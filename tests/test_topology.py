@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+"""
+    RESOURCE MANAGEMENT - POLICIES MODULE
+    Tests - Light Discovery topology of the Leader (aging, size cap and delta queries)
+"""
+
+import threading
+import unittest
+
+from lightdiscovery.lightdiscovery import LightDiscovery, TopologyChanges, TopologySnapshot
+from policies.lightdiscoverypolicies import LightDiscoveryPolicies
+
+__maintainer__ = 'Alejandro Jurnet'
+__email__ = 'ajurnet@ac.upc.edu'
+__author__ = 'Universitat Politècnica de Catalunya'
+
+
+def reply(i, mem=8.):
+    return {'deviceID': 'agent/{}'.format(i), 'deviceIP': '10.0.0.{}'.format(i), 'cpu_cores': 4, 'mem_avail': mem,
+            'stg_avail': 100.}
+
+
+class TopologyTestCase(unittest.TestCase):
+    """
+    Leader topology, default store (the policies are restored after each test)
+    """
+    COLUMNAR = False
+
+    def setUp(self):
+        self._policies = dict(LightDiscoveryPolicies.POLICIES)
+        self.ldp = LightDiscoveryPolicies(COLUMNAR_TOPOLOGY=self.COLUMNAR, BEACON_PERIOD=5., MAX_MISSED_BEACONS=3,
+                                          REPLY_REFRESH_BEACONS=1, MAX_DEVICES=10000, METRICS_DELTA=.1)
+        self.ld = LightDiscovery('', 'leader/1', ldp=self.ldp)
+        # Topology store of the Leader mode, kept after the beacons stop
+        self.ld.startBeaconning()
+        self.ld.stopBeaconning()
+
+    def tearDown(self):
+        LightDiscoveryPolicies.POLICIES.update(self._policies)
+
+    def age(self, deviceID, seconds):
+        # The devices are ordered by lastSeen: the tests keep that order
+        dev_obj = self.ld._db[deviceID]
+        dev_obj.lastSeen -= seconds
+        self.ld._db[deviceID] = dev_obj
+
+    def deviceIDs(self):
+        return [device['deviceID'] for device in self.ld.get_topology_info()]
+
+
+class TestTopologyAging(TopologyTestCase):
+    def test_max_devices(self):
+        LightDiscoveryPolicies(MAX_DEVICES=5)
+        self.ld.recv_replies([reply(i) for i in range(8)], '')
+        self.assertEqual(self.deviceIDs(), ['agent/{}'.format(i) for i in range(3, 8)])
+        self.assertEqual(self.ld.get_stats()['evictions'], 3)
+
+    def test_least_recently_seen_evicted_first(self):
+        LightDiscoveryPolicies(MAX_DEVICES=3)
+        self.ld.recv_replies([reply(i) for i in range(3)], '')
+        self.ld.recv_reply(reply(0), '10.0.0.0')
+        self.ld.recv_reply(reply(3), '10.0.0.3')
+        self.assertEqual(self.deviceIDs(), ['agent/2', 'agent/0', 'agent/3'])
+
+    def test_missed_beacons(self):
+        self.ld.recv_replies([reply(i) for i in range(3)], '')
+        self.age('agent/0', 5. * 3 + 1.)
+        self.age('agent/1', 5. * 2)
+        self.assertEqual(self.ld.get_stats()['staleDevices'], 2)
+        self.ld.recv_reply(reply(2), '10.0.0.2')
+        self.assertEqual(self.deviceIDs(), ['agent/1', 'agent/2'])
+
+    def test_reply_refresh_beacons_extends_horizon(self):
+        LightDiscoveryPolicies(REPLY_REFRESH_BEACONS=10)
+        self.ld.recv_replies([reply(i) for i in range(2)], '')
+        self.age('agent/0', 5. * 12 + 1.)
+        self.age('agent/1', 5. * 3 + 1.)
+        self.ld.recv_reply(reply(2), '10.0.0.2')
+        self.assertEqual(self.deviceIDs(), ['agent/1', 'agent/2'])
+
+    def test_evicted_device_not_candidate(self):
+        LightDiscoveryPolicies(MAX_DEVICES=1)
+        self.ld.recv_replies([reply(0), reply(1)], '')
+        self.assertEqual(self.ld.pop_candidate()['deviceID'], 'agent/1')
+        self.assertIsNone(self.ld.pop_candidate())
+
+    def test_snapshot_version(self):
+        version = self.ld.get_topology_version()
+        self.ld.recv_replies([reply(0), reply(1)], '')
+        snapshot = self.ld.get_topology_snapshot()
+        self.assertGreater(snapshot.version, version)
+        self.assertEqual(snapshot.pairs, (('agent/0', '10.0.0.0'), ('agent/1', '10.0.0.1')))
+        # Metrics only: same snapshot
+        self.ld.recv_reply(reply(0, mem=4.), '10.0.0.0')
+        self.assertIs(self.ld.get_topology_snapshot(), snapshot)
+
+    def test_device_ids_stored_once(self):
+        self.ld.recv_replies([reply(0)], '')
+        deviceID = self.ld._db.intern('agent/0')
+        self.ld.recv_reply(reply(0, mem=4.), '10.0.0.0')
+        self.assertIs(self.ld._db.intern(''.join(['agent/', '0'])), deviceID)
+        self.assertIs(next(iter(self.ld._db)), deviceID)
+        self.assertEqual(self.ld._db.intern('agent/1'), 'agent/1')
+
+
+
+class TestTopologyChanges(unittest.TestCase):
+    def setUp(self):
+        self.changes = TopologyChanges()
+
+    def test_after(self):
+        for deviceID in ('a', 'b', 'c'):
+            self.changes.changed(deviceID)
+        self.changes.changed('a')
+        self.changes.removed('b')
+        self.assertEqual(self.changes.after(0), [(3, 'c', True), (4, 'a', True), (5, 'b', False)])
+        self.assertEqual(self.changes.after(4), [(5, 'b', False)])
+        self.assertEqual(self.changes.after(0, tombstones=False), [(3, 'c', True), (4, 'a', True)])
+        self.assertEqual(self.changes.after(5), [])
+
+    def test_back_after_removal(self):
+        self.changes.changed('a')
+        self.changes.removed('a')
+        self.changes.changed('a')
+        self.assertEqual(self.changes.after(0), [(3, 'a', True)])
+
+    def test_pruned_tombstones(self):
+        for i in range(TopologyChanges.MAX_TOMBSTONES + 1):
+            self.changes.changed(i)
+            self.changes.removed(i)
+        self.assertEqual(self.changes.minVersion, 2)
+        self.assertEqual(len(self.changes.after(self.changes.minVersion)), TopologyChanges.MAX_TOMBSTONES)
+
+    def test_reset(self):
+        self.changes.changed('a')
+        self.changes.reset()
+        self.assertEqual(self.changes.minVersion, self.changes.version)
+        self.assertEqual(self.changes.after(0), [])
+
+
+class TestTopologyDeltas(TopologyTestCase):
+    def test_first_query_is_reset(self):
+        self.ld.recv_replies([reply(i) for i in range(3)], '')
+        delta = self.ld.get_topology_changes()
+        self.assertTrue(delta['reset'])
+        self.assertEqual([device['deviceID'] for device in delta['devices']], ['agent/0', 'agent/1', 'agent/2'])
+        self.assertEqual(delta['devices'][0], {'deviceID': 'agent/0', 'deviceIP': '10.0.0.0'})
+        self.assertIsNone(delta['cursor'])
+        self.assertEqual(self.ld.get_topology_changes(info=True)['devices'][0], reply(0))
+
+    def test_delta(self):
+        self.ld.recv_replies([reply(i) for i in range(3)], '')
+        version = self.ld.get_topology_changes()['version']
+        self.ld.recv_reply(reply(1, mem=8.1), '10.0.0.1')   # Under METRICS_DELTA
+        self.ld.recv_reply(reply(2, mem=4.), '10.0.0.2')
+        LightDiscoveryPolicies(MAX_DEVICES=2)
+        self.ld.recv_reply(reply(3), '10.0.0.3')
+        delta = self.ld.get_topology_changes(since=version)
+        self.assertFalse(delta['reset'])
+        self.assertEqual([device['deviceID'] for device in delta['devices']], ['agent/2', 'agent/3'])
+        self.assertEqual(delta['removed'], ['agent/0', 'agent/1'])
+        self.assertEqual(self.ld.get_topology_changes(since=delta['version'])['devices'], [])
+
+    def test_pages(self):
+        self.ld.recv_replies([reply(i) for i in range(10)], '')
+        since = self.ld.get_topology_changes()['version']
+        self.ld.recv_replies([reply(i, mem=1.) for i in range(10)], '')
+        deviceIDs = []
+        cursor = None
+        pages = 0
+        while True:
+            page = self.ld.get_topology_changes(since=since, limit=3, cursor=cursor)
+            self.assertLessEqual(len(page['devices']), 3)
+            deviceIDs.extend(device['deviceID'] for device in page['devices'])
+            pages += 1
+            cursor = page['cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, 4)
+        self.assertEqual(deviceIDs, ['agent/{}'.format(i) for i in range(10)])
+
+    def test_too_old_is_reset(self):
+        self.assertTrue(self.ld.get_topology_changes(since=-1)['reset'])
+
+
+
+class CountingLock:
+    """
+    Lock that counts its acquisitions
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+
+    def __enter__(self):
+        self._lock.acquire()
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+
+
+class TestBatchReplies(TopologyTestCase):
+    def test_batch(self):
+        results = self.ld.recv_replies([reply(i) for i in range(5)], '10.0.9.9')
+        self.assertEqual(results, [('agent/{}'.format(i), None) for i in range(5)])
+        self.assertEqual(self.ld.get_topology(), tuple(('agent/{}'.format(i), '10.0.0.{}'.format(i)) for i in range(5)))
+
+    def test_sender_ip(self):
+        # Records without deviceIP (i.e. devices behind the relay) get the IP of the sender
+        record = reply(0)
+        del record['deviceIP']
+        self.ld.recv_replies([record, dict(reply(1), deviceIP='')], '10.0.9.9')
+        self.assertEqual(self.ld.get_topology(), (('agent/0', '10.0.9.9'), ('agent/1', '10.0.9.9')))
+
+    def test_status_per_record(self):
+        missing = reply(2)
+        del missing['cpu_cores']
+        results = self.ld.recv_replies([reply(0), {'cpu_cores': 4}, missing, dict(reply(3), mem_avail='a lot'),
+                                        'agent/4', dict(reply(5), deviceID=''), reply(6)], '')
+        self.assertEqual([deviceID for deviceID, _ in results],
+                         ['agent/0', None, 'agent/2', 'agent/3', None, '', 'agent/6'])
+        errors = [error for _, error in results]
+        self.assertEqual([error is None for error in errors], [True, False, False, False, False, False, True])
+        self.assertTrue(errors[1].startswith('ValueError'))
+        self.assertTrue(errors[2].startswith('KeyError'))
+        self.assertTrue(errors[3].startswith('ValueError'))
+        self.assertTrue(errors[4].startswith('AttributeError'))
+        # The correct records are applied
+        self.assertEqual(self.deviceIDs(), ['agent/0', 'agent/6'])
+
+    def test_single_lock_acquisition(self):
+        self.ld._db_lock = CountingLock()
+        self.ld.recv_replies([reply(i) for i in range(100)], '')
+        self.assertEqual(self.ld._db_lock.acquisitions, 1)
+        self.ld._db_lock.acquisitions = 0
+        for i in range(3):
+            self.ld.recv_reply(reply(i), '10.0.0.{}'.format(i))
+        self.assertEqual(self.ld._db_lock.acquisitions, 3)
+
+    def test_empty_batch(self):
+        version = self.ld.get_topology_version()
+        self.assertEqual(self.ld.recv_replies([], ''), [])
+        self.assertEqual(self.ld.get_topology_version(), version)
+
+
+class TestTopologySnapshot(TopologyTestCase):
+    def test_read_only(self):
+        self.ld.recv_replies([reply(0), reply(1)], '')
+        snapshot = self.ld.get_topology_snapshot()
+        self.assertIs(self.ld.get_topology(), snapshot.pairs)
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(list(snapshot), [{'deviceID': 'agent/0', 'deviceIP': '10.0.0.0'},
+                                          {'deviceID': 'agent/1', 'deviceIP': '10.0.0.1'}])
+        self.assertIs(snapshot.byID['agent/1'], snapshot.devices[1])
+        with self.assertRaises(TypeError):
+            snapshot.devices[0]['deviceIP'] = '10.0.0.9'
+        with self.assertRaises(TypeError):
+            snapshot.byID['agent/9'] = {}
+
+    def test_copy_on_write(self):
+        self.ld.recv_replies([reply(0), reply(1)], '')
+        snapshot = self.ld.get_topology_snapshot()
+        moved = reply(1)
+        moved['deviceIP'] = '10.0.1.1'
+        self.ld.recv_reply(moved, '10.0.1.1')
+        LightDiscoveryPolicies(MAX_DEVICES=2)
+        self.ld.recv_reply(reply(2), '10.0.0.2')
+        new = self.ld.get_topology_snapshot()
+        self.assertGreater(new.version, snapshot.version)
+        self.assertEqual(new.version, self.ld.get_topology_version())
+        self.assertEqual(new.pairs, (('agent/1', '10.0.1.1'), ('agent/2', '10.0.0.2')))
+        # Readers of the old snapshot are not affected
+        self.assertEqual(snapshot.pairs, (('agent/0', '10.0.0.0'), ('agent/1', '10.0.0.1')))
+        self.assertEqual(snapshot.byID['agent/1']['deviceIP'], '10.0.0.1')
+
+    def test_built_once_per_version(self):
+        self.ld.recv_replies([reply(i) for i in range(3)], '')
+        version = self.ld.get_topology_version()
+        self.ld.recv_replies([reply(i) for i in range(3, 6)], '')
+        self.assertEqual(self.ld.get_topology_version(), version + 1)     # One version per batch
+        snapshot = self.ld.get_topology_snapshot()
+        self.assertIs(self.ld.get_topology_snapshot(), snapshot)
+        self.assertEqual(len(snapshot), 6)
+
+    def test_empty(self):
+        snapshot = TopologySnapshot()
+        self.assertEqual((snapshot.version, snapshot.pairs, len(snapshot)), (0, (), 0))
+        self.assertEqual(self.ld.get_topology(), ())
+
+    def test_concurrent_readers(self):
+        stop = threading.Event()
+        errors = []
+
+        def reader():
+            version = 0
+            while not stop.is_set():
+                snapshot = self.ld.get_topology_snapshot()
+                if snapshot.version < version or not len(snapshot.pairs) == len(snapshot.devices) == len(snapshot.byID):
+                    errors.append(snapshot)
+                version = snapshot.version
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for i in range(300):
+            self.ld.recv_reply(reply(i % 50), '10.0.0.{}'.format(i % 50))
+            if i % 7 == 0:
+                LightDiscoveryPolicies(MAX_DEVICES=20 + i % 30)
+        stop.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.ld.get_topology_snapshot().pairs,
+                         tuple((device['deviceID'], device['deviceIP']) for device in self.ld.get_topology_info()))
+
+
+if __name__ == '__main__':
+    unittest.main()